@@ -68,6 +68,8 @@ fpunet_group.add_argument("--fp16-unet", action="store_true", help="Run the diff
 fpunet_group.add_argument("--fp8_e4m3fn-unet", action="store_true", help="Store unet weights in fp8_e4m3fn.")
 fpunet_group.add_argument("--fp8_e5m2-unet", action="store_true", help="Store unet weights in fp8_e5m2.")
 fpunet_group.add_argument("--fp8_e8m0fnu-unet", action="store_true", help="Store unet weights in fp8_e8m0fnu.")
+fpunet_group.add_argument("--int8-unet", action="store_true", help="Store the unet linear and conv weights in int8 with a scale per channel and dequantize them on the fly. Works on the CPU.")
+fpunet_group.add_argument("--int4-unet", action="store_true", help="Store the unet linear and conv weights in int4 with a scale per group of 128 channels and dequantize them on the fly. Works on the CPU.")
 
 fpvae_group = parser.add_mutually_exclusive_group()
 fpvae_group.add_argument("--fp16-vae", action="store_true", help="Run the VAE in fp16, might cause black images.")
@@ -100,6 +102,8 @@ class LatentPreviewMethod(enum.Enum):
 parser.add_argument("--preview-method", type=LatentPreviewMethod, default=LatentPreviewMethod.NoPreviews, help="Default preview method for sampler nodes.", action=EnumAction)
 
 parser.add_argument("--preview-size", type=int, default=512, help="Sets the maximum preview size for sampler nodes.")
+parser.add_argument("--preview-interval", type=float, default=100, help="Minimum time in ms between two sampler previews. Previews are also spaced out so decoding them takes at most 10%% of the sampling time.")
+parser.add_argument("--preview-steps", type=int, default=0, help="Decode a sampler preview every N steps instead of using --preview-interval.")
 
 cache_group = parser.add_mutually_exclusive_group()
 cache_group.add_argument("--cache-classic", action="store_true", help="Use the old style (aggressive) caching.")
@@ -112,6 +116,7 @@ attn_group.add_argument("--use-quad-cross-attention", action="store_true", help=
 attn_group.add_argument("--use-pytorch-cross-attention", action="store_true", help="Use the new pytorch 2.0 cross attention function.")
 attn_group.add_argument("--use-sage-attention", action="store_true", help="Use sage attention.")
 attn_group.add_argument("--use-flash-attention", action="store_true", help="Use FlashAttention.")
+attn_group.add_argument("--attention-autotune", action="store_true", help="Time the available attention functions the first time each attention shape is used and use the fastest one. The results are saved in the user directory.")
 
 parser.add_argument("--disable-xformers", action="store_true", help="Disable xformers.")
 
@@ -130,6 +135,9 @@ vram_group.add_argument("--cpu", action="store_true", help="To use the CPU for e
 
 parser.add_argument("--reserve-vram", type=float, default=None, help="Set the amount of vram in GB you want to reserve for use by your OS/other software. By default some amount is reserved depending on your OS.")
 
+parser.add_argument("--ram-budget", type=str, default=None, metavar="GB_OR_PERCENT", help="Set the maximum amount of system RAM in GB (or a percentage of the total RAM like 75%%) that ComfyUI should use. When it is exceeded the weights of models that have been offloaded from vram are written to disk and memory mapped, least recently used first.")
+parser.add_argument("--ram-spill-directory", type=str, default=None, help="Set the directory where the weights of offloaded models get written when the --ram-budget is exceeded. Defaults to the system temp directory.")
+
 parser.add_argument("--async-offload", action="store_true", help="Use async weight offloading.")
 
 parser.add_argument("--force-non-blocking", action="store_true", help="Force ComfyUI to use non-blocking operations for all applicable tensors. This may improve performance on some non-Nvidia systems but can cause issues with some workflows.")
@@ -149,12 +157,30 @@ parser.add_argument("--fast", nargs="*", type=PerformanceFeature, help="Enable s
 
 parser.add_argument("--mmap-torch-files", action="store_true", help="Use mmap when loading ckpt/pt files.")
 parser.add_argument("--disable-mmap", action="store_true", help="Don't use mmap when loading safetensors.")
+parser.add_argument("--conditioning-cache-size", type=int, default=256, help="Set the size in MB of the RAM cache of text encoder outputs shared by all the text encode nodes. 0 disables it.")
+parser.add_argument("--conditioning-cache-directory", type=str, default=None, help="Also save the text encoder outputs to this directory so they survive restarts. Only text encoders loaded from files without patches are saved.")
+parser.add_argument("--model-store", action="store_true", help="Save the state dicts of ckpt/pt files and of diffusion models that need their keys converted as safetensors files the first time they are loaded and memory map them on the next loads.")
+parser.add_argument("--model-store-directory", type=str, default=None, help="Set the model store directory (default: models/model_store).")
+parser.add_argument("--model-store-max-size", type=float, default=None, help="Set the maximum size of the model store in GB, the least recently used entries get removed when it is exceeded.")
+parser.add_argument("--model-store-cast-weights", action="store_true", help="Also store diffusion models that are loaded with a weight dtype in that dtype.")
+parser.add_argument("--zero-copy-load", action="store_true", help="Create the diffusion model parameters on the meta device and assign the loaded (mmap backed) weights to them directly instead of copying them. Halves peak RAM usage when models are loaded to the CPU.")
+parser.add_argument("--hook-weight-cache-size", type=float, default=0, help="Set the maximum size in GB of the hook weight sets (one per combination of hook group and keyframe strengths) cached per model, the least recently used sets get removed when it is exceeded and the cache is kept in RAM between prompts. The default 0 only keeps the weights of the current keyframes and clears them after every sampling run.")
+parser.add_argument("--precompute-hook-weights", action="store_true", help="Compute the hook weights of the whole keyframe schedule in a background thread when sampling starts, instead of when the keyframes change.")
+parser.add_argument("--torch-compile-cache-directory", type=str, default=None, help="Set the directory of the torch.compile caches (inductor, triton and the saved cache artifacts) so compiled models are reused after a restart (default: user/torch_compile_cache).")
+parser.add_argument("--micro-batch-sampling", action="store_true", help="Split latent batches that are too large for the free memory into chunks sampled one after the other, with the same noise as the unsplit batch.")
+parser.add_argument("--fuse-controlnets", action="store_true", help="Run chained controlnets that use the same controlnet model (for example a union controlnet applied with several hints) in one batched forward per step.")
+parser.add_argument("--sampler-checkpoint-steps", type=int, default=0, metavar="STEPS", help="Save a checkpoint of the sampling state every STEPS steps so a sampling run interrupted by an error, an interrupt or a restart resumes from it when the same prompt is queued again.")
+parser.add_argument("--sampler-checkpoint-minutes", type=float, default=0, metavar="MINUTES", help="Save a checkpoint of the sampling state every MINUTES minutes, see --sampler-checkpoint-steps.")
+parser.add_argument("--sampler-checkpoint-directory", type=str, default=None, help="Set the directory of the sampler checkpoints (default: user/sampler_checkpoints).")
 
 parser.add_argument("--dont-print-server", action="store_true", help="Don't print server output.")
 parser.add_argument("--quick-test-for-ci", action="store_true", help="Quick test for CI.")
 parser.add_argument("--windows-standalone-build", action="store_true", help="Windows standalone build: Enable convenient things that most people using the standalone windows build will probably enjoy (like auto opening the page on startup).")
 
+parser.add_argument("--model-folder-watch-interval", type=float, default=0, help="Refresh the index of the model folders every N seconds in a background thread, the model lists are then served from the index without checking the folders. 0 disables the watcher.")
 parser.add_argument("--disable-metadata", action="store_true", help="Disable saving prompt metadata in files.")
+parser.add_argument("--compact-images", action="store_true", help="Keep the images loaded by LoadImage as uint8 instead of float32 between nodes and in the node cache. They are converted to float32 for the nodes that use them, the save and preview nodes use the uint8 data directly.")
+parser.add_argument("--output-writer-threads", type=int, default=None, help="Number of background threads encoding and writing the images saved by SaveImage and PreviewImage. Defaults to the number of CPU cores up to 4, 0 saves the images on the worker thread.")
 parser.add_argument("--disable-all-custom-nodes", action="store_true", help="Disable loading all custom nodes.")
 parser.add_argument("--whitelist-custom-nodes", type=str, nargs='+', default=[], help="Specify custom node folders to load even when --disable-all-custom-nodes is enabled.")
 parser.add_argument("--disable-api-nodes", action="store_true", help="Disable loading all api nodes.")
@@ -0,0 +1,81 @@
+# Compact container for IMAGE outputs (--compact-images). 8-bit images from the
+# loaders are kept as uint8 (or fp16 for other sources) instead of float32, which
+# makes the cached outputs 4x (or 2x) smaller. The executor promotes them to the
+# usual float32 [B,H,W,C] tensor for the nodes that don't set ACCEPTS_COMPACT_IMAGES
+# on their own class, the save and preview nodes use the uint8 data directly.
+
+import torch
+from comfy.cli_args import args
+
+
+class CompactImage:
+    def __init__(self, data: torch.Tensor):
+        """data is a uint8 [B,H,W,C] tensor with values 0-255 or a float16 one with values 0-1."""
+        if data.dtype not in (torch.uint8, torch.float16):
+            raise ValueError("Unsupported compact image dtype {}".format(data.dtype))
+        self.data = data
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def device(self):
+        return self.data.device
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __getitem__(self, key):
+        return CompactImage(self.data[key])
+
+    def to_float(self) -> torch.Tensor:
+        """The float32 IMAGE tensor."""
+        if self.data.dtype == torch.uint8:
+            return self.data.float() / 255.0
+        return self.data.float()
+
+    def to_uint8(self) -> torch.Tensor:
+        """The uint8 [B,H,W,C] tensor the images are saved from, same values as converting the float32 tensor."""
+        if self.data.dtype == torch.uint8:
+            return self.data
+        return torch.clamp(self.data.float() * 255.0, 0, 255).to(torch.uint8)
+
+    def __repr__(self):
+        return "CompactImage(shape={}, dtype={})".format(tuple(self.data.shape), self.data.dtype)
+
+
+def enabled():
+    return args.compact_images
+
+
+def from_uint8(images: torch.Tensor):
+    """IMAGE output for uint8 images, compact if enabled."""
+    if enabled():
+        return CompactImage(images)
+    return images.float() / 255.0
+
+
+def to_float(image):
+    if isinstance(image, CompactImage):
+        return image.to_float()
+    return image
+
+
+def to_uint8(images) -> torch.Tensor:
+    """uint8 [B,H,W,C] tensor of an IMAGE, compact or not."""
+    if isinstance(images, CompactImage):
+        return images.to_uint8()
+    return torch.clamp(images * 255.0, 0, 255).to(torch.uint8)
+
+
+def accepts_compact_images(class_def) -> bool:
+    """The flag isn't inherited, the subclasses of the save and preview nodes get float32 images unless they set it too."""
+    return class_def.__dict__.get("ACCEPTS_COMPACT_IMAGES", False)
+
+
+def promote(values: list) -> list:
+    """Promotes the compact images in a list of node input values to float32 tensors."""
+    if any(isinstance(v, CompactImage) for v in values):
+        return [to_float(v) for v in values]
+    return values
@@ -0,0 +1,141 @@
+# Content addressed cache of text encoder outputs shared by every node that encodes
+# tokens with a CLIP object. Entries are keyed by the identity of the text encoder
+# weights, the patches applied to them, the clip options and the exact tokens and
+# weights, they are kept in a RAM LRU and optionally persisted to disk
+# (--conditioning-cache-directory).
+
+import os
+import hashlib
+import logging
+import collections
+import torch
+from comfy.cli_args import args
+
+cache = collections.OrderedDict()
+cache_size = 0
+stats = {"hits": 0, "disk_hits": 0, "misses": 0}
+
+def max_cache_size():
+    return max(0, args.conditioning_cache_size) * 1024 * 1024
+
+def cache_directory():
+    return args.conditioning_cache_directory
+
+def enabled():
+    return max_cache_size() > 0 or cache_directory() is not None
+
+def file_signature(paths, *extra):
+    """Identity of text encoder weights loaded from files, stable across restarts."""
+    m = hashlib.sha256()
+    for p in paths:
+        st = os.stat(p)
+        m.update("{}\n{}\n{}\n".format(os.path.abspath(p), st.st_size, st.st_mtime_ns).encode("utf-8"))
+    for e in extra:
+        m.update("{}\n".format(e).encode("utf-8"))
+    return m.hexdigest()
+
+def update_hash(m, value):
+    if isinstance(value, torch.Tensor):
+        value = value.detach().cpu().contiguous()
+        m.update("T{}{}".format(value.dtype, tuple(value.shape)).encode("utf-8"))
+        if value.numel() > 0:
+            m.update(value.reshape(-1).view(torch.uint8).numpy().tobytes())
+    elif isinstance(value, dict):
+        m.update("D{}".format(len(value)).encode("utf-8"))
+        for k in sorted(value.keys(), key=str):
+            update_hash(m, k)
+            update_hash(m, value[k])
+    elif isinstance(value, (list, tuple)):
+        m.update("L{}".format(len(value)).encode("utf-8"))
+        for v in value:
+            update_hash(m, v)
+    else:
+        m.update("{}{}".format(type(value).__name__, repr(value)).encode("utf-8"))
+
+def cache_key(weights_identity, options, tokens):
+    m = hashlib.sha256()
+    update_hash(m, weights_identity)
+    update_hash(m, options)
+    update_hash(m, tokens)
+    return m.hexdigest()
+
+def output_size(out):
+    return sum(v.nbytes for v in out.values() if isinstance(v, torch.Tensor))
+
+def disk_path(key):
+    return os.path.join(cache_directory(), "{}.pt".format(key))
+
+def load_from_disk(key, device=None):
+    path = disk_path(key)
+    if not os.path.isfile(path):
+        return None
+    try:
+        return torch.load(path, map_location=device, weights_only=True)
+    except Exception as e:
+        logging.warning("Could not load conditioning cache entry {}: {}".format(path, e))
+        return None
+
+def can_save(value):
+    if isinstance(value, (list, tuple)):
+        return all(map(can_save, value))
+    return value is None or isinstance(value, (torch.Tensor, int, float, bool, str))
+
+def save_to_disk(key, out):
+    if not all(map(can_save, out.values())):
+        return
+    path = disk_path(key)
+    temp = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        os.makedirs(cache_directory(), exist_ok=True)
+        torch.save(out, temp)
+        os.replace(temp, path)
+    except Exception as e:
+        logging.warning("Could not save conditioning cache entry {}: {}".format(path, e))
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+
+def add(key, out):
+    global cache_size
+    size = output_size(out)
+    max_size = max_cache_size()
+    if size > max_size:
+        return
+    if key in cache:
+        cache_size -= output_size(cache.pop(key))
+    cache[key] = out
+    cache_size += size
+    while cache_size > max_size:
+        _, evicted = cache.popitem(last=False)
+        cache_size -= output_size(evicted)
+
+def get(key, persistent=False, device=None):
+    """Returns a copy of the cached output dict for key or None, disk entries are loaded to device."""
+    out = cache.get(key, None)
+    if out is not None:
+        cache.move_to_end(key)
+        stats["hits"] += 1
+        return out.copy()
+
+    if persistent and cache_directory() is not None:
+        out = load_from_disk(key, device)
+        if out is not None:
+            add(key, out)
+            stats["disk_hits"] += 1
+            return out.copy()
+
+    stats["misses"] += 1
+    return None
+
+def put(key, out, persistent=False):
+    out = {k: v.detach() if isinstance(v, torch.Tensor) else v for k, v in out.items()}
+    add(key, out)
+    if persistent and cache_directory() is not None:
+        save_to_disk(key, out)
+    return out.copy()
+
+def clear():
+    global cache_size
+    cache.clear()
+    cache_size = 0
@@ -8,6 +8,7 @@ from abc import ABC, abstractmethod
 import logging
 import comfy.model_management
 import comfy.patcher_extension
+import comfy.utils
 if TYPE_CHECKING:
     from comfy.model_base import BaseModel
     from comfy.model_patcher import ModelPatcher
@@ -61,14 +62,14 @@ class IndexListContextWindow(ContextWindowABC):
             dim = self.dim
         if dim == 0 and full.shape[dim] == 1:
             return full
-        idx = [slice(None)] * dim + [self.index_list]
+        idx = tuple([slice(None)] * dim + [self.index_list])
         return full[idx].to(device)
 
     def add_window(self, full: torch.Tensor, to_add: torch.Tensor, dim=None) -> torch.Tensor:
         if dim is None:
             dim = self.dim
-        idx = [slice(None)] * dim + [self.index_list]
-        full[idx] += to_add
+        index = torch.tensor(self.index_list, device=full.device)
+        full.index_add_(dim, index, to_add.to(full.dtype))
         return full
 
 
@@ -94,7 +95,7 @@ class ContextFuseMethod:
 
 ContextResults = collections.namedtuple("ContextResults", ['window_idx', 'sub_conds_out', 'sub_conds', 'window'])
 class IndexListContextHandler(ContextHandlerABC):
-    def __init__(self, context_schedule: ContextSchedule, fuse_method: ContextFuseMethod, context_length: int=1, context_overlap: int=0, context_stride: int=1, closed_loop=False, dim=0):
+    def __init__(self, context_schedule: ContextSchedule, fuse_method: ContextFuseMethod, context_length: int=1, context_overlap: int=0, context_stride: int=1, closed_loop=False, dim=0, batch_windows=True):
         self.context_schedule = context_schedule
         self.fuse_method = fuse_method
         self.context_length = context_length
@@ -102,7 +103,10 @@ class IndexListContextHandler(ContextHandlerABC):
         self.context_stride = context_stride
         self.closed_loop = closed_loop
         self.dim = dim
+        self.batch_windows = batch_windows # run several windows in one model call when memory allows
         self._step = 0
+        self._weights_cache = {}
+        self.forwards = [] # number of calc_cond_batch calls of every step
 
         self.callbacks = {}
 
@@ -178,6 +182,8 @@ class IndexListContextHandler(ContextHandlerABC):
 
     def execute(self, calc_cond_batch: Callable, model: BaseModel, conds: list[list[dict]], x_in: torch.Tensor, timestep: torch.Tensor, model_options: dict[str]):
         self.set_step(timestep, model_options)
+        if self._step == 0:
+            self.forwards = []
         context_windows = self.get_context_windows(model, x_in, model_options)
         enumerated_context_windows = list(enumerate(context_windows))
 
@@ -191,8 +197,13 @@ class IndexListContextHandler(ContextHandlerABC):
         for callback in comfy.patcher_extension.get_all_callbacks(IndexListCallbacks.EXECUTE_START, self.callbacks):
             callback(self, model, x_in, conds, timestep, model_options)
 
-        for enum_window in enumerated_context_windows:
-            results = self.evaluate_context_windows(calc_cond_batch, model, x_in, conds, timestep, [enum_window], model_options)
+        window_groups = self.group_context_windows(model, x_in, conds, enumerated_context_windows)
+        self.forwards.append(len(window_groups))
+        for group in window_groups:
+            if len(group) == 1:
+                results = self.evaluate_context_windows(calc_cond_batch, model, x_in, conds, timestep, group, model_options)
+            else:
+                results = self.evaluate_batched_context_windows(calc_cond_batch, model, x_in, conds, timestep, group, model_options)
             for result in results:
                 self.combine_context_window_results(x_in, result.sub_conds_out, result.sub_conds, result.window, result.window_idx, len(enumerated_context_windows), timestep,
                                             conds_final, counts_final, biases_final)
@@ -212,6 +223,109 @@ class IndexListContextHandler(ContextHandlerABC):
             for callback in comfy.patcher_extension.get_all_callbacks(IndexListCallbacks.EXECUTE_CLEANUP, self.callbacks):
                 callback(self, model, x_in, conds, timestep, model_options)
 
+    def can_batch_windows(self, conds: list[list[dict]]) -> bool:
+        if not self.batch_windows or self.dim == 0:
+            # with dim 0 the windows are the batch, stacking them would merge them into one
+            return False
+        if len(comfy.patcher_extension.get_all_callbacks(IndexListCallbacks.EVALUATE_CONTEXT_WINDOWS, self.callbacks)) > 0:
+            return False
+        for cond in conds:
+            if cond is None:
+                continue
+            for c in cond:
+                # controlnet hints and gligen patches are prepared for a single window
+                if "control" in c or "gligen" in c:
+                    return False
+        return True
+
+    def group_context_windows(self, model: BaseModel, x_in: torch.Tensor, conds: list[list[dict]], enumerated_context_windows: list[tuple[int, IndexListContextWindow]]):
+        """
+        Splits the windows into the groups that are evaluated in a single model call, consecutive windows
+        of the same length are batched as long as the memory_required estimate of the batch fits.
+        """
+        if len(enumerated_context_windows) < 2 or not self.can_batch_windows(conds):
+            return [[w] for w in enumerated_context_windows]
+
+        cond_count = max(1, sum(len(c) for c in conds if c is not None))
+        free_memory = comfy.model_management.get_free_memory(x_in.device)
+
+        def fits(window_count, context_length):
+            input_shape = list(x_in.shape)
+            input_shape[self.dim] = context_length
+            input_shape[0] = input_shape[0] * window_count * cond_count
+            return model.memory_required(input_shape) * 1.5 < free_memory
+
+        max_windows = {}
+        groups = []
+        for enum_window in enumerated_context_windows:
+            length = enum_window[1].context_length
+            if length not in max_windows:
+                count = 1
+                while count < len(enumerated_context_windows) and fits(count + 1, length):
+                    count += 1
+                max_windows[length] = count
+            if len(groups) > 0 and groups[-1][-1][1].context_length == length and len(groups[-1]) < max_windows[length]:
+                groups[-1].append(enum_window)
+            else:
+                groups.append([enum_window])
+        return groups
+
+    def stack_resized_conds(self, window_conds: list[list[dict]], batch_size: int):
+        """
+        Combines the resized conds of several windows into conds for the stacked windows, the conds that
+        were subset for each window are concatenated in the order of the windows. Returns None if they can't be combined.
+        """
+        stacked = []
+        for i, cond in enumerate(window_conds[0]):
+            stacked_cond = cond.copy()
+            for key, value in cond.items():
+                others = [c[i][key] for c in window_conds[1:]]
+                if all(o is value for o in others):
+                    continue
+                if key != "model_conds":
+                    return None
+                model_conds = value.copy()
+                for cond_key, cond_value in value.items():
+                    other_values = [o[cond_key] for o in others]
+                    if all(o is cond_value for o in other_values):
+                        continue
+                    if isinstance(cond_value.cond, torch.Tensor):
+                        tensors = [comfy.utils.repeat_to_batch_size(c.cond, batch_size) for c in [cond_value] + other_values]
+                        model_conds[cond_key] = cond_value._copy_with(torch.cat(tensors))
+                    elif not isinstance(cond_value.cond, (int, float, str)) or any(o.cond != cond_value.cond for o in other_values):
+                        return None
+                stacked_cond[key] = model_conds
+            stacked.append(stacked_cond)
+        return stacked
+
+    def evaluate_batched_context_windows(self, calc_cond_batch: Callable, model: BaseModel, x_in: torch.Tensor, conds, timestep: torch.Tensor, enumerated_context_windows: list[tuple[int, IndexListContextWindow]],
+                                         model_options):
+        comfy.model_management.throw_exception_if_processing_interrupted()
+        windows = [window for _, window in enumerated_context_windows]
+        sub_conds = [[self.get_resized_cond(cond, x_in, window) for cond in conds] for window in windows]
+        batched_conds = []
+        for i in range(len(conds)):
+            if conds[i] is None:
+                batched_conds.append(None)
+                continue
+            stacked = self.stack_resized_conds([c[i] for c in sub_conds], x_in.shape[0])
+            if stacked is None:
+                return self.evaluate_context_windows(calc_cond_batch, model, x_in, conds, timestep, enumerated_context_windows, model_options)
+            batched_conds.append(stacked)
+
+        # the model call covers several windows, stacked in the batch in the order of context_windows
+        model_options["transformer_options"]["context_window"] = None
+        model_options["transformer_options"]["context_windows"] = windows
+        sub_x = torch.cat([window.get_tensor(x_in) for window in windows])
+        sub_timestep = torch.cat([window.get_tensor(timestep, dim=0) for window in windows])
+        sub_conds_out = calc_cond_batch(model, batched_conds, sub_x, sub_timestep, model_options)
+        sub_conds_out = [out.chunk(len(windows)) for out in sub_conds_out]
+
+        results: list[ContextResults] = []
+        for k, (window_idx, window) in enumerate(enumerated_context_windows):
+            results.append(ContextResults(window_idx, [out[k] for out in sub_conds_out], sub_conds[k], window))
+        return results
+
     def evaluate_context_windows(self, calc_cond_batch: Callable, model: BaseModel, x_in: torch.Tensor, conds, timestep: torch.Tensor, enumerated_context_windows: list[tuple[int, IndexListContextWindow]],
                                 model_options, device=None, first_device=None):
         results: list[ContextResults] = []
@@ -224,6 +338,7 @@ class IndexListContextHandler(ContextHandlerABC):
 
             # update exposed params
             model_options["transformer_options"]["context_window"] = window
+            model_options["transformer_options"]["context_windows"] = [window]
             # get subsections of x, timestep, conds
             sub_x = window.get_tensor(x_in, device)
             sub_timestep = window.get_tensor(timestep, device, dim=0)
@@ -250,15 +365,14 @@ class IndexListContextHandler(ContextHandlerABC):
                     prev_weight = (bias_total / (bias_total + bias))
                     new_weight = (bias / (bias_total + bias))
                     # account for dims of tensors
-                    idx_window = [slice(None)] * self.dim + [idx]
-                    pos_window = [slice(None)] * self.dim + [pos]
+                    idx_window = tuple([slice(None)] * self.dim + [idx])
+                    pos_window = tuple([slice(None)] * self.dim + [pos])
                     # apply new values
                     conds_final[i][idx_window] = conds_final[i][idx_window] * prev_weight + sub_conds_out[i][pos_window] * new_weight
                     biases_final[i][idx] = bias_total + bias
         else:
             # add conds and counts based on weights of fuse method
-            weights = get_context_weights(window.context_length, x_in.shape[self.dim], window.index_list, self, sigma=timestep)
-            weights_tensor = match_weights_to_dim(weights, x_in, self.dim, device=x_in.device)
+            weights_tensor = self.get_weights_tensor(window, x_in, timestep)
             for i in range(len(sub_conds_out)):
                 window.add_window(conds_final[i], sub_conds_out[i] * weights_tensor)
                 window.add_window(counts_final[i], weights_tensor)
@@ -266,6 +380,23 @@ class IndexListContextHandler(ContextHandlerABC):
         for callback in comfy.patcher_extension.get_all_callbacks(IndexListCallbacks.COMBINE_CONTEXT_WINDOW_RESULTS, self.callbacks):
             callback(self, x_in, sub_conds_out, sub_conds, window, window_idx, total_windows, timestep, conds_final, counts_final, biases_final)
 
+    def get_weights_tensor(self, window: IndexListContextWindow, x_in: torch.Tensor, timestep: torch.Tensor) -> torch.Tensor:
+        # the built in fuse methods don't depend on the sigma so their weights are only computed once per window
+        cacheable = self.fuse_method.func in FUSE_MAPPING.values()
+        key = (tuple(window.index_list), x_in.shape[self.dim], x_in.ndim, x_in.dtype, x_in.device)
+        if cacheable:
+            weights_tensor = self._weights_cache.get(key, None)
+            if weights_tensor is not None:
+                return weights_tensor
+
+        weights = get_context_weights(window.context_length, x_in.shape[self.dim], window.index_list, self, sigma=timestep)
+        weights_tensor = match_weights_to_dim(weights, x_in, self.dim, device=x_in.device)
+        if cacheable:
+            if len(self._weights_cache) > 256: # looped schedules shift the windows every step
+                self._weights_cache.clear()
+            self._weights_cache[key] = weights_tensor
+        return weights_tensor
+
 
 def _prepare_sampling_wrapper(executor, model, noise_shape: torch.Tensor, *args, **kwargs):
     # limit noise_shape length to context_length for more accurate vram use estimation
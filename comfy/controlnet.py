@@ -22,6 +22,8 @@ from enum import Enum
 import math
 import os
 import logging
+import weakref
+import collections
 import comfy.utils
 import comfy.model_management
 import comfy.model_detection
@@ -38,6 +40,7 @@ import comfy.ldm.hydit.controlnet
 import comfy.ldm.flux.controlnet
 import comfy.ldm.qwen_image.controlnet
 import comfy.cldm.dit_embedder
+from comfy.cli_args import args
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from comfy.hooks import HookGroup
@@ -60,6 +63,67 @@ def broadcast_image_to(tensor, target_batch_size, batched_number):
     else:
         return torch.cat([tensor] * batched_number, dim=0)
 
+# Processed controlnet hints (upscaled, VAE encoded, with the extra concat) kept across prompts so re-running
+# a workflow with the same hint images doesn't encode them again. Keyed by the identity of the hint image, VAE,
+# latent format and preprocess function and by the target size and dtype.
+HINT_CACHE_SIZE = 16
+hint_cache = collections.OrderedDict()
+
+def hint_cache_key(objects, params):
+    return tuple(id(o) for o in objects) + tuple(params)
+
+def get_cached_hint(objects, params):
+    key = hint_cache_key(objects, params)
+    entry = hint_cache.get(key, None)
+    if entry is None:
+        return None
+    refs, hint = entry
+    if any(r() is not o for r, o in zip(refs, objects)):
+        hint_cache.pop(key)
+        return None
+    hint_cache.move_to_end(key)
+    return hint
+
+def set_cached_hint(objects, params, hint):
+    try:
+        refs = [weakref.ref(o) for o in objects]
+    except TypeError:
+        return
+    hint_cache[hint_cache_key(objects, params)] = (refs, hint.to(comfy.model_management.unet_offload_device()))
+    while len(hint_cache) > HINT_CACHE_SIZE:
+        hint_cache.popitem(last=False)
+
+def chunk_control(control, chunks):
+    """Splits the output of a batched controlnet forward into one output per batch chunk, shared tensors stay shared."""
+    out = [{} for _ in range(chunks)]
+    split = {}
+    for key, values in control.items():
+        for o in out:
+            o[key] = []
+        for x in values:
+            if x is None:
+                parts = [None] * chunks
+            else:
+                parts = split.get(id(x), None)
+                if parts is None:
+                    size = x.shape[0] // chunks
+                    parts = [x.narrow(0, i * size, size) for i in range(chunks)]
+                    split[id(x)] = parts
+            for o, part in zip(out, parts):
+                o[key].append(part)
+    return out
+
+def same_extra_args(a, b):
+    if a.keys() != b.keys():
+        return False
+    for k in a:
+        if torch.is_tensor(a[k]) or torch.is_tensor(b[k]):
+            if a[k] is not b[k]:
+                return False
+        elif a[k] != b[k]:
+            return False
+    return True
+
 class StrengthType(Enum):
     CONSTANT = 1
     LINEAR_UP = 2
@@ -214,23 +278,102 @@ class ControlNet(ControlBase):
         self.strength_type = strength_type
         self.concat_mask = concat_mask
         self.preprocess_image = preprocess_image
+        # set when the batched forward of the fused controlnets ran out of memory, they then run one forward each
+        self.fused_batch_oom = False
+
+    def is_active(self, t):
+        return self.timestep_range is None or not (t[0] > self.timestep_range[0] or t[0] < self.timestep_range[1])
+
+    def control_dtype(self):
+        if self.manual_cast_dtype is not None:
+            return self.manual_cast_dtype
+        return self.control_model.dtype
+
+    def fused_group(self):
+        """The chained controlnets from this one that use the same control model and extra args, they can run in one batched forward."""
+        group = [self]
+        previous = self.previous_controlnet
+        while type(previous) is type(self) and previous.control_model is self.control_model and previous.manual_cast_dtype == self.manual_cast_dtype and same_extra_args(previous.extra_args, self.extra_args):
+            group.append(previous)
+            previous = previous.previous_controlnet
+        return group, previous
 
     def get_control(self, x_noisy, t, cond, batched_number, transformer_options):
+        if args.fuse_controlnets and self.previous_controlnet is not None:
+            group, previous = self.fused_group()
+            if len(group) > 1:
+                return self.get_fused_control(group, previous, x_noisy, t, cond, batched_number, transformer_options)
+
         control_prev = None
         if self.previous_controlnet is not None:
             control_prev = self.previous_controlnet.get_control(x_noisy, t, cond, batched_number, transformer_options)
 
-        if self.timestep_range is not None:
-            if t[0] > self.timestep_range[0] or t[0] < self.timestep_range[1]:
-                if control_prev is not None:
-                    return control_prev
-                else:
-                    return None
+        if not self.is_active(t):
+            if control_prev is not None:
+                return control_prev
+            else:
+                return None
 
-        dtype = self.control_model.dtype
-        if self.manual_cast_dtype is not None:
-            dtype = self.manual_cast_dtype
+        dtype = self.control_dtype()
+        self.prepare_cond_hint(x_noisy, dtype, batched_number)
+        x_noisy, timestep, context, extra = self.control_model_inputs(x_noisy, t, cond, dtype)
+
+        control = self.control_model(x=x_noisy, hint=self.cond_hint, timesteps=timestep, context=context, **extra)
+        return self.control_merge(control, control_prev, output_dtype=None)
+
+    def get_fused_control(self, group, previous, x_noisy, t, cond, batched_number, transformer_options):
+        control_prev = None
+        if previous is not None:
+            control_prev = previous.get_control(x_noisy, t, cond, batched_number, transformer_options)
+
+        active = [c for c in group if c.is_active(t)]
+        if len(active) == 0:
+            return control_prev
+
+        dtype = self.control_dtype()
+        hints = []
+        for c in active:
+            c.prepare_cond_hint(x_noisy, dtype, batched_number)
+            hints.append(comfy.utils.repeat_to_batch_size(c.cond_hint, x_noisy.shape[0]))
+        x_noisy, timestep, context, extra = self.control_model_inputs(x_noisy, t, cond, dtype)
+
+        n = len(active)
+        controls = None
+        if not self.fused_batch_oom and all(h.shape == hints[0].shape for h in hints):
+            # the n times larger batch isn't part of the memory estimate of the controlnets
+            batch_size = x_noisy.shape[0]
+            batched = {k: torch.cat([v] * n) if torch.is_tensor(v) and v.ndim > 0 and v.shape[0] == batch_size else v for k, v in extra.items()}
+            try:
+                control = self.control_model(x=torch.cat([x_noisy] * n), hint=torch.cat(hints), timesteps=torch.cat([timestep] * n), context=torch.cat([context] * n), **batched)
+                controls = chunk_control(control, n)
+            except comfy.model_management.OOM_EXCEPTION:
+                logging.warning("Ran out of memory when running {} controlnets in one batch, running them one at a time.".format(n))
+                self.fused_batch_oom = True
+            del batched
+            if controls is None:
+                comfy.model_management.soft_empty_cache()
+        if controls is None:
+            controls = [self.control_model(x=x_noisy, hint=h, timesteps=timestep, context=context, **extra) for h in hints]
+
+        # merge in the same order as the unfused chain, the deepest controlnet first
+        out = control_prev
+        for c, control_c in reversed(list(zip(active, controls))):
+            out = c.control_merge(control_c, out, output_dtype=None)
+        return out
 
+    def control_model_inputs(self, x_noisy, t, cond, dtype):
+        context = cond.get('crossattn_controlnet', cond['c_crossattn'])
+        extra = self.extra_args.copy()
+        for c in self.extra_conds:
+            temp = cond.get(c, None)
+            if temp is not None:
+                extra[c] = comfy.model_base.convert_tensor(temp, dtype, x_noisy.device)
+
+        timestep = self.model_sampling_current.timestep(t)
+        x_noisy = self.model_sampling_current.calculate_input(t, x_noisy)
+        return x_noisy.to(dtype), timestep.to(dtype), comfy.model_management.cast_to_device(context, x_noisy.device, dtype), extra
+
+    def prepare_cond_hint(self, x_noisy, dtype, batched_number):
         if self.cond_hint is None or x_noisy.shape[2] * self.compression_ratio != self.cond_hint.shape[2] or x_noisy.shape[3] * self.compression_ratio != self.cond_hint.shape[3]:
             if self.cond_hint is not None:
                 del self.cond_hint
@@ -241,41 +384,38 @@ class ControlNet(ControlBase):
             else:
                 if self.latent_format is not None:
                     raise ValueError("This Controlnet needs a VAE but none was provided, please use a ControlNetApply node with a VAE input and connect it.")
-            self.cond_hint = comfy.utils.common_upscale(self.cond_hint_original, x_noisy.shape[-1] * compression_ratio, x_noisy.shape[-2] * compression_ratio, self.upscale_algorithm, "center")
-            self.cond_hint = self.preprocess_image(self.cond_hint)
-            if self.vae is not None:
-                loaded_models = comfy.model_management.loaded_models(only_currently_used=True)
-                self.cond_hint = self.vae.encode(self.cond_hint.movedim(1, -1))
-                comfy.model_management.load_models_gpu(loaded_models)
-            if self.latent_format is not None:
-                self.cond_hint = self.latent_format.process_in(self.cond_hint)
-            if len(self.extra_concat_orig) > 0:
-                to_concat = []
-                for c in self.extra_concat_orig:
-                    c = c.to(self.cond_hint.device)
-                    c = comfy.utils.common_upscale(c, self.cond_hint.shape[-1], self.cond_hint.shape[-2], self.upscale_algorithm, "center")
-                    if c.ndim < self.cond_hint.ndim:
-                        c = c.unsqueeze(2)
-                        c = comfy.utils.repeat_to_batch_size(c, self.cond_hint.shape[2], dim=2)
-                    to_concat.append(comfy.utils.repeat_to_batch_size(c, self.cond_hint.shape[0]))
-                self.cond_hint = torch.cat([self.cond_hint] + to_concat, dim=1)
-
-            self.cond_hint = self.cond_hint.to(device=x_noisy.device, dtype=dtype)
+            cache_objects = [self.cond_hint_original, self.preprocess_image] + [o for o in (self.vae, self.latent_format) if o is not None] + self.extra_concat_orig
+            cache_params = (x_noisy.shape[-1] * compression_ratio, x_noisy.shape[-2] * compression_ratio, self.upscale_algorithm, dtype)
+            cached = get_cached_hint(cache_objects, cache_params)
+            if cached is not None:
+                self.cond_hint = cached.to(device=x_noisy.device, dtype=dtype)
+            else:
+                self.cond_hint = self.process_cond_hint(x_noisy, dtype, compression_ratio)
+                set_cached_hint(cache_objects, cache_params, self.cond_hint)
         if x_noisy.shape[0] != self.cond_hint.shape[0]:
             self.cond_hint = broadcast_image_to(self.cond_hint, x_noisy.shape[0], batched_number)
 
-        context = cond.get('crossattn_controlnet', cond['c_crossattn'])
-        extra = self.extra_args.copy()
-        for c in self.extra_conds:
-            temp = cond.get(c, None)
-            if temp is not None:
-                extra[c] = comfy.model_base.convert_tensor(temp, dtype, x_noisy.device)
-
-        timestep = self.model_sampling_current.timestep(t)
-        x_noisy = self.model_sampling_current.calculate_input(t, x_noisy)
-
-        control = self.control_model(x=x_noisy.to(dtype), hint=self.cond_hint, timesteps=timestep.to(dtype), context=comfy.model_management.cast_to_device(context, x_noisy.device, dtype), **extra)
-        return self.control_merge(control, control_prev, output_dtype=None)
+    def process_cond_hint(self, x_noisy, dtype, compression_ratio):
+        hint = comfy.utils.common_upscale(self.cond_hint_original, x_noisy.shape[-1] * compression_ratio, x_noisy.shape[-2] * compression_ratio, self.upscale_algorithm, "center")
+        hint = self.preprocess_image(hint)
+        if self.vae is not None:
+            loaded_models = comfy.model_management.loaded_models(only_currently_used=True)
+            hint = self.vae.encode(hint.movedim(1, -1))
+            comfy.model_management.load_models_gpu(loaded_models)
+        if self.latent_format is not None:
+            hint = self.latent_format.process_in(hint)
+        if len(self.extra_concat_orig) > 0:
+            to_concat = []
+            for c in self.extra_concat_orig:
+                c = c.to(hint.device)
+                c = comfy.utils.common_upscale(c, hint.shape[-1], hint.shape[-2], self.upscale_algorithm, "center")
+                if c.ndim < hint.ndim:
+                    c = c.unsqueeze(2)
+                    c = comfy.utils.repeat_to_batch_size(c, hint.shape[2], dim=2)
+                to_concat.append(comfy.utils.repeat_to_batch_size(c, hint.shape[0]))
+            hint = torch.cat([hint] + to_concat, dim=1)
+
+        return hint.to(device=x_noisy.device, dtype=dtype)
 
     def copy(self):
         c = ControlNet(None, global_average_pooling=self.global_average_pooling, load_device=self.load_device, manual_cast_dtype=self.manual_cast_dtype)
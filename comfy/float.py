@@ -65,3 +65,40 @@ def stochastic_rounding(value, dtype, seed=0):
         return output
 
     return value.to(dtype=dtype)
+
+def quantize_int8(value, scale=None):
+    """Per output channel symmetric int8 quantization, returns the int8 weight and a scale per channel."""
+    w = value.float().reshape(value.shape[0], -1)
+    if scale is None:
+        scale = torch.clamp(w.abs().amax(dim=1) / 127.0, min=1e-12)
+    q = torch.clamp(torch.round(w / scale.to(w.device, torch.float32).unsqueeze(1)), -127, 127).to(torch.int8)
+    return q.reshape(value.shape), scale
+
+def dequantize_int8(q, scale, dtype):
+    return q.to(dtype) * scale.to(dtype).reshape([-1] + [1] * (q.ndim - 1))
+
+def quantize_int4(value, group_size, scale=None):
+    """Group wise symmetric int4 quantization, two values are packed in every uint8.
+
+    Returns the packed weight of shape (out_channels, groups * group_size // 2) and the
+    scales of shape (out_channels, groups). The input channels are zero padded to a
+    multiple of group_size.
+    """
+    w = value.float().reshape(value.shape[0], -1)
+    pad = -w.shape[1] % group_size
+    if pad > 0:
+        w = torch.nn.functional.pad(w, (0, pad))
+    w = w.reshape(w.shape[0], -1, group_size)
+    if scale is None:
+        scale = torch.clamp(w.abs().amax(dim=2) / 7.0, min=1e-12)
+    q = (torch.clamp(torch.round(w / scale.to(w.device, torch.float32).unsqueeze(2)), -8, 7) + 8).to(torch.uint8)
+    q = q[:, :, 0::2] | (q[:, :, 1::2] << 4)
+    return q.reshape(q.shape[0], -1), scale
+
+def dequantize_int4(q, scale, dtype, shape):
+    out = torch.stack((q & 0xF, q >> 4), dim=-1).reshape(q.shape[0], scale.shape[1], -1).to(dtype)
+    out = (out - 8) * scale.to(dtype).unsqueeze(2)
+    numel = 1
+    for s in shape[1:]:
+        numel *= s
+    return out.reshape(q.shape[0], -1)[:, :numel].reshape(shape)
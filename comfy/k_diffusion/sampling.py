@@ -1,4 +1,5 @@
 import math
+import contextlib
 from functools import partial
 
 from scipy import integrate
@@ -72,6 +73,27 @@ def get_ancestral_step(sigma_from, sigma_to, eta=1.):
     return sigma_down, sigma_up
 
 
+# (batch size, start, end) when a chunk of a latent batch is sampled, see batch_slice()
+noise_batch_slice = None
+
+@contextlib.contextmanager
+def batch_slice(batch_size, start, end):
+    """Sample the latents start:end of a batch: the noise samplers generate the noise of the whole batch
+    and return the rows of the chunk so the samples match the ones of the unsplit batch."""
+    global noise_batch_slice
+    prev = noise_batch_slice
+    noise_batch_slice = (batch_size, start, end)
+    try:
+        yield
+    finally:
+        noise_batch_slice = prev
+
+def get_batch_slice(x):
+    if noise_batch_slice is not None and x.shape[0] == noise_batch_slice[2] - noise_batch_slice[1]:
+        return noise_batch_slice
+    return None
+
+
 def default_noise_sampler(x, seed=None):
     if seed is not None:
         generator = torch.Generator(device=x.device)
@@ -79,6 +101,10 @@ def default_noise_sampler(x, seed=None):
     else:
         generator = None
 
+    batch_slice = get_batch_slice(x)
+    if batch_slice is not None:
+        size = [batch_slice[0]] + list(x.shape[1:])
+        return lambda sigma, sigma_next: torch.randn(size, dtype=x.dtype, layout=x.layout, device=x.device, generator=generator)[batch_slice[1]:batch_slice[2]]
     return lambda sigma, sigma_next: torch.randn(x.size(), dtype=x.dtype, layout=x.layout, device=x.device, generator=generator)
 
 
@@ -136,11 +162,23 @@ class BrownianTreeNoiseSampler:
     def __init__(self, x, sigma_min, sigma_max, seed=None, transform=lambda x: x, cpu=False):
         self.transform = transform
         t0, t1 = self.transform(torch.as_tensor(sigma_min)), self.transform(torch.as_tensor(sigma_max))
+        self.batch_slice = None
+        batch_slice = get_batch_slice(x)
+        if batch_slice is not None:
+            if isinstance(seed, list):
+                if len(seed) == batch_slice[0]:
+                    seed = seed[batch_slice[1]:batch_slice[2]]
+            else:
+                x = x.new_zeros([batch_slice[0]] + list(x.shape[1:]))
+                self.batch_slice = slice(batch_slice[1], batch_slice[2])
         self.tree = BatchedBrownianTree(x, t0, t1, seed, cpu=cpu)
 
     def __call__(self, sigma, sigma_next):
         t0, t1 = self.transform(torch.as_tensor(sigma)), self.transform(torch.as_tensor(sigma_next))
-        return self.tree(t0, t1) / (t1 - t0).abs().sqrt()
+        out = self.tree(t0, t1) / (t1 - t0).abs().sqrt()
+        if self.batch_slice is not None:
+            out = out[self.batch_slice]
+        return out
 
 
 def sigma_to_half_log_snr(sigma, model_sampling):
@@ -785,17 +785,28 @@ class HiDreamImageTransformer2DModel(nn.Module):
         block_id = 0
         initial_encoder_hidden_states = torch.cat([encoder_hidden_states[-1], encoder_hidden_states[-2]], dim=1)
         initial_encoder_hidden_states_seq_len = initial_encoder_hidden_states.shape[1]
+        patches_replace = transformer_options.get("patches_replace", {})
+        blocks_replace = patches_replace.get("dit", {})
         for bid, block in enumerate(self.double_stream_blocks):
             cur_llama31_encoder_hidden_states = encoder_hidden_states[block_id]
             cur_encoder_hidden_states = torch.cat([initial_encoder_hidden_states, cur_llama31_encoder_hidden_states], dim=1)
-            hidden_states, initial_encoder_hidden_states = block(
-                image_tokens = hidden_states,
-                image_tokens_masks = image_tokens_masks,
-                text_tokens = cur_encoder_hidden_states,
-                adaln_input = adaln_input,
-                rope = rope,
-                transformer_options=transformer_options,
-            )
+            if ("double_block", bid) in blocks_replace:
+                def block_wrap(args):
+                    out = {}
+                    out["img"], out["txt"] = block(image_tokens=args["img"], image_tokens_masks=image_tokens_masks, text_tokens=args["txt"], adaln_input=args["vec"], rope=args["pe"], transformer_options=args["transformer_options"])
+                    return out
+                out = blocks_replace[("double_block", bid)]({"img": hidden_states, "txt": cur_encoder_hidden_states, "vec": adaln_input, "pe": rope, "transformer_options": transformer_options}, {"original_block": block_wrap})
+                hidden_states = out["img"]
+                initial_encoder_hidden_states = out["txt"]
+            else:
+                hidden_states, initial_encoder_hidden_states = block(
+                    image_tokens = hidden_states,
+                    image_tokens_masks = image_tokens_masks,
+                    text_tokens = cur_encoder_hidden_states,
+                    adaln_input = adaln_input,
+                    rope = rope,
+                    transformer_options=transformer_options,
+                )
             initial_encoder_hidden_states = initial_encoder_hidden_states[:, :initial_encoder_hidden_states_seq_len]
             block_id += 1
 
@@ -812,14 +823,22 @@ class HiDreamImageTransformer2DModel(nn.Module):
         for bid, block in enumerate(self.single_stream_blocks):
             cur_llama31_encoder_hidden_states = encoder_hidden_states[block_id]
             hidden_states = torch.cat([hidden_states, cur_llama31_encoder_hidden_states], dim=1)
-            hidden_states = block(
-                image_tokens=hidden_states,
-                image_tokens_masks=image_tokens_masks,
-                text_tokens=None,
-                adaln_input=adaln_input,
-                rope=rope,
-                transformer_options=transformer_options,
-            )
+            if ("single_block", bid) in blocks_replace:
+                def block_wrap(args):
+                    out = {}
+                    out["img"] = block(image_tokens=args["img"], image_tokens_masks=image_tokens_masks, text_tokens=None, adaln_input=args["vec"], rope=args["pe"], transformer_options=args["transformer_options"])
+                    return out
+                out = blocks_replace[("single_block", bid)]({"img": hidden_states, "vec": adaln_input, "pe": rope, "transformer_options": transformer_options}, {"original_block": block_wrap})
+                hidden_states = out["img"]
+            else:
+                hidden_states = block(
+                    image_tokens=hidden_states,
+                    image_tokens_masks=image_tokens_masks,
+                    text_tokens=None,
+                    adaln_input=adaln_input,
+                    rope=rope,
+                    transformer_options=transformer_options,
+                )
             hidden_states = hidden_states[:, :hidden_states_seq_len]
             block_id += 1
 
@@ -1,5 +1,9 @@
 import math
 import sys
+import json
+import os
+import threading
+import time
 
 import torch
 import torch.nn.functional as F
@@ -656,6 +660,137 @@ register_attention_function("sub_quad", attention_sub_quad)
 register_attention_function("split", attention_split)
 
 
+# attention autotuning (--attention-autotune): the registered attention functions are timed on the first call
+# with a new combination of device, dtype, batch size, heads, head dim, sequence length buckets and mask, the
+# fastest one is then used for all the calls with that combination. The results are saved in the user directory.
+# When the chosen function fails on other inputs of the same bucket the combination is tuned again.
+AUTOTUNE_CPU_FUNCTIONS = ["basic", "split", "sub_quad", "pytorch"]
+# only the exact functions are picked automatically, sage attention is approximate and only a candidate when it was enabled
+AUTOTUNE_GPU_FUNCTIONS = ["pytorch", "xformers", "flash", "split", "sub_quad"]
+if args.use_sage_attention:
+    AUTOTUNE_GPU_FUNCTIONS.append("sage")
+AUTOTUNE_REPEAT = 3
+
+autotune_table = None
+autotune_lock = threading.Lock()
+
+def autotune_file():
+    import folder_paths
+    return os.path.join(folder_paths.get_user_directory(), "attention_autotune.json")
+
+def get_autotune_table():
+    global autotune_table
+    with autotune_lock:
+        if autotune_table is None:
+            autotune_table = {}
+            try:
+                with open(autotune_file(), "r") as f:
+                    autotune_table = json.load(f)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logging.warning("Could not load the attention autotune results: {}".format(e))
+        return autotune_table
+
+def save_autotune_table():
+    try:
+        path = autotune_file()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with autotune_lock:
+            data = json.dumps(autotune_table, indent=1, sort_keys=True)
+        # written to a temporary file first so an interrupted save or another process never leaves a truncated file
+        temp = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            with open(temp, "w") as f:
+                f.write(data)
+            os.replace(temp, path)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+    except Exception as e:
+        logging.warning("Could not save the attention autotune results: {}".format(e))
+
+def autotune_candidates(device):
+    names = AUTOTUNE_CPU_FUNCTIONS if device.type == "cpu" else AUTOTUNE_GPU_FUNCTIONS
+    functions = dict(REGISTERED_ATTENTION_FUNCTIONS, basic=attention_basic)
+    return {name: functions[name] for name in names if name in functions}
+
+@functools.lru_cache(maxsize=None)
+def autotune_device_name(device):
+    return torch.cuda.get_device_name(device) if device.type == "cuda" else device.type
+
+def autotune_key(q, k, heads, mask, skip_reshape):
+    if skip_reshape:
+        q_len, k_len, dim_head = q.shape[-2], k.shape[-2], q.shape[-1]
+    else:
+        q_len, k_len, dim_head = q.shape[1], k.shape[1], q.shape[-1] // heads
+
+    def bucket(n):
+        return 1 << max(0, (n - 1).bit_length())
+
+    return "{}|{}|{}|{}|{}|{}|{}|{}".format(autotune_device_name(q.device), str(q.dtype).replace("torch.", ""), q.shape[0], heads, dim_head, bucket(q_len), bucket(k_len), "mask" if mask is not None else "nomask")
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    elif device.type == "xpu":
+        torch.xpu.synchronize(device)
+    elif device.type == "mps":
+        torch.mps.synchronize()
+
+def autotune_attention(key, q, k, v, heads, **kwargs):
+    """Times the candidate attention functions on these inputs, stores the fastest for the key and returns its output."""
+    best_name = None
+    best_time = None
+    best_out = None
+    for name, func in autotune_candidates(q.device).items():
+        try:
+            out = func(q, k, v, heads, **kwargs)
+            synchronize(q.device)
+            start = time.perf_counter()
+            for _ in range(AUTOTUNE_REPEAT):
+                out = func(q, k, v, heads, **kwargs)
+            synchronize(q.device)
+            elapsed = (time.perf_counter() - start) / AUTOTUNE_REPEAT
+        except Exception as e:
+            logging.debug("Attention function {} failed for {}: {}".format(name, key, e))
+            model_management.soft_empty_cache()
+            continue
+        if best_time is None or elapsed < best_time:
+            best_name, best_time, best_out = name, elapsed, out
+        del out
+
+    if best_name is None:
+        raise RuntimeError("No attention function works for {}".format(key))
+    logging.info("Attention autotune: using {} for {} ({:.3f} ms)".format(best_name, key, best_time * 1000))
+    get_autotune_table()
+    with autotune_lock:
+        autotune_table[key] = best_name
+    save_autotune_table()
+    return best_out
+
+@wrap_attn
+def attention_autotune(q, k, v, heads, mask=None, attn_precision=None, skip_reshape=False, skip_output_reshape=False, **kwargs):
+    key = autotune_key(q, k, heads, mask, skip_reshape)
+    func = None
+    name = get_autotune_table().get(key, None)
+    if name is not None:
+        func = autotune_candidates(q.device).get(name, None)
+    if func is not None:
+        try:
+            return func(q, k, v, heads, mask=mask, attn_precision=attn_precision, skip_reshape=skip_reshape, skip_output_reshape=skip_output_reshape, **kwargs)
+        except Exception as e:
+            # the sequence lengths are bucketed, the function picked for other lengths of the bucket can fail on these
+            logging.warning("Attention function {} failed for {}, tuning again: {}".format(name, key, e))
+            model_management.soft_empty_cache()
+    return autotune_attention(key, q, k, v, heads, mask=mask, attn_precision=attn_precision, skip_reshape=skip_reshape, skip_output_reshape=skip_output_reshape, **kwargs)
+
+if args.attention_autotune:
+    logging.info("Using attention autotuning")
+    optimized_attention = attention_autotune
+    optimized_attention_masked = attention_autotune
+
+
 def optimized_attention_for_device(device, mask=False, small_input=False):
     if small_input:
         if model_management.pytorch_attention_enabled():
@@ -664,6 +799,8 @@ def optimized_attention_for_device(device, mask=False, small_input=False):
             return attention_basic
 
     if device == torch.device("cpu"):
+        if args.attention_autotune:
+            return attention_autotune
         return attention_sub_quad
 
     if mask:
@@ -18,6 +18,7 @@
 
 import comfy.ldm.hunyuan3dv2_1
 import comfy.ldm.hunyuan3dv2_1.hunyuandit
+import os
 import torch
 import logging
 from comfy.ldm.modules.diffusionmodules.openaimodel import UNetModel, Timestep
@@ -130,11 +131,15 @@ class BaseModel(torch.nn.Module):
         self.manual_cast_dtype = model_config.manual_cast_dtype
         self.device = device
         self.current_patcher: 'ModelPatcher' = None
+        self.weights_file = None
+        self.weights_file_stat = None
+        self.weights_prefix = None
 
         if not unet_config.get("disable_unet_model_creation", False):
             if model_config.custom_operations is None:
                 fp8 = model_config.optimizations.get("fp8", False)
-                operations = comfy.ops.pick_operations(unet_config.get("dtype", None), self.manual_cast_dtype, fp8_optimizations=fp8, scaled_fp8=model_config.scaled_fp8)
+                weight_quantization = model_config.optimizations.get("weight_quantization", None)
+                operations = comfy.ops.pick_operations(unet_config.get("dtype", None), self.manual_cast_dtype, fp8_optimizations=fp8, scaled_fp8=model_config.scaled_fp8, weight_quantization=weight_quantization)
             else:
                 operations = model_config.custom_operations
             self.diffusion_model = unet_model(**unet_config, device=device, operations=operations)
@@ -297,7 +302,13 @@ class BaseModel(torch.nn.Module):
                 to_load[k[len(unet_prefix):]] = sd.pop(k)
 
         to_load = self.model_config.process_unet_state_dict(to_load)
-        m, u = self.diffusion_model.load_state_dict(to_load, strict=False)
+        if utils.has_meta_parameters(self):
+            m, u = utils.assign_state_dict(self.diffusion_model, to_load)
+            utils.materialize_meta_parameters(self)
+            if comfy.model_management.force_channels_last():
+                self.diffusion_model.to(memory_format=torch.channels_last)
+        else:
+            m, u = self.diffusion_model.load_state_dict(to_load, strict=False)
         if len(m) > 0:
             logging.warning("unet missing: {}".format(m))
 
@@ -306,6 +317,57 @@ class BaseModel(torch.nn.Module):
         del to_load
         return self
 
+    @staticmethod
+    def file_stat(path):
+        st = os.stat(path)
+        return (st.st_size, st.st_mtime_ns)
+
+    def set_weights_file(self, path):
+        """Records the file the weights were loaded from, with its size and modification time."""
+        try:
+            self.weights_file_stat = self.file_stat(path)
+            self.weights_file = path
+        except OSError:
+            self.weights_file = None
+            self.weights_file_stat = None
+
+    def load_weights_from_file(self):
+        """Replaces the diffusion model weights with memory mapped tensors from weights_file.
+
+        Only done if the file is unchanged since the model was loaded and contains exactly
+        the weights the model currently has, returns False otherwise.
+        """
+        if self.weights_file is None or self.weights_prefix is None:
+            return False
+
+        sd = None
+        try:
+            if self.file_stat(self.weights_file) == self.weights_file_stat:
+                sd = utils.load_torch_file(self.weights_file)
+            else:
+                logging.info("The weights file {} changed since the model was loaded, not reloading the weights from it.".format(self.weights_file))
+        except Exception as e:
+            logging.warning("Could not reload the weights from {}: {}".format(self.weights_file, e))
+        if sd is None:
+            # deleted or replaced since the model was loaded, don't try it again
+            self.weights_file = None
+            return False
+
+        to_load = {}
+        for k in sd:
+            if k.startswith(self.weights_prefix):
+                to_load[k[len(self.weights_prefix):]] = sd[k]
+        to_load = self.model_config.process_unet_state_dict(to_load)
+
+        current = self.diffusion_model.state_dict()
+        for k in current:
+            w = to_load.get(k, None)
+            if w is None or w.shape != current[k].shape or w.dtype != current[k].dtype:
+                return False
+
+        utils.assign_state_dict(self.diffusion_model, to_load)
+        return True
+
     def process_latent_in(self, latent):
         return self.latent_format.process_in(latent)
 
@@ -21,11 +21,15 @@ import logging
 from enum import Enum
 from comfy.cli_args import args, PerformanceFeature
 import torch
+import comfy.utils
 import sys
 import importlib
 import platform
 import weakref
 import gc
+import os
+import uuid
+import tempfile
 
 class VRAMState(Enum):
     DISABLED = 0    #No vram present: no need to move models to vram
@@ -517,6 +521,7 @@ class LoadedModel:
         self.model_finalizer.detach()
         self.model_finalizer = None
         self.real_model = None
+        model_offloaded(self.model)
         return True
 
     def model_use_more_vram(self, extra_memory, force_patch_weights=False):
@@ -533,6 +538,114 @@ class LoadedModel:
         return self.real_model() is not None and self.model is None
 
 
+offloaded_models = []
+ram_evictions = {"dropped": 0, "spilled": 0}
+
+def model_offloaded(model):
+    model_reloaded(model)
+    offloaded_models.insert(0, weakref.ref(model))
+
+def model_reloaded(model):
+    for i in range(len(offloaded_models) - 1, -1, -1):
+        m = offloaded_models[i]()
+        if m is None or m.is_clone(model):
+            offloaded_models.pop(i)
+
+def _remove_spill_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def spill_model_weights(model):
+    """Writes the weights of a model that lives in system ram to a scratch safetensors
+    file and replaces them with memory mapped tensors so the OS can page them out.
+    Each storage is written once, tied and shared parameters are views of the same
+    mapped storage again after the spill."""
+    real_model = model.model
+    os.makedirs(RAM_SPILL_DIRECTORY, exist_ok=True)
+    path = os.path.join(RAM_SPILL_DIRECTORY, "{}.safetensors".format(uuid.uuid4()))
+
+    params = {}
+    for k, p in real_model.named_parameters(remove_duplicate=False):
+        params.setdefault(id(p), (p, []))[1].append(k)
+
+    sd = {}
+    storage_keys = {}
+    layouts = []
+    for p, names in params.values():
+        storage = p.untyped_storage()
+        key = storage_keys.get(storage.data_ptr(), None)
+        if key is None:
+            key = storage_keys[storage.data_ptr()] = str(len(storage_keys))
+            sd[key] = torch.empty(0, dtype=torch.uint8, device=p.device).set_(storage)
+        layouts.append((p, names, key))
+    try:
+        comfy.utils.save_torch_file(sd, path)
+    except Exception:
+        _remove_spill_file(path)
+        raise
+    del sd
+
+    spilled = comfy.utils.load_torch_file(path)
+    for p, names, key in layouts:
+        data = spilled[key].view(p.dtype).as_strided(p.size(), p.stride(), p.storage_offset())
+        param = torch.nn.Parameter(data, requires_grad=p.requires_grad)
+        for name in names:
+            module_name, _, param_name = name.rpartition(".")
+            real_model.get_submodule(module_name)._parameters[param_name] = param
+    del spilled
+    weakref.finalize(real_model, _remove_spill_file, path)
+    if not WINDOWS:
+        _remove_spill_file(path)
+
+def evict_model_weights(model):
+    if model.loaded_size() > 0 or not is_device_cpu(model.current_loaded_device()):
+        return False
+
+    real_model = model.model
+    unpatched = real_model.current_weight_patches_uuid is None and len(model.hook_backup) == 0
+    if unpatched and getattr(real_model, "weights_file", None) is not None:
+        if real_model.load_weights_from_file():
+            logging.debug("Dropped {} back to its weights file.".format(real_model.__class__.__name__))
+            ram_evictions["dropped"] += 1
+            return True
+
+    spill_model_weights(model)
+    logging.debug("Spilled {} to disk.".format(real_model.__class__.__name__))
+    ram_evictions["spilled"] += 1
+    return True
+
+def free_ram(memory_required=0):
+    if RAM_BUDGET is None:
+        return 0
+
+    evicted = 0
+    while len(offloaded_models) > 0 and process_memory_used() + memory_required > RAM_BUDGET:
+        model = offloaded_models.pop()()
+        if model is None:
+            continue
+        try:
+            if evict_model_weights(model):
+                evicted += 1
+        except Exception as e:
+            # the weights stay in ram, running out of the budget is better than failing the prompt
+            logging.warning("Could not evict {} from system ram: {}".format(model.model.__class__.__name__, e))
+
+    if evicted > 0:
+        gc.collect()
+        logging.info("{} offloaded models evicted from system ram.".format(evicted))
+    return evicted
+
+def host_memory_stats():
+    return {
+        "ram_process_used": process_memory_used(),
+        "ram_budget": RAM_BUDGET,
+        "ram_offloaded_models": len(offloaded_models),
+        "ram_evictions_dropped": ram_evictions["dropped"],
+        "ram_evictions_spilled": ram_evictions["spilled"],
+    }
+
 def use_more_memory(extra_memory, loaded_models, device):
     for m in loaded_models:
         if m.device == device:
@@ -562,6 +675,24 @@ if args.reserve_vram is not None:
 def extra_reserved_memory():
     return EXTRA_RESERVED_VRAM
 
+RAM_BUDGET = None
+if args.ram_budget is not None:
+    if args.ram_budget.endswith("%"):
+        RAM_BUDGET = psutil.virtual_memory().total * float(args.ram_budget[:-1]) / 100.0
+    else:
+        RAM_BUDGET = float(args.ram_budget) * 1024 * 1024 * 1024
+    logging.info("Using a system ram budget of {:0.0f} MB.".format(RAM_BUDGET / (1024 * 1024)))
+
+RAM_SPILL_DIRECTORY = args.ram_spill_directory
+if RAM_SPILL_DIRECTORY is None:
+    RAM_SPILL_DIRECTORY = os.path.join(tempfile.gettempdir(), "comfyui_ram_spill")
+
+def ram_budget():
+    return RAM_BUDGET
+
+def process_memory_used():
+    return psutil.Process().memory_info().rss
+
 def minimum_inference_memory():
     return (1024 * 1024 * 1024) * 0.8 + extra_reserved_memory()
 
@@ -600,6 +731,7 @@ def free_memory(memory_required, device, keep_loaded=[]):
             mem_free_total, mem_free_torch = get_free_memory(device, torch_free_too=True)
             if mem_free_torch > mem_free_total * 0.25:
                 soft_empty_cache()
+    free_ram()
     return unloaded_models
 
 def load_models_gpu(models, memory_required=0, force_patch_weights=False, minimum_memory_required=None, force_full_load=False):
@@ -649,6 +781,9 @@ def load_models_gpu(models, memory_required=0, force_patch_weights=False, minimu
             model_to_unload.model.detach(unpatch_all=False)
             model_to_unload.model_finalizer.detach()
 
+    for loaded_model in models_to_load:
+        model_reloaded(loaded_model.model)  # don't evict the models that are about to be loaded
+
     total_memory_required = {}
     for loaded_model in models_to_load:
         total_memory_required[loaded_model.device] = total_memory_required.get(loaded_model.device, 0) + loaded_model.model_memory_required(loaded_model.device)
@@ -664,6 +799,9 @@ def load_models_gpu(models, memory_required=0, force_patch_weights=False, minimu
                 models_l = free_memory(minimum_memory_required, device)
                 logging.info("{} models unloaded.".format(len(models_l)))
 
+    if torch.device("cpu") in total_memory_required:
+        free_ram()  # free_memory isn't called for the models that run on the cpu
+
     for loaded_model in models_to_load:
         model = loaded_model.model
         torch_dev = model.load_device
@@ -682,6 +820,7 @@ def load_models_gpu(models, memory_required=0, force_patch_weights=False, minimu
         if vram_set_state == VRAMState.NO_VRAM:
             lowvram_model_memory = 0.1
 
+        model_reloaded(model)
         loaded_model.model_load(lowvram_model_memory, force_patch_weights=force_patch_weights)
         current_loaded_models.insert(0, loaded_model)
     return
@@ -767,9 +906,19 @@ def unet_inital_load_device(parameters, dtype):
     else:
         return cpu_dev
 
+def zero_copy_load(device):
+    return args.zero_copy_load and is_device_cpu(device)
+
 def maximum_vram_for_weights(device=None):
     return (get_total_memory(device) * 0.88 - minimum_inference_memory())
 
+def unet_weight_quantization():
+    if args.int8_unet:
+        return "int8"
+    if args.int4_unet:
+        return "int4"
+    return None
+
 def unet_dtype(device=None, model_params=0, supported_dtypes=[torch.float16, torch.bfloat16, torch.float32], weight_dtype=None):
     if model_params < 0:
         model_params = 1000000000000000000000
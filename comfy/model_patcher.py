@@ -23,6 +23,7 @@ import copy
 import inspect
 import logging
 import math
+import threading
 import uuid
 from typing import Callable, Optional
 
@@ -34,6 +35,7 @@ import comfy.lora
 import comfy.model_management
 import comfy.patcher_extension
 import comfy.utils
+from comfy.cli_args import args
 from comfy.comfy_types import UnetWrapperFunction
 from comfy.patcher_extension import CallbacksMP, PatcherInjection, WrappersMP
 
@@ -158,6 +160,14 @@ def get_key_weight(model, key):
 
     return weight, set_func, convert_func
 
+def get_key_patched_params(model, key):
+    """Keys of the parameters an op updates along with the weight at key when it is patched, like the scale of quantized weights."""
+    op_keys = key.rsplit('.', 1)
+    if len(op_keys) < 2 or op_keys[1] != "weight":
+        return []
+    op = comfy.utils.get_attr(model, op_keys[0])
+    return ["{}.{}".format(op_keys[0], p) for p in getattr(op, "patched_weight_params", ())]
+
 class AutoPatcherEjector:
     def __init__(self, model: 'ModelPatcher', skip_and_inject_on_exit_only=False):
         self.model = model
@@ -201,6 +211,99 @@ class MemoryCounter:
     def decrement(self, used: int):
         self.value -= used
 
+def get_hook_keyframe_strengths(hooks: comfy.hooks.HookGroup, sigmas: torch.Tensor) -> list[list[float]]:
+    """The distinct strengths of the hooks of the group at the steps of sigmas, worked out on copies of the keyframes."""
+    keyframes = [hook.hook_keyframe.clone() for hook in hooks.hooks]
+    transformer_options = {"sample_sigmas": sigmas}
+    out = []
+    for sigma in sigmas[:-1]:
+        for keyframe in keyframes:
+            keyframe.prepare_current_keyframe(curr_t=sigma, transformer_options=transformer_options)
+        strengths = [keyframe.strength for keyframe in keyframes]
+        if strengths not in out:
+            out.append(strengths)
+    return out
+
+
+class HookWeightsPrecompute:
+    """
+    Calculates the weights of hook groups at given strengths in a background thread, from a copy of the weights
+    taken before so they can't be affected by the hooks patched meanwhile. The copy and the results that weren't
+    used yet are kept within --hook-weight-cache-size, without a cache the next weights are only calculated once
+    the previous ones were used.
+    """
+    def __init__(self, patcher: ModelPatcher, todo: list[tuple], base_weights: dict, original_weights: dict):
+        self.patcher = patcher
+        self.base_weights = base_weights
+        self.base_size = sum(weight.nelement() * weight.element_size() for weight, _ in base_weights.values())
+        self.original_weights = original_weights
+        self.results: dict[tuple, dict] = {}
+        self.pending = set(t[0] for t in todo)
+        self.waiting_for: list[tuple] = []
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, args=(todo,), daemon=True, name="hook_weights")
+        self.thread.start()
+
+    def results_size(self):
+        return sum(weight.nelement() * weight.element_size() for weights in self.results.values() for weight, _ in weights.values())
+
+    def run(self, todo):
+        max_size = args.hook_weight_cache_size * (1024 ** 3)
+        for cache_key, hooks, strengths in todo:
+            with self.condition:
+                # a caller waiting for weights further in the queue can't use the results first, it isn't held up
+                while len(self.results) > 0 and not self.pending.intersection(self.waiting_for) and not self.stopped and self.base_size + self.results_size() > max_size:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+            try:
+                weights = self.calculate(hooks, strengths)
+            except Exception as e:
+                logging.warning("Could not precompute hook weights: {}".format(e))
+                weights = None
+            with self.condition:
+                if self.stopped:
+                    return
+                self.pending.discard(cache_key)
+                if weights is not None:
+                    self.results[cache_key] = weights
+                self.condition.notify_all()
+        self.base_weights = None
+
+    def calculate(self, hooks: comfy.hooks.HookGroup, strengths: list[float]):
+        combined_patches = self.patcher.get_combined_hook_patches(hooks, strengths)
+        out = {}
+        for key in combined_patches:
+            if key not in self.base_weights:
+                continue
+            if self.stopped:
+                return None
+            base_weight, device = self.base_weights[key]
+            temp_weight = base_weight.to(device=device, dtype=torch.float32, copy=True)
+            out_weight = comfy.lora.calculate_weight(combined_patches[key], temp_weight, key, original_weights={key: self.original_weights[key]})
+            out_weight = comfy.float.stochastic_rounding(out_weight, base_weight.dtype, seed=string_to_seed(key))
+            out[key] = (out_weight.to(device=self.patcher.offload_device), device)
+        return out
+
+    def get(self, cache_key):
+        """The weights for the key, waits for them if they are still being calculated."""
+        with self.condition:
+            self.waiting_for.append(cache_key)
+            self.condition.notify_all()
+            while cache_key in self.pending and not self.stopped:
+                self.condition.wait()
+            self.waiting_for.remove(cache_key)
+            weights = self.results.pop(cache_key, None)
+            self.condition.notify_all()
+            return weights
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+
 class ModelPatcher:
     def __init__(self, model, load_device, offload_device, size=0, weight_inplace_update=False):
         self.size = size
@@ -237,7 +340,8 @@ class ModelPatcher:
         self.hook_patches: dict[comfy.hooks._HookRef] = {}
         self.hook_patches_backup: dict[comfy.hooks._HookRef] = None
         self.hook_backup: dict[str, tuple[torch.Tensor, torch.device]] = {}
-        self.cached_hook_patches: dict[comfy.hooks.HookGroup, dict[str, torch.Tensor]] = {}
+        self.cached_hook_patches: collections.OrderedDict[tuple, dict[str, torch.Tensor]] = collections.OrderedDict()
+        self.hook_weights_precompute: Optional[HookWeightsPrecompute] = None
         self.current_hooks: Optional[comfy.hooks.HookGroup] = None
         self.forced_hooks: Optional[comfy.hooks.HookGroup] = None  # NOTE: only used for CLIP at this time
         self.is_clip = False
@@ -311,10 +415,10 @@ class ModelPatcher:
         # hooks
         n.hook_patches = create_hook_patches_clone(self.hook_patches)
         n.hook_patches_backup = create_hook_patches_clone(self.hook_patches_backup) if self.hook_patches_backup else self.hook_patches_backup
-        for group in self.cached_hook_patches:
-            n.cached_hook_patches[group] = {}
-            for k in self.cached_hook_patches[group]:
-                n.cached_hook_patches[group][k] = self.cached_hook_patches[group][k]
+        for cache_key in self.cached_hook_patches:
+            n.cached_hook_patches[cache_key] = {}
+            for k in self.cached_hook_patches[cache_key]:
+                n.cached_hook_patches[cache_key][k] = self.cached_hook_patches[cache_key][k]
         n.hook_backup = self.hook_backup
         n.current_hooks = self.current_hooks.clone() if self.current_hooks else self.current_hooks
         n.forced_hooks = self.forced_hooks.clone() if self.forced_hooks else self.forced_hooks
@@ -586,6 +690,8 @@ class ModelPatcher:
 
         if key not in self.backup:
             self.backup[key] = collections.namedtuple('Dimension', ['weight', 'inplace_update'])(weight.to(device=self.offload_device, copy=inplace_update), inplace_update)
+            for k in get_key_patched_params(self.model, key):
+                self.backup[k] = collections.namedtuple('Dimension', ['weight', 'inplace_update'])(comfy.utils.get_attr(self.model, k).to(device=self.offload_device, copy=inplace_update), inplace_update)
 
         if device_to is not None:
             temp_weight = comfy.model_management.cast_to_device(weight, device_to, torch.float32, copy=True)
@@ -1037,8 +1143,8 @@ class ModelPatcher:
         transformer_options = model_options.get("transformer_options", {})
         for hook in hook_group.hooks:
             changed = hook.hook_keyframe.prepare_current_keyframe(curr_t=curr_t, transformer_options=transformer_options)
-            # if keyframe changed, remove any cached HookGroups that contain hook with the same hook_ref;
-            # this will cause the weights to be recalculated when sampling
+            # if keyframe changed, the current weights no longer match the strengths; cached weights are keyed
+            # by the strengths so the weights of the new keyframe get reused if they were already calculated
             if changed:
                 # reset current_hooks if contains hook that changed
                 if self.current_hooks is not None:
@@ -1046,9 +1152,6 @@ class ModelPatcher:
                         if current_hook == hook:
                             reset_current_hooks = True
                             break
-                for cached_group in list(self.cached_hook_patches.keys()):
-                    if cached_group.contains(hook):
-                        self.cached_hook_patches.pop(cached_group)
         if reset_current_hooks:
             self.patch_hooks(None)
 
@@ -1100,25 +1203,107 @@ class ModelPatcher:
             self.patches_uuid = uuid.uuid4()
             return list(p)
 
-    def get_combined_hook_patches(self, hooks: comfy.hooks.HookGroup):
+    def get_combined_hook_patches(self, hooks: comfy.hooks.HookGroup, strengths: list[float]=None):
         # combined_patches will contain  weights of all relevant hooks, per key
         combined_patches = {}
         if hooks is not None:
-            for hook in hooks.hooks:
+            for i, hook in enumerate(hooks.hooks):
+                strength = hook.strength if strengths is None else strengths[i]
                 hook_patches: dict = self.hook_patches.get(hook.hook_ref, {})
                 for key in hook_patches.keys():
                     current_patches: list[tuple] = combined_patches.get(key, [])
-                    if math.isclose(hook.strength, 1.0):
+                    if math.isclose(strength, 1.0):
                         current_patches.extend(hook_patches[key])
                     else:
                         # patches are stored as tuples: (strength_patch, (tuple_with_weights,), strength_model)
                         for patch in hook_patches[key]:
                             new_patch = list(patch)
-                            new_patch[0] *= hook.strength
+                            new_patch[0] *= strength
                             current_patches.append(tuple(new_patch))
                     combined_patches[key] = current_patches
         return combined_patches
 
+    def get_hook_patches_cache_key(self, hooks: comfy.hooks.HookGroup, strengths: list[float]=None):
+        # the patched weights depend on the patches of the model and the current strength of every hook
+        if strengths is None:
+            strengths = [hook.strength for hook in hooks.hooks]
+        return (self.patches_uuid, tuple((hook.hook_ref, strength) for hook, strength in zip(hooks.hooks, strengths)))
+
+    def cached_hook_weights_size(self, cache_key=None):
+        entries = self.cached_hook_patches.values() if cache_key is None else [self.cached_hook_patches[cache_key]]
+        return sum(weight.nelement() * weight.element_size() for cached_weights in entries for weight, _ in cached_weights.values())
+
+    def trim_cached_hook_weights(self, keep=None):
+        max_size = args.hook_weight_cache_size * (1024 ** 3)
+        if max_size <= 0:
+            # only the weights of the current strengths of each hook group are kept while sampling
+            if keep is not None:
+                for cache_key in list(self.cached_hook_patches.keys()):
+                    if cache_key != keep and [ref for ref, _ in cache_key[1]] == [ref for ref, _ in keep[1]]:
+                        self.cached_hook_patches.pop(cache_key)
+            return
+        size = self.cached_hook_weights_size()
+        for cache_key in list(self.cached_hook_patches.keys()):
+            if size <= max_size:
+                break
+            if cache_key == keep:
+                continue
+            size -= self.cached_hook_weights_size(cache_key)
+            self.cached_hook_patches.pop(cache_key)
+
+    def get_cached_hook_weights(self, cache_key):
+        cached_weights = self.cached_hook_patches.get(cache_key, None)
+        if cached_weights is None and self.hook_weights_precompute is not None:
+            cached_weights = self.hook_weights_precompute.get(cache_key)
+            if cached_weights is not None:
+                self.cached_hook_patches[cache_key] = cached_weights
+        if cached_weights is not None:
+            self.cached_hook_patches.move_to_end(cache_key)
+        return cached_weights
+
+    def precompute_hook_weights(self, hook_groups: list[comfy.hooks.HookGroup], sigmas: torch.Tensor):
+        """
+        Starts calculating the weights of every combination of keyframe strengths the hook groups go through
+        with these sigmas in a background thread, patch_hooks then waits for them instead of calculating them.
+        """
+        self.stop_hook_weights_precompute()
+        if self.hook_mode != comfy.hooks.EnumHookMode.MaxSpeed:
+            return
+        todo = []
+        for hooks in hook_groups:
+            for strengths in get_hook_keyframe_strengths(hooks, sigmas):
+                cache_key = self.get_hook_patches_cache_key(hooks, strengths)
+                if cache_key not in self.cached_hook_patches and cache_key not in [t[0] for t in todo]:
+                    todo.append((cache_key, hooks, strengths))
+        if len(todo) == 0:
+            return
+
+        with self.use_ejected():
+            self.unpatch_hooks()
+            keys = set()
+            for _, hooks, strengths in todo:
+                keys.update(self.get_combined_hook_patches(hooks, strengths).keys())
+            key_patches = self.get_key_patches()
+            base_weights = {}
+            original_weights = {}
+            for key in keys:
+                if key not in key_patches:
+                    continue
+                weight, set_func, convert_func = get_key_weight(self.model, key)
+                if set_func is not None or convert_func is not None:
+                    return  # only plain weights are calculated in the background
+                base_weights[key] = (weight.to(device=self.offload_device, copy=True), weight.device)
+                original_weights[key] = key_patches[key]
+                if key not in self.backup:
+                    # the original weight is the model weight itself which gets patched by the hooks while sampling
+                    original_weights[key] = [(base_weights[key][0], key_patches[key][0][1])] + key_patches[key][1:]
+        self.hook_weights_precompute = HookWeightsPrecompute(self, todo, base_weights, original_weights)
+
+    def stop_hook_weights_precompute(self):
+        if self.hook_weights_precompute is not None:
+            self.hook_weights_precompute.stop()
+            self.hook_weights_precompute = None
+
     def apply_hooks(self, hooks: comfy.hooks.HookGroup, transformer_options: dict=None, force_apply=False):
         # TODO: return transformer_options dict with any additions from hooks
         if self.current_hooks == hooks and (not force_apply or (not self.is_clip and hooks is None)):
@@ -1138,7 +1323,8 @@ class ModelPatcher:
                     memory_counter = MemoryCounter(initial=comfy.model_management.get_free_memory(self.load_device),
                                                 minimum=comfy.model_management.minimum_inference_memory()*2)
                 # if have cached weights for hooks, use it
-                cached_weights = self.cached_hook_patches.get(hooks, None)
+                cache_key = self.get_hook_patches_cache_key(hooks)
+                cached_weights = self.get_cached_hook_weights(cache_key)
                 if cached_weights is not None:
                     model_sd_keys_set = set(model_sd_keys)
                     for key in cached_weights:
@@ -1148,6 +1334,7 @@ class ModelPatcher:
                         self.patch_cached_hook_weights(cached_weights=cached_weights, key=key, memory_counter=memory_counter)
                         model_sd_keys_set.remove(key)
                     self.unpatch_hooks(model_sd_keys_set)
+                    self.trim_cached_hook_weights(keep=cache_key)
                 else:
                     self.unpatch_hooks()
                     relevant_patches = self.get_combined_hook_patches(hooks=hooks)
@@ -1159,7 +1346,8 @@ class ModelPatcher:
                             logging.warning(f"Cached hook would not patch. Key does not exist in model: {key}")
                             continue
                         self.patch_hook_weight_to_device(hooks=hooks, combined_patches=relevant_patches, key=key, original_weights=original_weights,
-                                                            memory_counter=memory_counter)
+                                                            memory_counter=memory_counter, cache_key=cache_key)
+                    self.trim_cached_hook_weights(keep=cache_key)
             else:
                 self.unpatch_hooks()
             self.current_hooks = hooks
@@ -1179,7 +1367,14 @@ class ModelPatcher:
         self.cached_hook_patches.clear()
         self.patch_hooks(None)
 
-    def patch_hook_weight_to_device(self, hooks: comfy.hooks.HookGroup, combined_patches: dict, key: str, original_weights: dict, memory_counter: MemoryCounter):
+    def offload_cached_hook_weights(self):
+        for cached_weights in self.cached_hook_patches.values():
+            for key in cached_weights:
+                weight, device = cached_weights[key]
+                cached_weights[key] = (weight.to(device=self.offload_device), device)
+
+    def patch_hook_weight_to_device(self, hooks: comfy.hooks.HookGroup, combined_patches: dict, key: str, original_weights: dict, memory_counter: MemoryCounter,
+                                    cache_key=None):
         if key not in combined_patches:
             return
 
@@ -1192,6 +1387,9 @@ class ModelPatcher:
                 if used:
                     target_device = weight.device
             self.hook_backup[key] = (weight.to(device=target_device, copy=True), weight.device)
+            for k in get_key_patched_params(self.model, key):
+                param = comfy.utils.get_attr(self.model, k)
+                self.hook_backup[k] = (param.to(device=target_device, copy=True), param.device)
         # TODO: properly handle LowVramPatch, if it ends up an issue
         temp_weight = comfy.model_management.cast_to_device(weight, weight.device, torch.float32, copy=True)
         if convert_func is not None:
@@ -1212,8 +1410,10 @@ class ModelPatcher:
             used = memory_counter.use(weight)
             if used:
                 target_device = weight.device
-            self.cached_hook_patches.setdefault(hooks, {})
-            self.cached_hook_patches[hooks][key] = (out_weight.to(device=target_device, copy=False), weight.device)
+            if cache_key is None:
+                cache_key = self.get_hook_patches_cache_key(hooks)
+            self.cached_hook_patches.setdefault(cache_key, {})
+            self.cached_hook_patches[cache_key][key] = (out_weight.to(device=target_device, copy=False), weight.device)
         del temp_weight
         del out_weight
         del weight
@@ -1224,7 +1424,8 @@ class ModelPatcher:
                 self.current_hooks = None
                 return
             keys = list(self.hook_backup.keys())
-            if whitelist_keys_set:
+            if whitelist_keys_set is not None:
+                whitelist_keys_set = whitelist_keys_set.union(*[get_key_patched_params(self.model, k) for k in whitelist_keys_set if k in self.hook_backup])
                 for k in keys:
                     if k in whitelist_keys_set:
                         comfy.utils.copy_to_param(self.model, k, self.hook_backup[k][0].to(device=self.hook_backup[k][1]))
@@ -1237,8 +1438,14 @@ class ModelPatcher:
                 self.current_hooks = None
 
     def clean_hooks(self):
+        self.stop_hook_weights_precompute()
         self.unpatch_hooks()
-        self.clear_cached_hook_weights()
+        if args.hook_weight_cache_size > 0:
+            # keep the weights for the next prompts, out of the way of the models in vram
+            self.offload_cached_hook_weights()
+            self.trim_cached_hook_weights()
+        else:
+            self.clear_cached_hook_weights()
 
     def __del__(self):
         self.detach(unpatch_all=False)
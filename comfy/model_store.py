@@ -0,0 +1,224 @@
+# Opt in (--model-store) on disk store of state dicts that have to be converted when
+# they are loaded: ckpt/pt files that need torch.load and diffusion models that need
+# their keys converted. The converted state dict is saved as a safetensors file the
+# first time the model is loaded and is memory mapped on the next loads.
+# Entries are keyed by the source path and the kind of conversion, they are
+# invalidated when the size or modification time of the source changes.
+
+import os
+import hashlib
+import logging
+import argparse
+import torch
+import safetensors
+import safetensors.torch
+from comfy.cli_args import args
+
+STORE_VERSION = "1"
+
+def enabled():
+    return args.model_store
+
+def cast_weights():
+    return args.model_store_cast_weights
+
+def store_directory():
+    if args.model_store_directory is not None:
+        return args.model_store_directory
+    base_directory = args.base_directory
+    if base_directory is None:
+        base_directory = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+    return os.path.join(os.path.abspath(base_directory), "models", "model_store")
+
+def max_store_size():
+    if args.model_store_max_size is None:
+        return None
+    return args.model_store_max_size * 1024 * 1024 * 1024
+
+def source_signature(path):
+    st = os.stat(path)
+    return {"source": os.path.abspath(path), "source_size": str(st.st_size), "source_mtime": str(st.st_mtime_ns), "store_version": STORE_VERSION}
+
+def store_path(path, kind="raw"):
+    key = hashlib.sha256("{}\n{}".format(os.path.abspath(path), kind).encode("utf-8")).hexdigest()
+    return os.path.join(store_directory(), "{}.safetensors".format(key))
+
+def remove(path, kind="raw"):
+    try:
+        os.remove(store_path(path, kind))
+    except OSError:
+        pass
+
+def load(path, kind="raw", device=None):
+    """Returns the memory mapped state dict stored for path or None if there is no valid entry."""
+    if not enabled():
+        return None
+    if device is None:
+        device = torch.device("cpu")
+
+    stored = store_path(path, kind)
+    if not os.path.isfile(stored):
+        return None
+
+    try:
+        signature = source_signature(path)
+        with safetensors.safe_open(stored, framework="pt", device=device.type) as f:
+            metadata = f.metadata()
+            if metadata is None or any(metadata.get(k, None) != v for k, v in signature.items()):
+                logging.info("Model store entry for {} is out of date.".format(path))
+                sd = None
+            else:
+                sd = {k: f.get_tensor(k) for k in f.keys()}
+    except Exception as e:
+        logging.warning("Could not load model store entry {}: {}".format(stored, e))
+        sd = None
+
+    if sd is None:
+        remove(path, kind)
+        return None
+
+    try:
+        os.utime(stored)
+    except OSError:
+        pass
+    logging.debug("Loaded {} ({}) from the model store.".format(path, kind))
+    return sd
+
+def save(path, sd, kind="raw"):
+    """Stores sd for path, only state dicts that contain nothing but tensors can be stored."""
+    if not enabled():
+        return False
+
+    to_save = {}
+    storages = set()
+    for k in sd:
+        t = sd[k]
+        if not isinstance(t, torch.Tensor):
+            logging.debug("Not storing {} in the model store, it contains non tensor values.".format(path))
+            return False
+        ptr = t.untyped_storage().data_ptr()
+        if (t.numel() > 0 and ptr in storages) or not t.is_contiguous():
+            t = t.contiguous().clone()
+        storages.add(ptr)
+        to_save[k] = t
+
+    stored = store_path(path, kind)
+    temp = "{}.{}.tmp".format(stored, os.getpid())
+    try:
+        os.makedirs(store_directory(), exist_ok=True)
+        safetensors.torch.save_file(to_save, temp, metadata=source_signature(path))
+        os.replace(temp, stored)
+    except Exception as e:
+        logging.warning("Could not save {} to the model store: {}".format(path, e))
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        return False
+
+    logging.info("Saved {} ({}) to the model store.".format(path, kind))
+    enforce_size_limit(keep=stored)
+    return True
+
+def entries():
+    directory = store_directory()
+    if not os.path.isdir(directory):
+        return []
+    out = []
+    for f in os.scandir(directory):
+        if f.is_file() and f.name.endswith(".safetensors"):
+            st = f.stat()
+            out.append((st.st_mtime, st.st_size, f.path))
+    return out
+
+def enforce_size_limit(keep=None):
+    max_size = max_store_size()
+    if max_size is None:
+        return
+
+    stored = sorted(entries())
+    total = sum(map(lambda a: a[1], stored))
+    for _, size, path in stored:
+        if total <= max_size:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+            logging.info("Removed {} from the model store to stay below the size limit.".format(path))
+        except OSError:
+            pass
+
+def prune():
+    """Removes the entries whose source files were deleted or changed."""
+    removed = 0
+    for _, _, stored in entries():
+        try:
+            with safetensors.safe_open(stored, framework="pt", device="cpu") as f:
+                metadata = f.metadata() or {}
+            source = metadata.get("source", None)
+            valid = source is not None and metadata.get("store_version", None) == STORE_VERSION
+            if valid:
+                signature = source_signature(source)
+                valid = all(metadata.get(k, None) == v for k, v in signature.items())
+        except Exception:
+            valid = False
+
+        if not valid:
+            try:
+                os.remove(stored)
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+def warm_file(path, folder_name):
+    import comfy.sd
+    import comfy.utils
+
+    if folder_name in ("diffusion_models", "unet"):
+        comfy.sd.diffusion_model_state_dict_from_file(path)
+    elif not (path.lower().endswith(".safetensors") or path.lower().endswith(".sft")):
+        comfy.utils.load_torch_file(path, safe_load=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-warm the ComfyUI model store by converting every model in the model folders.")
+    parser.add_argument("folders", nargs="*", default=["checkpoints", "diffusion_models", "loras", "vae", "text_encoders", "controlnet", "clip_vision", "upscale_models", "embeddings"], help="Names of the model folders to convert.")
+    parser.add_argument("--base-directory", type=str, default=None, help="The ComfyUI base directory.")
+    parser.add_argument("--extra-model-paths-config", type=str, default=None, nargs="+", help="extra_model_paths.yaml files to load.")
+    parser.add_argument("--model-store-directory", type=str, default=None, help="The model store directory.")
+    parser.add_argument("--model-store-max-size", type=float, default=None, help="The maximum size of the model store in GB.")
+    parser.add_argument("--prune", action="store_true", help="Only remove the entries whose source files changed or were deleted.")
+    parser.add_argument("--cpu", action="store_true", help="Do the conversion without initializing the GPU.")
+    a = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    args.model_store = True
+    args.base_directory = a.base_directory
+    args.model_store_directory = a.model_store_directory
+    args.model_store_max_size = a.model_store_max_size
+    args.cpu = a.cpu
+
+    if a.prune:
+        logging.info("Removed {} model store entries.".format(prune()))
+        return
+
+    import folder_paths
+    if a.extra_model_paths_config is not None:
+        import utils.extra_config
+        for config_path in a.extra_model_paths_config:
+            utils.extra_config.load_extra_path_config(config_path)
+
+    for folder_name in a.folders:
+        for filename in folder_paths.get_filename_list(folder_name):
+            path = folder_paths.get_full_path(folder_name, filename)
+            if path is None:
+                continue
+            try:
+                warm_file(path, folder_name)
+            except Exception as e:
+                logging.warning("Could not convert {}: {}".format(path, e))
+
+if __name__ == "__main__":
+    main()
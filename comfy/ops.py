@@ -425,6 +425,117 @@ def scaled_fp8_ops(fp8_matrix_mult=False, scale_input=False, override_dtype=None
 
     return scaled_fp8_op
 
+def cast_bias_quantized_weight(s, input):
+    dtype = input.dtype
+    device = input.device
+
+    offload_stream = comfy.model_management.get_offload_stream(device)
+    if offload_stream is not None:
+        wf_context = offload_stream
+    else:
+        wf_context = contextlib.nullcontext()
+
+    bias = None
+    non_blocking = comfy.model_management.device_supports_non_blocking(device)
+    if s.bias is not None:
+        has_function = len(s.bias_function) > 0
+        bias = comfy.model_management.cast_to(s.bias, dtype, device, non_blocking=non_blocking, copy=has_function, stream=offload_stream)
+
+        if has_function:
+            with wf_context:
+                for f in s.bias_function:
+                    bias = f(bias)
+
+    weight = comfy.model_management.cast_to(s.weight, None, device, non_blocking=non_blocking, stream=offload_stream)
+    scale = comfy.model_management.cast_to(s.weight_scale, None, device, non_blocking=non_blocking, stream=offload_stream)
+    with wf_context:
+        weight = s.dequantize(weight, scale, dtype)
+        for f in s.weight_function:
+            weight = f(weight)
+
+    comfy.model_management.sync_stream(device, offload_stream)
+    return weight, bias
+
+def int_weight_only_ops(int4=False, group_size=128):
+    """Weight only quantization for linear and conv layers.
+
+    The weights are stored in int8 with a scale per output channel or, with int4=True,
+    packed in int4 with a scale per group of group_size input channels. They get
+    dequantized to the input dtype in forward so this works on any device including the CPU.
+    Float weights are quantized when the state dict is loaded. When a lora is applied the
+    patched weight is quantized again with a new scale so the lora doesn't saturate, the
+    model patcher backs up the scale along with the weight (patched_weight_params).
+    """
+    logging.info("Using weight only quantization: {}".format("int4 group size {}".format(group_size) if int4 else "int8"))
+
+    class QuantizedWeight:
+        patched_weight_params = ("weight_scale",)
+
+        def reset_parameters(self):
+            self.weight_shape = tuple(self.weight.shape)
+            device = self.weight.device
+            if int4:
+                groups = (self.weight[0].numel() + group_size - 1) // group_size
+                weight = torch.empty((self.weight_shape[0], groups * group_size // 2), device=device, dtype=torch.uint8)
+                scale = torch.ones((self.weight_shape[0], groups), device=device, dtype=torch.float32)
+            else:
+                weight = torch.empty(self.weight_shape, device=device, dtype=torch.int8)
+                scale = torch.ones((self.weight_shape[0],), device=device, dtype=torch.float32)
+            self.weight = torch.nn.Parameter(weight, requires_grad=False)
+            self.weight_scale = torch.nn.Parameter(scale, requires_grad=False)
+            return None
+
+        def quantize(self, weight, scale=None):
+            if int4:
+                return comfy.float.quantize_int4(weight, group_size, scale=scale)
+            return comfy.float.quantize_int8(weight, scale=scale)
+
+        def dequantize(self, weight, scale, dtype):
+            if int4:
+                return comfy.float.dequantize_int4(weight, scale, dtype, self.weight_shape)
+            return comfy.float.dequantize_int8(weight, scale, dtype)
+
+        def _load_from_state_dict(self, state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys, error_msgs):
+            weight = state_dict.get(prefix + "weight", None)
+            if weight is not None and prefix + "weight_scale" not in state_dict and weight.is_floating_point():
+                state_dict[prefix + "weight"], state_dict[prefix + "weight_scale"] = self.quantize(weight)
+            return super()._load_from_state_dict(state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys, error_msgs)
+
+        def convert_weight(self, weight, inplace=False, **kwargs):
+            return self.dequantize(weight.to(self.weight.dtype), self.weight_scale.to(weight.device), torch.float32)
+
+        def set_weight(self, weight, inplace_update=False, seed=None, **kwargs):
+            weight, scale = self.quantize(weight)
+            if inplace_update:
+                self.weight.data.copy_(weight)
+                self.weight_scale.data.copy_(scale)
+            else:
+                self.weight = torch.nn.Parameter(weight.to(self.weight.device), requires_grad=False)
+                self.weight_scale = torch.nn.Parameter(scale.to(self.weight_scale.device), requires_grad=False)
+
+    class int_weight_only_op(manual_cast):
+        class Linear(QuantizedWeight, manual_cast.Linear):
+            def forward_comfy_cast_weights(self, input):
+                weight, bias = cast_bias_quantized_weight(self, input)
+                return torch.nn.functional.linear(input, weight, bias)
+
+        class Conv1d(QuantizedWeight, manual_cast.Conv1d):
+            def forward_comfy_cast_weights(self, input):
+                weight, bias = cast_bias_quantized_weight(self, input)
+                return self._conv_forward(input, weight, bias)
+
+        class Conv2d(QuantizedWeight, manual_cast.Conv2d):
+            def forward_comfy_cast_weights(self, input):
+                weight, bias = cast_bias_quantized_weight(self, input)
+                return self._conv_forward(input, weight, bias)
+
+        class Conv3d(QuantizedWeight, manual_cast.Conv3d):
+            def forward_comfy_cast_weights(self, input):
+                weight, bias = cast_bias_quantized_weight(self, input)
+                return self._conv_forward(input, weight, bias)
+
+    return int_weight_only_op
+
 CUBLAS_IS_AVAILABLE = False
 try:
     from cublas_ops import CublasLinear
@@ -444,11 +555,18 @@ if CUBLAS_IS_AVAILABLE:
             def forward(self, *args, **kwargs):
                 return super().forward(*args, **kwargs)
 
-def pick_operations(weight_dtype, compute_dtype, load_device=None, disable_fast_fp8=False, fp8_optimizations=False, scaled_fp8=None):
+def pick_operations(weight_dtype, compute_dtype, load_device=None, disable_fast_fp8=False, fp8_optimizations=False, scaled_fp8=None, weight_quantization=None):
     fp8_compute = comfy.model_management.supports_fp8_compute(load_device)
     if scaled_fp8 is not None:
+        if weight_quantization is not None:
+            logging.warning("Weight only quantization is not supported for scaled fp8 models, ignoring it.")
         return scaled_fp8_ops(fp8_matrix_mult=fp8_compute and fp8_optimizations, scale_input=fp8_optimizations, override_dtype=scaled_fp8)
 
+    if weight_quantization == "int8":
+        return int_weight_only_ops()
+    elif weight_quantization == "int4":
+        return int_weight_only_ops(int4=True)
+
     if (
         fp8_compute and
         (fp8_optimizations or PerformanceFeature.Fp8MatrixMultiplication in args.fast) and
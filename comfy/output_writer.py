@@ -0,0 +1,138 @@
+# Background writer for the images saved by the output nodes. The nodes convert the
+# images to uint8 and reserve the filenames, encoding and writing the files happens
+# in a thread pool (PIL releases the GIL while encoding) so the following nodes and
+# the other images of the batch are processed meanwhile. Files are written to a
+# temporary name and renamed once complete.
+#
+# wait() is the completion barrier used before the history of a prompt is finalized, it
+# raises a SaveError for the files that couldn't be written so the prompt fails. The
+# /view route waits for files that are still being written.
+
+import os
+import logging
+import threading
+import concurrent.futures
+from PIL import Image
+import folder_paths
+import comfy.compact_image
+from comfy.cli_args import args
+from comfy_execution.utils import get_executing_context
+
+executor = None
+executor_workers = 0
+lock = threading.Lock()
+pending = {}
+failed = []
+
+class SaveError(Exception):
+    def __init__(self, path, node_id, error):
+        super().__init__("Error saving {}: {}".format(path, error))
+        self.path = path
+        self.node_id = node_id
+
+def worker_count():
+    if args.output_writer_threads is not None:
+        return max(0, args.output_writer_threads)
+    return min(4, os.cpu_count() or 1)
+
+def get_executor():
+    global executor, executor_workers
+    workers = worker_count()
+    if workers == 0:
+        return None
+    with lock:
+        if executor is None or executor_workers != workers:
+            if executor is not None:
+                executor.shutdown(wait=False)
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="output_writer")
+            executor_workers = workers
+        return executor
+
+def path_key(path):
+    return os.path.normcase(os.path.abspath(path))
+
+def to_uint8(images):
+    """Converts a batch of float images in the [0, 1] range or a CompactImage to a uint8 numpy array in one operation."""
+    return comfy.compact_image.to_uint8(images).cpu().numpy()
+
+def write_image(path, image, format, params):
+    img = Image.fromarray(image)
+    directory, name = os.path.split(path)
+    temp = os.path.join(directory, ".{}.{}.tmp".format(name, os.getpid()))
+    try:
+        img.save(temp, format=format, **params)
+        os.replace(temp, path)
+        folder_paths.save_counter_index.saved(directory)
+    except Exception:
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        raise
+
+def finished(key, future):
+    e = future.exception()
+    if e is not None:
+        logging.error("Error saving {}: {}".format(key, e))
+    with lock:
+        if pending.get(key) is future:
+            pending.pop(key)
+        if e is not None and not getattr(future, "reported", False):
+            failed.append((key, future))
+
+def save_image(path, image, format="PNG", **params):
+    """Encodes the uint8 HWC array image to path in the background, params are passed to PIL's Image.save.
+
+    Returns a future, the image is written before returning when the writer threads are disabled."""
+    pool = get_executor()
+    if pool is None:
+        future = concurrent.futures.Future()
+        write_image(path, image, format, params)
+        future.set_result(path)
+        return future
+
+    key = path_key(path)
+    context = get_executing_context()
+    with lock:
+        future = pool.submit(write_image, path, image, format, params)
+        future.node_id = context.node_id if context is not None else None
+        pending[key] = future
+    future.add_done_callback(lambda f: finished(key, f))
+    return future
+
+def is_pending(path):
+    with lock:
+        return path_key(path) in pending
+
+def wait_for_file(path):
+    """Waits until path is written if it is pending."""
+    with lock:
+        future = pending.get(path_key(path), None)
+    if future is not None:
+        concurrent.futures.wait([future])
+
+def wait(directory=None):
+    """Waits for the pending writes (in directory if set), returns the number of files waited for.
+
+    Raises a SaveError for the first write that failed since the last call, the failures are cleared."""
+    with lock:
+        if directory is None:
+            futures = list(pending.items())
+        else:
+            directory = path_key(directory)
+            futures = [(k, f) for k, f in pending.items() if os.path.dirname(k) == directory]
+
+    concurrent.futures.wait([f for _, f in futures])
+    with lock:
+        # the done callbacks can run after the wait returns, the failures are taken from both
+        errors = [(k, f) for k, f in failed if directory is None or os.path.dirname(k) == directory]
+        for e in errors:
+            failed.remove(e)
+        for k, f in futures:
+            if f.exception() is not None and not getattr(f, "reported", False) and (k, f) not in errors:
+                errors.append((k, f))
+            f.reported = True
+    if len(errors) > 0:
+        key, future = errors[0]
+        raise SaveError(key, getattr(future, "node_id", None), future.exception()) from future.exception()
+    return len(futures)
@@ -5,25 +5,85 @@ import comfy.utils
 import numpy as np
 import logging
 
-def prepare_noise(latent_image, seed, noise_inds=None):
+# number of 32 bit random words the cpu generator uses per value when generating normal values
+RANDOM_WORDS_PER_VALUE = {torch.float32: 1, torch.float16: 1, torch.bfloat16: 1, torch.float64: 2}
+
+def noise_generator(seed, device="cpu"):
+    device = torch.device(device)
+    if device.type == "cpu":
+        return torch.manual_seed(seed)
+    return torch.Generator(device=device).manual_seed(seed)
+
+def prepare_noise(latent_image, seed, noise_inds=None, seeds=None, device="cpu"):
     """
     creates random noise given a latent image and a seed.
     optional arg skip can be used to skip and discard x number of noise generations for a given seed
+    seeds: optional list with one seed per batch element, each element then gets the noise its seed generates for a batch of one.
+    device: generate the noise on this device, the noise only matches the default cpu noise on the cpu.
     """
-    generator = torch.manual_seed(seed)
+    sample_shape = [1] + list(latent_image.size())[1:]
+    if seeds is not None:
+        if len(seeds) != latent_image.shape[0]:
+            raise ValueError("Got {} noise seeds for a batch of {} latents, one seed per batch element is needed.".format(len(seeds), latent_image.shape[0]))
+        noises = {}
+        for s in seeds:
+            if s not in noises:
+                noises[s] = torch.randn(sample_shape, dtype=latent_image.dtype, layout=latent_image.layout, generator=noise_generator(s, device), device=device)
+        return torch.cat([noises[s] for s in seeds], dim=0)
+
+    generator = noise_generator(seed, device)
     if noise_inds is None:
-        return torch.randn(latent_image.size(), dtype=latent_image.dtype, layout=latent_image.layout, generator=generator, device="cpu")
+        return torch.randn(latent_image.size(), dtype=latent_image.dtype, layout=latent_image.layout, generator=generator, device=device)
 
     unique_inds, inverse = np.unique(noise_inds, return_inverse=True)
+    sample_numel = latent_image[:1].numel()
+    if torch.device(device).type == "cpu" and sample_numel % 16 == 0 and sample_numel > 0 and latent_image.dtype in RANDOM_WORDS_PER_VALUE:
+        # on the cpu a randn of this size consumes exactly sample_numel * words per value 32 bit words of the generator,
+        # the skipped indices only advance the generator by that much instead of computing the normal values.
+        skip = torch.empty(sample_numel * RANDOM_WORDS_PER_VALUE[latent_image.dtype], dtype=torch.int32)
+        noises = torch.empty([len(unique_inds)] + sample_shape[1:], dtype=latent_image.dtype, layout=latent_image.layout, device=device)
+        wanted = set(unique_inds.tolist())
+        j = 0
+        for i in range(unique_inds[-1] + 1):
+            if i in wanted:
+                noises[j].normal_(generator=generator)
+                j += 1
+            else:
+                skip.random_(generator=generator)
+        return noises[torch.from_numpy(inverse.reshape(-1))]
+
     noises = []
     for i in range(unique_inds[-1]+1):
-        noise = torch.randn([1] + list(latent_image.size())[1:], dtype=latent_image.dtype, layout=latent_image.layout, generator=generator, device="cpu")
+        noise = torch.randn(sample_shape, dtype=latent_image.dtype, layout=latent_image.layout, generator=generator, device=device)
         if i in unique_inds:
             noises.append(noise)
     noises = [noises[i] for i in inverse]
     noises = torch.cat(noises, axis=0)
     return noises
 
+def prepare_latent_noise(latent, latent_image, seed):
+    """
+    noise for the LATENT dict latent (with latent_image as its samples), uses the batch_index and the noise_options
+    set by other nodes: noise_options["seeds"] is "per_sample" for seed + batch index or a list of seeds indexed by
+    batch index and noise_options["device"] can be "gpu" to generate the noise on the torch device.
+    """
+    batch_inds = latent.get("batch_index", None)
+    options = latent.get("noise_options", {})
+    seeds = options.get("seeds", None)
+    if seeds is not None:
+        inds = batch_inds if batch_inds is not None else range(latent_image.shape[0])
+        if seeds == "per_sample":
+            seeds = [seed + i for i in inds]
+        else:
+            if max(inds) >= len(seeds):
+                raise ValueError("No noise seed for batch index {}, only {} seeds were given.".format(max(inds), len(seeds)))
+            seeds = [seeds[i] for i in inds]
+
+    device = "cpu"
+    if options.get("device", "cpu") == "gpu":
+        device = comfy.model_management.get_torch_device()
+    return prepare_noise(latent_image, seed, batch_inds, seeds=seeds, device=device)
+
 def fix_empty_latent_channels(model, latent_image):
     latent_format = model.get_model_object("latent_format") #Resize the empty latent image so it has the right number of channels
     if latent_format.latent_channels != latent_image.shape[1] and torch.count_nonzero(latent_image) == 0:
@@ -0,0 +1,273 @@
+# Sampler checkpoints (--sampler-checkpoint-steps / --sampler-checkpoint-minutes).
+# The outputs of the model calls of a sampling run are saved to disk every N steps
+# or M minutes, in a directory named after a signature of the run (model, conds,
+# noise, latent, sigmas, sampler and cfg). When a run with the same signature is
+# sampled again after an interrupt, an OOM or a restart, the sampler is replayed
+# from the start with the saved outputs instead of calling the model: the replay
+# rebuilds the exact state of the sampler at the checkpoint (x, step index, the
+# history of the multistep samplers and the noise sampler RNG) and the model is
+# only called again for the steps that weren't saved. The checkpoint is deleted
+# when the run completes.
+
+import os
+import time
+import shutil
+import hashlib
+import logging
+import torch
+import safetensors.torch
+from torch.utils.weak import WeakTensorKeyDictionary
+from comfy.cli_args import args
+
+MAX_AGE = 7 * 24 * 60 * 60
+# content digests of the weights, lora patches and controlnet models, which are hashed again only when they change
+tensor_digests = WeakTensorKeyDictionary()
+
+
+def enabled():
+    return (args.sampler_checkpoint_steps or 0) > 0 or (args.sampler_checkpoint_minutes or 0) > 0
+
+
+def checkpoint_directory() -> str:
+    if args.sampler_checkpoint_directory is not None:
+        return args.sampler_checkpoint_directory
+    import folder_paths
+    return os.path.join(folder_paths.get_user_directory(), "sampler_checkpoints")
+
+
+def tensor_digest(tensor) -> bytes:
+    check = (tensor._version, tensor.data_ptr())
+    cached = tensor_digests.get(tensor, None)
+    if cached is not None and cached[0] == check:
+        return cached[1]
+    h = hashlib.sha256("tensor{}{}".format(tensor.dtype, tuple(tensor.shape)).encode())
+    try:
+        h.update(tensor.detach().to("cpu").contiguous().flatten().view(torch.uint8).numpy())
+    except Exception:
+        pass
+    value = h.digest()
+    tensor_digests[tensor] = (check, value)
+    return value
+
+
+def module_digest(h, module):
+    """Adds the class and the weights of a torch module to the hash h."""
+    h.update(type(module).__name__.encode())
+    for k, t in list(module.named_parameters()) + list(module.named_buffers()):
+        h.update(k.encode())
+        h.update(tensor_digest(t))
+
+
+def digest(h, value, depth=0):
+    """Adds value to the hash h: tensors and modules by content, containers recursively, functions by name and other objects by their attributes."""
+    if depth > 8:
+        return
+    if isinstance(value, torch.Tensor):
+        h.update(tensor_digest(value))
+    elif isinstance(value, torch.nn.Module):
+        module_digest(h, value)
+    elif isinstance(value, dict):
+        h.update(b"dict")
+        for k in sorted(value.keys(), key=str):
+            h.update(str(k).encode())
+            digest(h, value[k], depth + 1)
+    elif isinstance(value, (list, tuple)):
+        h.update("list{}".format(len(value)).encode())
+        for v in value:
+            digest(h, v, depth + 1)
+    elif value is None or isinstance(value, (bool, int, float, str)):
+        h.update(repr(value).encode())
+    elif callable(value) and hasattr(value, "__qualname__"):
+        h.update("{}.{}".format(getattr(value, "__module__", ""), value.__qualname__).encode())
+    elif hasattr(value, "cond") and isinstance(getattr(value, "cond"), torch.Tensor):
+        h.update(type(value).__name__.encode())
+        digest(h, value.cond, depth + 1)
+    else:
+        # the settings, tensors and models of objects like the controlnets in the conds or the weight adapters of the loras
+        h.update(type(value).__name__.encode())
+        for k, v in sorted(getattr(value, "__dict__", {}).items()):
+            if isinstance(v, (torch.Tensor, torch.nn.Module, bool, int, float, str, tuple, list)):
+                h.update(k.encode())
+                digest(h, v, depth + 1)
+        if hasattr(value, "previous_controlnet"):
+            digest(h, value.previous_controlnet, depth + 1)
+
+
+def model_digest(h, model_patcher, samples=4096):
+    """Identifies the model by its class, dtype, the first values of a few of its weights, the weight patches and the object patches."""
+    model = model_patcher.model
+    h.update("{}{}".format(type(model).__name__, model_patcher.model_dtype()).encode())
+    state_dict = model.state_dict()
+    keys = list(state_dict.keys())
+    h.update("{}".format(len(keys)).encode())
+    for k in keys[:2] + keys[len(keys) // 2:len(keys) // 2 + 1] + keys[-2:]:
+        h.update(k.encode())
+        digest(h, state_dict[k].flatten()[:samples])
+    for k in sorted(model_patcher.patches.keys()):
+        h.update(k.encode())
+        # (strength_patch, value, strength_model, offset, function), value holds the lora weights
+        digest(h, model_patcher.patches[k])
+    digest(h, getattr(model_patcher, "object_patches", {}))
+
+
+def signature(model_patcher, *values) -> str:
+    h = hashlib.sha256()
+    model_digest(h, model_patcher)
+    for v in values:
+        digest(h, v)
+    return h.hexdigest()[:32]
+
+
+def prune(directory, max_age=MAX_AGE):
+    """Deletes the checkpoints that weren't updated in max_age seconds."""
+    if not os.path.isdir(directory):
+        return
+    now = time.time()
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if os.path.isdir(path) and now - os.path.getmtime(path) > max_age:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+class SamplerCheckpoint:
+    def __init__(self, directory, signature, total_steps, every_steps=0, every_minutes=0, post_cfg_functions=0):
+        self.path = os.path.join(directory, signature)
+        self.total_steps = total_steps
+        self.every_steps = every_steps or 0
+        self.every_seconds = (every_minutes or 0) * 60
+        self.calls = 0
+        self.step = 0
+        self.saved_step = 0
+        self.saved_calls = 0
+        self.save_time = time.perf_counter()
+        self.pending = []
+        self.chunks = []
+        self.chunk = None
+        self.chunk_start = 0
+        self.replay_calls = 0
+        self.disabled = False
+        self.post_cfg_functions = post_cfg_functions
+
+    def load(self):
+        """Finds the saved chunks, returns the number of steps that will be replayed."""
+        if not os.path.isdir(self.path):
+            return 0
+        chunks = []
+        calls = 0
+        step = 0
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith(".safetensors"):
+                continue
+            file = os.path.join(self.path, name)
+            try:
+                with safetensors.safe_open(file, framework="pt") as f:
+                    metadata = f.metadata()
+                start, count = int(metadata["start"]), int(metadata["count"])
+                step = int(metadata["step"])
+            except Exception as e:
+                logging.warning("sampler checkpoint: ignoring unreadable chunk {}: {}".format(file, e))
+                break
+            if start != calls:
+                break
+            chunks.append((file, start, count))
+            calls += count
+        self.chunks = chunks
+        self.replay_calls = calls
+        self.saved_calls = calls
+        self.saved_step = step
+        return step if calls > 0 else 0
+
+    def replayed(self, index, timestep):
+        """The saved output of model call index or None."""
+        if self.disabled or index >= self.replay_calls:
+            return None
+        if self.chunk is None or not (self.chunk_start <= index < self.chunk_start + len(self.chunk)):
+            for file, start, count in self.chunks:
+                if start <= index < start + count:
+                    sd = safetensors.torch.load_file(file)
+                    self.chunk = [(sd["timestep.{}".format(i)], sd["output.{}".format(i)]) for i in range(start, start + count)]
+                    self.chunk_start = start
+                    break
+        saved_timestep, output = self.chunk[index - self.chunk_start]
+        if saved_timestep.shape != timestep.shape or not torch.allclose(saved_timestep, timestep.detach().to("cpu", saved_timestep.dtype)):
+            logging.warning("sampler checkpoint: the model calls don't match the checkpoint at call {}, not resuming.".format(index))
+            self.disable()
+            return None
+        return output
+
+    def predict_noise(self, executor, x, timestep, model_options={}, seed=None):
+        index = self.calls
+        self.calls += 1
+        if index == 0 and len(model_options.get("sampler_post_cfg_function", [])) > self.post_cfg_functions:
+            # the CFG++ samplers get the uncond prediction from a post cfg function, which the replay doesn't call
+            logging.info("sampler checkpoint: not supported by this sampler.")
+            self.disable()
+        output = self.replayed(index, timestep)
+        if output is not None:
+            return output.to(device=x.device)
+        if index < self.replay_calls:
+            self.replay_calls = index
+        out = executor.execute(x, timestep, model_options, seed)
+        if not self.disabled:
+            self.pending.append((timestep.detach().to("cpu", torch.float32), out.detach().to("cpu")))
+        return out
+
+    def step_done(self, step):
+        self.step = step + 1
+        if self.disabled or self.calls <= self.replay_calls:
+            return
+        if self.every_steps > 0 and self.step - self.saved_step >= self.every_steps:
+            self.save()
+        elif self.every_seconds > 0 and time.perf_counter() - self.save_time >= self.every_seconds:
+            self.save()
+
+    def wrap_callback(self, callback):
+        def checkpoint_callback(step, x0, x, total_steps):
+            if callback is not None:
+                callback(step, x0, x, total_steps)
+            self.step_done(step)
+        return checkpoint_callback
+
+    def save(self):
+        if self.disabled or len(self.pending) == 0:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        start = self.saved_calls
+        sd = {}
+        for i, (timestep, output) in enumerate(self.pending):
+            sd["timestep.{}".format(start + i)] = timestep.contiguous()
+            sd["output.{}".format(start + i)] = output.contiguous()
+        metadata = {"start": str(start), "count": str(len(self.pending)), "step": str(self.step), "total_steps": str(self.total_steps)}
+        file = os.path.join(self.path, "{:06d}.safetensors".format(start))
+        temp = os.path.join(self.path, ".{:06d}.{}.tmp".format(start, os.getpid()))
+        safetensors.torch.save_file(sd, temp, metadata=metadata)
+        os.replace(temp, file)
+        logging.info("sampler checkpoint: saved step {}/{} ({} model calls)".format(self.step, self.total_steps, start + len(self.pending)))
+        self.saved_calls = start + len(self.pending)
+        self.saved_step = self.step
+        self.save_time = time.perf_counter()
+        self.pending = []
+
+    def disable(self):
+        self.disabled = True
+        self.pending = []
+        self.chunk = None
+        self.remove()
+
+    def remove(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def start(model_patcher, model_options, total_steps, *values):
+    """Sets up the checkpoint of a sampling run identified by values, resuming from a saved checkpoint if there is one."""
+    directory = checkpoint_directory()
+    prune(directory)
+    checkpoint = SamplerCheckpoint(directory, signature(model_patcher, model_options, *values), total_steps, args.sampler_checkpoint_steps, args.sampler_checkpoint_minutes,
+                                   post_cfg_functions=len(model_options.get("sampler_post_cfg_function", [])))
+    step = checkpoint.load()
+    if step > 0:
+        logging.info("sampler checkpoint: resuming from step {}/{}, replaying {} model calls.".format(step, total_steps, checkpoint.replay_calls))
+    return checkpoint
@@ -9,15 +9,20 @@ if TYPE_CHECKING:
 import torch
 from functools import partial
 import collections
+import weakref
+import hashlib
 from comfy import model_management
 import math
 import logging
 import comfy.sampler_helpers
+import comfy.conds
 import comfy.model_patcher
 import comfy.patcher_extension
 import comfy.hooks
 import comfy.context_windows
+import comfy.sampler_checkpoint
 import comfy.utils
+from comfy.cli_args import args
 import scipy.stats
 import numpy
 
@@ -200,6 +205,77 @@ def finalize_default_conds(model: 'BaseModel', hooked_to_run: dict[comfy.hooks.H
             hooked_to_run.setdefault(p.hooks, list())
             hooked_to_run[p.hooks] += [(p, i)]
 
+def cond_plan_key(p, cond_index):
+    return (p.uuid, cond_index, tuple(p.input_x.shape), p.patches is None, tuple((k, tuple(v.size())) for k, v in p.conditioning.items()))
+
+def plan_cond_batches(model: BaseModel, to_run: list[tuple[tuple,int]], x_in: torch.Tensor, memory_required: dict):
+    """Groups the indexes of to_run into the model calls, the largest batches of concatable conds that fit in memory."""
+    remaining = list(range(len(to_run)))
+    batches = []
+    free_memory = None
+    while len(remaining) > 0:
+        first = to_run[remaining[0]]
+        first_shape = first[0][0].shape
+        to_batch_temp = []
+        for x in remaining:
+            if can_concat_cond(to_run[x][0], first[0]):
+                to_batch_temp += [x]
+
+        to_batch_temp.reverse()
+        to_batch = to_batch_temp[:1]
+
+        if free_memory is None:
+            free_memory = model_management.get_free_memory(x_in.device)
+        for i in range(1, len(to_batch_temp) + 1):
+            batch_amount = to_batch_temp[:len(to_batch_temp)//i]
+            input_shape = [len(batch_amount) * first_shape[0]] + list(first_shape)[1:]
+            cond_shapes = collections.defaultdict(list)
+            for tt in batch_amount:
+                for k, v in to_run[tt][0].conditioning.items():
+                    cond_shapes[k].append(v.size())
+
+            key = (tuple(input_shape), tuple((k, tuple(tuple(s) for s in v)) for k, v in cond_shapes.items()))
+            memory = memory_required.get(key, None)
+            if memory is None:
+                memory = model.memory_required(input_shape, cond_shapes=cond_shapes)
+                memory_required[key] = memory
+            if memory * 1.5 < free_memory:
+                to_batch = batch_amount
+                break
+
+        batches.append(to_batch)
+        for x in to_batch:
+            remaining.remove(x)
+    return batches
+
+class CondBatchPlanner:
+    """
+    Caches how the conds are batched into model calls for a sampling run, the plan only changes when the
+    set of active conds changes (timestep ranges) so it's computed once instead of on every step.
+    """
+    def __init__(self, max_plans=16):
+        self.max_plans = max_plans
+        self.plans = collections.OrderedDict()
+        self.memory_required = {}
+        self.forwards = [] # number of model calls of every calc_cond_batch call
+        self.hits = 0
+        self.misses = 0
+
+    def plan(self, model: BaseModel, hooks, to_run: list[tuple[tuple,int]], x_in: torch.Tensor):
+        key = (hooks, tuple(x_in.shape), tuple(cond_plan_key(p, i) for p, i in to_run))
+        batches = self.plans.get(key, None)
+        if batches is not None:
+            self.hits += 1
+            self.plans.move_to_end(key)
+            return batches
+
+        self.misses += 1
+        batches = plan_cond_batches(model, to_run, x_in, self.memory_required)
+        self.plans[key] = batches
+        if len(self.plans) > self.max_plans:
+            self.plans.popitem(last=False)
+        return batches
+
 def calc_cond_batch(model: BaseModel, conds: list[list[dict]], x_in: torch.Tensor, timestep, model_options: dict[str]):
     handler: comfy.context_windows.ContextHandlerABC = model_options.get("context_handler", None)
     if handler is None or not handler.should_use_context(model, conds, x_in, timestep, model_options):
@@ -247,33 +323,14 @@ def _calc_cond_batch(model: BaseModel, conds: list[list[dict]], x_in: torch.Tens
 
     model.current_patcher.prepare_state(timestep)
 
+    planner: CondBatchPlanner = model_options.get("cond_batch_planner", None)
+    if planner is None:
+        planner = CondBatchPlanner()
+    forwards = 0
+
     # run every hooked_to_run separately
     for hooks, to_run in hooked_to_run.items():
-        while len(to_run) > 0:
-            first = to_run[0]
-            first_shape = first[0][0].shape
-            to_batch_temp = []
-            for x in range(len(to_run)):
-                if can_concat_cond(to_run[x][0], first[0]):
-                    to_batch_temp += [x]
-
-            to_batch_temp.reverse()
-            to_batch = to_batch_temp[:1]
-
-            free_memory = model_management.get_free_memory(x_in.device)
-            for i in range(1, len(to_batch_temp) + 1):
-                batch_amount = to_batch_temp[:len(to_batch_temp)//i]
-                input_shape = [len(batch_amount) * first_shape[0]] + list(first_shape)[1:]
-                cond_shapes = collections.defaultdict(list)
-                for tt in batch_amount:
-                    cond = {k: v.size() for k, v in to_run[tt][0].conditioning.items()}
-                    for k, v in to_run[tt][0].conditioning.items():
-                        cond_shapes[k].append(v.size())
-
-                if model.memory_required(input_shape, cond_shapes=cond_shapes) * 1.5 < free_memory:
-                    to_batch = batch_amount
-                    break
-
+        for to_batch in planner.plan(model, hooks, to_run, x_in):
             input_x = []
             mult = []
             c = []
@@ -283,7 +340,7 @@ def _calc_cond_batch(model: BaseModel, conds: list[list[dict]], x_in: torch.Tens
             control = None
             patches = None
             for x in to_batch:
-                o = to_run.pop(x)
+                o = to_run[x]
                 p = o[0]
                 input_x.append(p.input_x)
                 mult.append(p.mult)
@@ -331,6 +388,7 @@ def _calc_cond_batch(model: BaseModel, conds: list[list[dict]], x_in: torch.Tens
                 output = model_options['model_function_wrapper'](model.apply_model, {"input": input_x, "timestep": timestep_, "c": c, "cond_or_uncond": cond_or_uncond}).chunk(batch_chunks)
             else:
                 output = model.apply_model(input_x, timestep_, **c).chunk(batch_chunks)
+            forwards += 1
 
             for o in range(batch_chunks):
                 cond_index = cond_or_uncond[o]
@@ -348,6 +406,8 @@ def _calc_cond_batch(model: BaseModel, conds: list[list[dict]], x_in: torch.Tens
                     out_c += output[o] * mult[o]
                     out_cts += mult[o]
 
+    planner.forwards.append(forwards)
+
     for i in range(len(out_conds)):
         out_conds[i] /= out_counts[i]
 
@@ -745,7 +805,11 @@ class KSAMPLER(Sampler):
         model_k.latent_image = latent_image
         if self.inpaint_options.get("random", False): #TODO: Should this be the default?
             generator = torch.manual_seed(extra_args.get("seed", 41) + 1)
-            model_k.noise = torch.randn(noise.shape, generator=generator, device="cpu").to(noise.dtype).to(noise.device)
+            batch_slice = k_diffusion_sampling.get_batch_slice(noise)
+            if batch_slice is not None:
+                model_k.noise = torch.randn([batch_slice[0]] + list(noise.shape[1:]), generator=generator, device="cpu")[batch_slice[1]:batch_slice[2]].to(noise.dtype).to(noise.device)
+            else:
+                model_k.noise = torch.randn(noise.shape, generator=generator, device="cpu").to(noise.dtype).to(noise.device)
         else:
             model_k.noise = noise
 
@@ -889,6 +953,22 @@ def get_total_hook_groups_in_conds(conds: dict[str, list[dict[str]]]):
             hooks_set.add(kk.get('hooks', None))
     return len(hooks_set)
 
+def get_hook_groups_in_conds(conds: dict[str, list[dict[str]]]) -> list[comfy.hooks.HookGroup]:
+    hook_groups = []
+    for k in conds:
+        for kk in conds[k]:
+            hooks = kk.get('hooks', None)
+            if hooks is not None and hooks not in hook_groups:
+                hook_groups.append(hooks)
+    return hook_groups
+
+def has_hook_keyframes_in_conds(conds: dict[str, list[dict[str]]]):
+    for hooks in get_hook_groups_in_conds(conds):
+        for hook in hooks.hooks:
+            if len(hook.hook_keyframe.keyframes) > 1:
+                return True
+    return False
+
 
 def cast_to_load_options(model_options: dict[str], device=None, dtype=None):
     '''
@@ -939,12 +1019,31 @@ def cast_to_load_options(model_options: dict[str], device=None, dtype=None):
                                 wc_list[i] = wc_list[i].to(cast)
 
 
+def slice_conds_batch(conds, batch_size, start, end):
+    """The conds for the latents start:end of a batch, the cond tensors that have one entry per latent are sliced."""
+    def slice_value(v):
+        if torch.is_tensor(v) and v.ndim > 0 and v.shape[0] == batch_size:
+            return v[start:end]
+        return v
+
+    out = {}
+    for k in conds:
+        out[k] = []
+        for c in conds[k]:
+            c = {n: slice_value(v) for n, v in c.items()}
+            model_conds = c.get("model_conds", None)
+            if model_conds is not None:
+                c["model_conds"] = {n: v._copy_with(slice_value(v.cond)) if isinstance(v, comfy.conds.CONDRegular) else v for n, v in model_conds.items()}
+            out[k].append(c)
+    return out
+
 class CFGGuider:
     def __init__(self, model_patcher: ModelPatcher):
         self.model_patcher = model_patcher
         self.model_options = model_patcher.model_options
         self.original_conds = {}
         self.cfg = 1.0
+        self.sampler_checkpoint = None
 
     def set_conds(self, positive, negative):
         self.inner_set_conds({"positive": positive, "negative": negative})
@@ -960,11 +1059,14 @@ class CFGGuider:
         return self.outer_predict_noise(*args, **kwargs)
 
     def outer_predict_noise(self, x, timestep, model_options={}, seed=None):
-        return comfy.patcher_extension.WrapperExecutor.new_class_executor(
+        executor = comfy.patcher_extension.WrapperExecutor.new_class_executor(
             self.predict_noise,
             self,
             comfy.patcher_extension.get_all_wrappers(comfy.patcher_extension.WrappersMP.PREDICT_NOISE, self.model_options, is_model_options=True)
-        ).execute(x, timestep, model_options, seed)
+        )
+        if self.sampler_checkpoint is not None:
+            return self.sampler_checkpoint.predict_noise(executor, x, timestep, model_options, seed)
+        return executor.execute(x, timestep, model_options, seed)
 
     def predict_noise(self, x, timestep, model_options={}, seed=None):
         return sampling_function(self.inner_model, x, timestep, self.conds.get("negative", None), self.conds.get("positive", None), self.cfg, model_options=model_options, seed=seed)
@@ -974,9 +1076,15 @@ class CFGGuider:
             latent_image = self.inner_model.process_latent_in(latent_image)
 
         self.conds = process_conds(self.inner_model, noise, self.conds, device, latent_image, denoise_mask, seed)
+        if args.precompute_hook_weights:
+            hook_groups = get_hook_groups_in_conds(self.conds)
+            if len(hook_groups) > 0:
+                self.model_patcher.precompute_hook_weights(hook_groups, sigmas)
 
         extra_model_options = comfy.model_patcher.create_model_options_clone(self.model_options)
         extra_model_options.setdefault("transformer_options", {})["sample_sigmas"] = sigmas
+        self.cond_batch_planner = CondBatchPlanner()
+        extra_model_options["cond_batch_planner"] = self.cond_batch_planner
         extra_args = {"model_options": extra_model_options, "seed": seed}
 
         executor = comfy.patcher_extension.WrapperExecutor.new_class_executor(
@@ -984,7 +1092,25 @@ class CFGGuider:
             sampler,
             comfy.patcher_extension.get_all_wrappers(comfy.patcher_extension.WrappersMP.SAMPLER_SAMPLE, extra_args["model_options"], is_model_options=True)
         )
-        samples = executor.execute(self, sigmas, extra_args, callback, noise, latent_image, denoise_mask, disable_pbar)
+        if comfy.sampler_checkpoint.enabled():
+            settings = {k: v for k, v in vars(self).items() if isinstance(v, (int, float, str))}
+            self.sampler_checkpoint = comfy.sampler_checkpoint.start(self.model_patcher, self.model_options, len(sigmas) - 1, noise, latent_image, denoise_mask, sigmas, seed,
+                                                                     self.conds, settings, getattr(sampler, "__dict__", sampler))
+            callback = self.sampler_checkpoint.wrap_callback(callback)
+
+        try:
+            samples = executor.execute(self, sigmas, extra_args, callback, noise, latent_image, denoise_mask, disable_pbar)
+        except BaseException:
+            if self.sampler_checkpoint is not None:
+                self.sampler_checkpoint.save()
+            raise
+        finally:
+            checkpoint = self.sampler_checkpoint
+            self.sampler_checkpoint = None
+        if checkpoint is not None:
+            checkpoint.remove()
+        planner = self.cond_batch_planner
+        logging.debug("cond batching: {} model calls in {} steps, {} batch plans computed, {} reused".format(sum(planner.forwards), len(planner.forwards), planner.misses, planner.hits))
         return self.inner_model.process_latent_out(samples.to(torch.float32))
 
     def outer_sample(self, noise, latent_image, sampler, sigmas, denoise_mask=None, callback=None, disable_pbar=False, seed=None):
@@ -1010,21 +1136,65 @@ class CFGGuider:
         del self.loaded_models
         return output
 
+    def micro_batches(self, noise_shape):
+        """Splits the latent batch into (start, end) chunks of similar sizes, as large as possible with the model calls fitting in memory."""
+        batch_size = noise_shape[0]
+        for k in self.original_conds:
+            for c in self.original_conds[k]:
+                control = c.get("control", None)
+                while control is not None:
+                    hint = control.cond_hint_original
+                    if hint is not None and batch_size > 1 and hint.shape[0] == batch_size:
+                        logging.info("micro batch sampling: not splitting the batch, a controlnet has a hint per latent.")
+                        return [(0, batch_size)]
+                    control = control.previous_controlnet
+
+        free_memory = model_management.get_free_memory(self.model_patcher.load_device) + self.model_patcher.loaded_size() - self.model_patcher.model_size()
+        chunk_size = 1
+        for b in range(batch_size, 0, -1):
+            memory_required = comfy.sampler_helpers.estimate_memory(self.model_patcher, [b] + list(noise_shape[1:]), self.original_conds)[0]
+            if memory_required * 1.5 < free_memory:
+                chunk_size = b
+                break
+
+        chunks = math.ceil(batch_size / chunk_size)
+        chunk_size = math.ceil(batch_size / chunks)
+        return [(start, min(start + chunk_size, batch_size)) for start in range(0, batch_size, chunk_size)]
+
     def sample(self, noise, latent_image, sampler, sigmas, denoise_mask=None, callback=None, disable_pbar=False, seed=None):
         if sigmas.shape[-1] == 0:
             return latent_image
 
+        if args.micro_batch_sampling and noise.shape[0] > 1:
+            batch_size = noise.shape[0]
+            chunks = self.micro_batches(noise.shape)
+            if len(chunks) > 1:
+                logging.info("micro batch sampling: sampling the batch of {} in chunks of {}".format(batch_size, [end - start for start, end in chunks]))
+                output = []
+                for start, end in chunks:
+                    mask = denoise_mask
+                    if mask is not None and mask.shape[0] == batch_size:
+                        mask = mask[start:end]
+                    with k_diffusion_sampling.batch_slice(batch_size, start, end):
+                        output.append(self.sample_batch(noise[start:end], latent_image[start:end], sampler, sigmas, mask, callback, disable_pbar, seed, batch_slice=(batch_size, start, end)))
+                return torch.cat(output)
+
+        return self.sample_batch(noise, latent_image, sampler, sigmas, denoise_mask, callback, disable_pbar, seed)
+
+    def sample_batch(self, noise, latent_image, sampler, sigmas, denoise_mask=None, callback=None, disable_pbar=False, seed=None, batch_slice=None):
         self.conds = {}
         for k in self.original_conds:
             self.conds[k] = list(map(lambda a: a.copy(), self.original_conds[k]))
+        if batch_slice is not None:
+            self.conds = slice_conds_batch(self.conds, *batch_slice)
         preprocess_conds_hooks(self.conds)
 
         try:
             orig_model_options = self.model_options
             self.model_options = comfy.model_patcher.create_model_options_clone(self.model_options)
-            # if one hook type (or just None), then don't bother caching weights for hooks (will never change after first step)
+            # if one hook type (or just None) without keyframes, then don't bother caching weights for hooks (will never change after first step)
             orig_hook_mode = self.model_patcher.hook_mode
-            if get_total_hook_groups_in_conds(self.conds) <= 1:
+            if get_total_hook_groups_in_conds(self.conds) <= 1 and not has_hook_keyframes_in_conds(self.conds):
                 self.model_patcher.hook_mode = comfy.hooks.EnumHookMode.MinVram
             comfy.sampler_helpers.prepare_model_patcher(self.model_patcher, self.conds, self.model_options)
             filter_registered_hooks_on_conds(self.conds, self.model_options)
@@ -1073,15 +1243,59 @@ SCHEDULER_HANDLERS = {
 }
 SCHEDULER_NAMES = list(SCHEDULER_HANDLERS)
 
+SIGMAS_CACHE_SIZE = 256
+sigmas_cache = collections.OrderedDict()
+model_sampling_keys = weakref.WeakKeyDictionary()
+
+def model_sampling_key(model_sampling):
+    """Identifies the sigma schedule of a model_sampling object by its classes, settings and buffers."""
+    settings = tuple(sorted((k, v) for k, v in getattr(model_sampling, "__dict__", {}).items() if isinstance(v, (bool, int, float, str))))
+    buffers = list(model_sampling.named_buffers()) if isinstance(model_sampling, torch.nn.Module) else []
+    check = (settings, tuple((k, id(b), b._version) for k, b in buffers))
+    try:
+        cached = model_sampling_keys.get(model_sampling, None)
+    except TypeError:
+        cached = None
+    if cached is not None and cached[0] == check:
+        return cached[1]
+
+    h = hashlib.sha1()
+    h.update(repr(([c.__module__ + "." + c.__qualname__ for c in type(model_sampling).__mro__], settings)).encode())
+    for k, b in buffers:
+        h.update("{}{}{}".format(k, b.dtype, tuple(b.shape)).encode())
+        h.update(b.detach().to("cpu", torch.float64).numpy().tobytes())
+    key = h.hexdigest()
+    try:
+        model_sampling_keys[model_sampling] = (check, key)
+    except TypeError:
+        pass
+    return key
+
+def cached_sigmas(model_sampling, key, calculate: Callable[[], torch.Tensor]) -> torch.Tensor:
+    """Memoizes the sigmas returned by calculate for the schedule of model_sampling and key (scheduler settings and steps), returns a copy."""
+    key = (model_sampling_key(model_sampling), key)
+    sigmas = sigmas_cache.get(key, None)
+    if sigmas is None:
+        sigmas = calculate()
+        sigmas_cache[key] = sigmas.clone()
+        if len(sigmas_cache) > SIGMAS_CACHE_SIZE:
+            sigmas_cache.popitem(last=False)
+        return sigmas
+    sigmas_cache.move_to_end(key)
+    return sigmas.clone()
+
 def calculate_sigmas(model_sampling: object, scheduler_name: str, steps: int) -> torch.Tensor:
     handler = SCHEDULER_HANDLERS.get(scheduler_name)
     if handler is None:
         err = f"error invalid scheduler {scheduler_name}"
         logging.error(err)
         raise ValueError(err)
-    if handler.use_ms:
-        return handler.handler(model_sampling, steps)
-    return handler.handler(n=steps, sigma_min=float(model_sampling.sigma_min), sigma_max=float(model_sampling.sigma_max))
+
+    def calculate():
+        if handler.use_ms:
+            return handler.handler(model_sampling, steps)
+        return handler.handler(n=steps, sigma_min=float(model_sampling.sigma_min), sigma_max=float(model_sampling.sigma_max))
+    return cached_sigmas(model_sampling, (scheduler_name, handler, steps), calculate)
 
 def sampler_object(name):
     if name == "uni_pc":
@@ -1,5 +1,6 @@
 from __future__ import annotations
 import json
+import uuid
 import torch
 from enum import Enum
 import logging
@@ -24,6 +25,8 @@ import math
 import os
 
 import comfy.utils
+import comfy.model_store
+import comfy.conditioning_cache
 
 from . import clip_vision
 from . import gligen
@@ -130,6 +133,7 @@ class CLIP:
         self.use_clip_schedule = False
         logging.info("CLIP/text encoder model load device: {}, offload device: {}, current: {}, dtype: {}".format(load_device, offload_device, params['device'], dtype))
         self.tokenizer_options = {}
+        self.weights_signature = None
 
     def clone(self):
         n = CLIP(no_init=True)
@@ -140,6 +144,7 @@ class CLIP:
         n.tokenizer_options = self.tokenizer_options.copy()
         n.use_clip_schedule = self.use_clip_schedule
         n.apply_hooks_to_conds = self.apply_hooks_to_conds
+        n.weights_signature = self.weights_signature
         return n
 
     def add_patches(self, patches, strength_patch=1.0, strength_model=1.0):
@@ -222,29 +227,54 @@ class CLIP:
             all_hooks.reset()
         return all_cond_pooled
 
+    def conditioning_cache_key(self, tokens, return_pooled):
+        """Returns (key, persistent) for the conditioning cache or (None, False) if the output can't be cached."""
+        if not comfy.conditioning_cache.enabled() or self.patcher.forced_hooks is not None:
+            return None, False
+
+        patched = len(self.patcher.patches) > 0 or len(self.patcher.object_patches) > 0
+        weights = self.weights_signature
+        if weights is None:
+            weights = getattr(self.cond_stage_model, "conditioning_cache_uuid", None)
+            if weights is None:
+                weights = str(uuid.uuid4())
+                self.cond_stage_model.conditioning_cache_uuid = weights
+        identity = [weights, str(self.patcher.patches_uuid) if patched else None]
+        options = {"layer_idx": self.layer_idx, "unprojected": return_pooled == "unprojected", "tokenizer_options": self.tokenizer_options, "load_device": str(self.patcher.load_device)}
+        key = comfy.conditioning_cache.cache_key(identity, options, tokens)
+        return key, self.weights_signature is not None and not patched
+
     def encode_from_tokens(self, tokens, return_pooled=False, return_dict=False):
-        self.cond_stage_model.reset_clip_options()
+        key, persistent = self.conditioning_cache_key(tokens, return_pooled)
+        out = None
+        if key is not None:
+            out = comfy.conditioning_cache.get(key, persistent, device=model_management.intermediate_device())
+
+        if out is None:
+            self.cond_stage_model.reset_clip_options()
 
-        if self.layer_idx is not None:
-            self.cond_stage_model.set_clip_options({"layer": self.layer_idx})
+            if self.layer_idx is not None:
+                self.cond_stage_model.set_clip_options({"layer": self.layer_idx})
 
-        if return_pooled == "unprojected":
-            self.cond_stage_model.set_clip_options({"projected_pooled": False})
+            if return_pooled == "unprojected":
+                self.cond_stage_model.set_clip_options({"projected_pooled": False})
 
-        self.load_model()
-        o = self.cond_stage_model.encode_token_weights(tokens)
-        cond, pooled = o[:2]
-        if return_dict:
-            out = {"cond": cond, "pooled_output": pooled}
+            self.load_model()
+            o = self.cond_stage_model.encode_token_weights(tokens)
+            out = {"cond": o[0], "pooled_output": o[1]}
             if len(o) > 2:
                 for k in o[2]:
                     out[k] = o[2][k]
+            if key is not None:
+                out = comfy.conditioning_cache.put(key, out, persistent)
+
+        if return_dict:
             self.add_hooks_to_dict(out)
             return out
 
         if return_pooled:
-            return cond, pooled
-        return cond
+            return out["cond"], out["pooled_output"]
+        return out["cond"]
 
     def encode(self, text):
         tokens = self.tokenize(text)
@@ -585,17 +615,46 @@ class VAE:
                 pixels = pixels.narrow(d + 1, x_offset, x)
         return pixels
 
+    def plan_tiles(self, memory_used, samples, tile, overlap, min_tile=None):
+        free_memory = model_management.get_free_memory(self.device)
+        return comfy.utils.plan_tiled_scale(samples.shape, tile, overlap, lambda shape: memory_used(shape, self.vae_dtype), free_memory, min_tile=min_tile)
+
+    def tile_batch_size(self, memory_used, samples, tile):
+        # the tiles are batched into the memory left after the margin that model loading keeps free for inference
+        free_memory = max(0, model_management.get_free_memory(self.device) - model_management.minimum_inference_memory())
+        return comfy.utils.plan_tiled_scale(samples.shape, tile, 0, lambda shape: memory_used(shape, self.vae_dtype), free_memory, min_tile=tile)[2]
+
+    def split_on_oom(self, function, max_batch):
+        """Wraps the tile function so the batches that run out of memory are split in half and retried."""
+        limit = [max(1, max_batch)]
+
+        def run(x):
+            if x.shape[0] > limit[0]:
+                return torch.cat([run(c) for c in x.split(limit[0])])
+            try:
+                return function(x)
+            except model_management.OOM_EXCEPTION:
+                if x.shape[0] <= 1:
+                    raise
+            # retried outside of the except block so the tensors referenced by the exception can be freed
+            limit[0] = max(1, x.shape[0] // 2)
+            logging.warning("Warning: Ran out of memory when VAE processing {} tiles at once, retrying with {}.".format(x.shape[0], limit[0]))
+            model_management.soft_empty_cache()
+            return run(x)
+        return run
+
     def decode_tiled_(self, samples, tile_x=64, tile_y=64, overlap = 16):
+        max_batch = self.tile_batch_size(self.memory_used_decode, samples, (tile_y, tile_x))
         steps = samples.shape[0] * comfy.utils.get_tiled_scale_steps(samples.shape[3], samples.shape[2], tile_x, tile_y, overlap)
         steps += samples.shape[0] * comfy.utils.get_tiled_scale_steps(samples.shape[3], samples.shape[2], tile_x // 2, tile_y * 2, overlap)
         steps += samples.shape[0] * comfy.utils.get_tiled_scale_steps(samples.shape[3], samples.shape[2], tile_x * 2, tile_y // 2, overlap)
         pbar = comfy.utils.ProgressBar(steps)
 
-        decode_fn = lambda a: self.first_stage_model.decode(a.to(self.vae_dtype).to(self.device)).float()
+        decode_fn = self.split_on_oom(lambda a: self.first_stage_model.decode(a.to(self.vae_dtype).to(self.device)).float(), max_batch)
         output = self.process_output(
-            (comfy.utils.tiled_scale(samples, decode_fn, tile_x // 2, tile_y * 2, overlap, upscale_amount = self.upscale_ratio, output_device=self.output_device, pbar = pbar) +
-            comfy.utils.tiled_scale(samples, decode_fn, tile_x * 2, tile_y // 2, overlap, upscale_amount = self.upscale_ratio, output_device=self.output_device, pbar = pbar) +
-             comfy.utils.tiled_scale(samples, decode_fn, tile_x, tile_y, overlap, upscale_amount = self.upscale_ratio, output_device=self.output_device, pbar = pbar))
+            (comfy.utils.tiled_scale(samples, decode_fn, tile_x // 2, tile_y * 2, overlap, upscale_amount = self.upscale_ratio, output_device=self.output_device, pbar = pbar, max_batch=max_batch) +
+            comfy.utils.tiled_scale(samples, decode_fn, tile_x * 2, tile_y // 2, overlap, upscale_amount = self.upscale_ratio, output_device=self.output_device, pbar = pbar, max_batch=max_batch) +
+             comfy.utils.tiled_scale(samples, decode_fn, tile_x, tile_y, overlap, upscale_amount = self.upscale_ratio, output_device=self.output_device, pbar = pbar, max_batch=max_batch))
             / 3.0)
         return output
 
@@ -610,19 +669,21 @@ class VAE:
         return self.process_output(comfy.utils.tiled_scale_multidim(samples, decode_fn, tile=(tile_x,), overlap=overlap, upscale_amount=self.upscale_ratio, out_channels=self.output_channels, output_device=self.output_device))
 
     def decode_tiled_3d(self, samples, tile_t=999, tile_x=32, tile_y=32, overlap=(1, 8, 8)):
-        decode_fn = lambda a: self.first_stage_model.decode(a.to(self.vae_dtype).to(self.device)).float()
-        return self.process_output(comfy.utils.tiled_scale_multidim(samples, decode_fn, tile=(tile_t, tile_x, tile_y), overlap=overlap, upscale_amount=self.upscale_ratio, out_channels=self.output_channels, index_formulas=self.upscale_index_formula, output_device=self.output_device))
+        max_batch = self.tile_batch_size(self.memory_used_decode, samples, (tile_t, tile_x, tile_y))
+        decode_fn = self.split_on_oom(lambda a: self.first_stage_model.decode(a.to(self.vae_dtype).to(self.device)).float(), max_batch)
+        return self.process_output(comfy.utils.tiled_scale_multidim(samples, decode_fn, tile=(tile_t, tile_x, tile_y), overlap=overlap, upscale_amount=self.upscale_ratio, out_channels=self.output_channels, index_formulas=self.upscale_index_formula, output_device=self.output_device, max_batch=max_batch))
 
     def encode_tiled_(self, pixel_samples, tile_x=512, tile_y=512, overlap = 64):
         steps = pixel_samples.shape[0] * comfy.utils.get_tiled_scale_steps(pixel_samples.shape[3], pixel_samples.shape[2], tile_x, tile_y, overlap)
         steps += pixel_samples.shape[0] * comfy.utils.get_tiled_scale_steps(pixel_samples.shape[3], pixel_samples.shape[2], tile_x // 2, tile_y * 2, overlap)
         steps += pixel_samples.shape[0] * comfy.utils.get_tiled_scale_steps(pixel_samples.shape[3], pixel_samples.shape[2], tile_x * 2, tile_y // 2, overlap)
         pbar = comfy.utils.ProgressBar(steps)
+        max_batch = self.tile_batch_size(self.memory_used_encode, pixel_samples, (tile_y, tile_x))
 
-        encode_fn = lambda a: self.first_stage_model.encode((self.process_input(a)).to(self.vae_dtype).to(self.device)).float()
-        samples = comfy.utils.tiled_scale(pixel_samples, encode_fn, tile_x, tile_y, overlap, upscale_amount = (1/self.downscale_ratio), out_channels=self.latent_channels, output_device=self.output_device, pbar=pbar)
-        samples += comfy.utils.tiled_scale(pixel_samples, encode_fn, tile_x * 2, tile_y // 2, overlap, upscale_amount = (1/self.downscale_ratio), out_channels=self.latent_channels, output_device=self.output_device, pbar=pbar)
-        samples += comfy.utils.tiled_scale(pixel_samples, encode_fn, tile_x // 2, tile_y * 2, overlap, upscale_amount = (1/self.downscale_ratio), out_channels=self.latent_channels, output_device=self.output_device, pbar=pbar)
+        encode_fn = self.split_on_oom(lambda a: self.first_stage_model.encode((self.process_input(a)).to(self.vae_dtype).to(self.device)).float(), max_batch)
+        samples = comfy.utils.tiled_scale(pixel_samples, encode_fn, tile_x, tile_y, overlap, upscale_amount = (1/self.downscale_ratio), out_channels=self.latent_channels, output_device=self.output_device, pbar=pbar, max_batch=max_batch)
+        samples += comfy.utils.tiled_scale(pixel_samples, encode_fn, tile_x * 2, tile_y // 2, overlap, upscale_amount = (1/self.downscale_ratio), out_channels=self.latent_channels, output_device=self.output_device, pbar=pbar, max_batch=max_batch)
+        samples += comfy.utils.tiled_scale(pixel_samples, encode_fn, tile_x // 2, tile_y * 2, overlap, upscale_amount = (1/self.downscale_ratio), out_channels=self.latent_channels, output_device=self.output_device, pbar=pbar, max_batch=max_batch)
         samples /= 3.0
         return samples
 
@@ -646,8 +707,9 @@ class VAE:
             return out.reshape(samples.shape[0], self.latent_channels, extra_channel_size, -1)
 
     def encode_tiled_3d(self, samples, tile_t=9999, tile_x=512, tile_y=512, overlap=(1, 64, 64)):
-        encode_fn = lambda a: self.first_stage_model.encode((self.process_input(a)).to(self.vae_dtype).to(self.device)).float()
-        return comfy.utils.tiled_scale_multidim(samples, encode_fn, tile=(tile_t, tile_x, tile_y), overlap=overlap, upscale_amount=self.downscale_ratio, out_channels=self.latent_channels, downscale=True, index_formulas=self.downscale_index_formula, output_device=self.output_device)
+        max_batch = self.tile_batch_size(self.memory_used_encode, samples, (tile_t, tile_x, tile_y))
+        encode_fn = self.split_on_oom(lambda a: self.first_stage_model.encode((self.process_input(a)).to(self.vae_dtype).to(self.device)).float(), max_batch)
+        return comfy.utils.tiled_scale_multidim(samples, encode_fn, tile=(tile_t, tile_x, tile_y), overlap=overlap, upscale_amount=self.downscale_ratio, out_channels=self.latent_channels, downscale=True, index_formulas=self.downscale_index_formula, output_device=self.output_device, max_batch=max_batch)
 
     def decode(self, samples_in, vae_options={}):
         self.throw_exception_if_invalid()
@@ -679,11 +741,12 @@ class VAE:
             if dims == 1 or self.extra_1d_channel is not None:
                 pixel_samples = self.decode_tiled_1d(samples_in)
             elif dims == 2:
-                pixel_samples = self.decode_tiled_(samples_in)
+                tile, overlap, _ = self.plan_tiles(self.memory_used_decode, samples_in, (64, 64), 16, min_tile=16)
+                pixel_samples = self.decode_tiled_(samples_in, tile_x=tile[1], tile_y=tile[0], overlap=overlap[0])
             elif dims == 3:
                 tile = 256 // self.spacial_compression_decode()
-                overlap = tile // 4
-                pixel_samples = self.decode_tiled_3d(samples_in, tile_x=tile, tile_y=tile, overlap=(1, overlap, overlap))
+                tile, overlap, _ = self.plan_tiles(self.memory_used_decode, samples_in, (999, tile, tile), (1, tile // 4, tile // 4), min_tile=(999, 8, 8))
+                pixel_samples = self.decode_tiled_3d(samples_in, tile_x=tile[1], tile_y=tile[2], overlap=(1, overlap[1], overlap[2]))
 
         pixel_samples = pixel_samples.to(self.output_device).movedim(1,-1)
         return pixel_samples
@@ -751,13 +814,13 @@ class VAE:
 
         if do_tile:
             if self.latent_dim == 3:
-                tile = 256
-                overlap = tile // 4
-                samples = self.encode_tiled_3d(pixel_samples, tile_x=tile, tile_y=tile, overlap=(1, overlap, overlap))
+                tile, overlap, _ = self.plan_tiles(self.memory_used_encode, pixel_samples, (9999, 256, 256), (1, 64, 64), min_tile=(9999, 64, 64))
+                samples = self.encode_tiled_3d(pixel_samples, tile_x=tile[1], tile_y=tile[2], overlap=(1, overlap[1], overlap[2]))
             elif self.latent_dim == 1 or self.extra_1d_channel is not None:
                 samples = self.encode_tiled_1d(pixel_samples)
             else:
-                samples = self.encode_tiled_(pixel_samples)
+                tile, overlap, _ = self.plan_tiles(self.memory_used_encode, pixel_samples, (512, 512), 64, min_tile=128)
+                samples = self.encode_tiled_(pixel_samples, tile_x=tile[1], tile_y=tile[0], overlap=overlap[0])
 
         return samples
 
@@ -874,7 +937,12 @@ def load_clip(ckpt_paths, embedding_directory=None, clip_type=CLIPType.STABLE_DI
     clip_data = []
     for p in ckpt_paths:
         clip_data.append(comfy.utils.load_torch_file(p, safe_load=True))
-    return load_text_encoder_state_dicts(clip_data, embedding_directory=embedding_directory, clip_type=clip_type, model_options=model_options)
+    clip = load_text_encoder_state_dicts(clip_data, embedding_directory=embedding_directory, clip_type=clip_type, model_options=model_options)
+    clip.weights_signature = comfy.conditioning_cache.file_signature(ckpt_paths, clip_type, clip_weights_options(model_options))
+    return clip
+
+def clip_weights_options(model_options):
+    return sorted((k, str(v)) for k, v in model_options.items())
 
 
 class TEModel(Enum):
@@ -1143,6 +1211,10 @@ def load_checkpoint_guess_config(ckpt_path, output_vae=True, output_clip=True, o
     out = load_state_dict_guess_config(sd, output_vae, output_clip, output_clipvision, embedding_directory, output_model, model_options, te_model_options=te_model_options, metadata=metadata)
     if out is None:
         raise RuntimeError("ERROR: Could not detect model type of: {}\n{}".format(ckpt_path, model_detection_error_hint(ckpt_path, sd)))
+    if out[0] is not None:
+        set_weights_file(out[0], ckpt_path)
+    if out[1] is not None:
+        out[1].weights_signature = comfy.conditioning_cache.file_signature([ckpt_path], clip_weights_options(te_model_options))
     return out
 
 def load_state_dict_guess_config(sd, output_vae=True, output_clip=True, output_clipvision=False, embedding_directory=None, output_model=True, model_options={}, te_model_options={}, metadata=None):
@@ -1171,6 +1243,7 @@ def load_state_dict_guess_config(sd, output_vae=True, output_clip=True, output_c
         weight_dtype = None
 
     model_config.custom_operations = model_options.get("custom_operations", None)
+    model_config.optimizations["weight_quantization"] = model_options.get("weight_quantization", model_management.unet_weight_quantization())
     unet_dtype = model_options.get("dtype", model_options.get("weight_dtype", None))
 
     if unet_dtype is None:
@@ -1185,8 +1258,10 @@ def load_state_dict_guess_config(sd, output_vae=True, output_clip=True, output_c
 
     if output_model:
         inital_load_device = model_management.unet_inital_load_device(parameters, unet_dtype)
-        model = model_config.get_model(sd, diffusion_model_prefix, device=inital_load_device)
+        with comfy.utils.meta_parameter_init(model_management.zero_copy_load(inital_load_device)):
+            model = model_config.get_model(sd, diffusion_model_prefix, device=inital_load_device)
         model.load_model_weights(sd, diffusion_model_prefix)
+        model.weights_prefix = diffusion_model_prefix
 
     if output_vae:
         vae_sd = comfy.utils.state_dict_prefix_replace(sd, {k: "" for k in model_config.vae_key_prefix}, filter_keys=True)
@@ -1226,6 +1301,48 @@ def load_state_dict_guess_config(sd, output_vae=True, output_clip=True, output_c
     return (model_patcher, clip, vae, clipvision)
 
 
+def convert_diffusion_model_state_dict(sd):
+    """
+    Strips the checkpoint prefix from diffusion model weights and converts diffusers format ones.
+
+    Returns:
+        tuple: (state_dict, model_config, prefix). The model_config is None if the model type
+        could not be detected. The prefix is the one that was stripped or None if the keys
+        had to be converted from the diffusers format.
+    """
+    #Allow loading unets from checkpoint files
+    diffusion_model_prefix = model_detection.unet_prefix_from_state_dict(sd)
+    temp_sd = comfy.utils.state_dict_prefix_replace(sd, {diffusion_model_prefix: ""}, filter_keys=True)
+    if len(temp_sd) > 0:
+        sd = temp_sd
+    else:
+        diffusion_model_prefix = ""
+
+    model_config = model_detection.model_config_from_unet(sd, "")
+    if model_config is not None:
+        return sd, model_config, diffusion_model_prefix
+
+    new_sd = model_detection.convert_diffusers_mmdit(sd, "")
+    if new_sd is not None: #diffusers mmdit
+        model_config = model_detection.model_config_from_unet(new_sd, "")
+    else: #diffusers unet
+        model_config = model_detection.model_config_from_diffusers_unet(sd)
+        if model_config is None:
+            return sd, None, None
+
+        diffusers_keys = comfy.utils.unet_to_diffusers(model_config.unet_config)
+
+        new_sd = {}
+        for k in diffusers_keys:
+            if k in sd:
+                new_sd[diffusers_keys[k]] = sd.pop(k)
+            else:
+                logging.warning("{} {}".format(diffusers_keys[k], k))
+
+        if len(sd) > 0:
+            logging.info("left over keys in diffusion model: {}".format(sd.keys()))
+    return new_sd, model_config, None
+
 def load_diffusion_model_state_dict(sd, model_options={}):
     """
     Loads a UNet diffusion model from a state dictionary, supporting both diffusers and regular formats.
@@ -1236,6 +1353,7 @@ def load_diffusion_model_state_dict(sd, model_options={}):
             - dtype: Override model data type
             - custom_operations: Custom model operations
             - fp8_optimizations: Enable FP8 optimizations
+            - weight_quantization: "int8" or "int4" weight only quantization
 
     Returns:
         ModelPatcher: A wrapped model instance that handles device management and weight loading.
@@ -1250,40 +1368,14 @@ def load_diffusion_model_state_dict(sd, model_options={}):
     """
     dtype = model_options.get("dtype", None)
 
-    #Allow loading unets from checkpoint files
-    diffusion_model_prefix = model_detection.unet_prefix_from_state_dict(sd)
-    temp_sd = comfy.utils.state_dict_prefix_replace(sd, {diffusion_model_prefix: ""}, filter_keys=True)
-    if len(temp_sd) > 0:
-        sd = temp_sd
+    new_sd, model_config, weights_prefix = convert_diffusion_model_state_dict(sd)
+    if model_config is None:
+        return None
 
-    parameters = comfy.utils.calculate_parameters(sd)
-    weight_dtype = comfy.utils.weight_dtype(sd)
+    parameters = comfy.utils.calculate_parameters(new_sd)
+    weight_dtype = comfy.utils.weight_dtype(new_sd)
 
     load_device = model_management.get_torch_device()
-    model_config = model_detection.model_config_from_unet(sd, "")
-
-    if model_config is not None:
-        new_sd = sd
-    else:
-        new_sd = model_detection.convert_diffusers_mmdit(sd, "")
-        if new_sd is not None: #diffusers mmdit
-            model_config = model_detection.model_config_from_unet(new_sd, "")
-            if model_config is None:
-                return None
-        else: #diffusers unet
-            model_config = model_detection.model_config_from_diffusers_unet(sd)
-            if model_config is None:
-                return None
-
-            diffusers_keys = comfy.utils.unet_to_diffusers(model_config.unet_config)
-
-            new_sd = {}
-            for k in diffusers_keys:
-                if k in sd:
-                    new_sd[diffusers_keys[k]] = sd.pop(k)
-                else:
-                    logging.warning("{} {}".format(diffusers_keys[k], k))
-
     offload_device = model_management.unet_offload_device()
     unet_weight_dtype = list(model_config.supported_inference_dtypes)
     if model_config.scaled_fp8 is not None:
@@ -1299,24 +1391,85 @@ def load_diffusion_model_state_dict(sd, model_options={}):
     model_config.custom_operations = model_options.get("custom_operations", model_config.custom_operations)
     if model_options.get("fp8_optimizations", False):
         model_config.optimizations["fp8"] = True
+    model_config.optimizations["weight_quantization"] = model_options.get("weight_quantization", model_management.unet_weight_quantization())
 
-    model = model_config.get_model(new_sd, "")
-    model = model.to(offload_device)
+    zero_copy = model_management.zero_copy_load(offload_device)
+    with comfy.utils.meta_parameter_init(zero_copy):
+        model = model_config.get_model(new_sd, "")
+    if not zero_copy:
+        model = model.to(offload_device)
     model.load_model_weights(new_sd, "")
-    left_over = sd.keys()
+    model.weights_prefix = weights_prefix
+    left_over = new_sd.keys()
     if len(left_over) > 0:
         logging.info("left over keys in diffusion model: {}".format(left_over))
     return comfy.model_patcher.ModelPatcher(model, load_device=load_device, offload_device=offload_device)
 
 
-def load_diffusion_model(unet_path, model_options={}):
+def diffusion_model_state_dict_from_file(unet_path, model_options={}):
+    """
+    Loads the diffusion model weights from unet_path.
+
+    When the model store is enabled, diffusion models that have to be converted from the
+    diffusers format (or cast to the dtype in model_options with --model-store-cast-weights)
+    are saved to it after the conversion and memory mapped from it on the next loads.
+
+    Returns:
+        tuple: (state_dict, weights_file, weights_prefix) where weights_file is the file the weights are
+        mapped from and weights_prefix the prefix that was stripped from its keys. weights_prefix is None
+        when the state dict has the keys of the file or doesn't match it anymore.
+    """
+    dtype = model_options.get("dtype", None)
+    kind = "diffusion_model"
+    if dtype is not None and comfy.model_store.cast_weights():
+        kind = "diffusion_model_{}".format(str(dtype).replace("torch.", ""))
+    else:
+        dtype = None
+
+    sd = comfy.model_store.load(unet_path, kind)
+    if sd is not None:
+        return sd, comfy.model_store.store_path(unet_path, kind), ""
+
     sd = comfy.utils.load_torch_file(unet_path)
+    if not comfy.model_store.enabled():
+        return sd, unet_path, None
+
+    new_sd, model_config, weights_prefix = convert_diffusion_model_state_dict(sd)
+    if model_config is None:
+        return sd, unet_path, None
+    if weights_prefix is not None and dtype is None: # stripping the prefix is cheap, the file can be loaded as is
+        return new_sd, unet_path, weights_prefix
+
+    if dtype is not None:
+        for k in new_sd:
+            w = new_sd[k]
+            if w.is_floating_point() and w.ndim >= 2 and model_management.dtype_size(w.dtype) > model_management.dtype_size(dtype):
+                new_sd[k] = w.to(dtype)
+
+    if comfy.model_store.save(unet_path, new_sd, kind):
+        comfy.model_store.remove(unet_path) # the torch.load replacement entry isn't needed anymore
+        stored = comfy.model_store.load(unet_path, kind)
+        if stored is not None:
+            return stored, comfy.model_store.store_path(unet_path, kind), ""
+    return new_sd, unet_path, None
+
+def load_diffusion_model(unet_path, model_options={}):
+    sd, weights_file, weights_prefix = diffusion_model_state_dict_from_file(unet_path, model_options=model_options)
     model = load_diffusion_model_state_dict(sd, model_options=model_options)
     if model is None:
         logging.error("ERROR UNSUPPORTED DIFFUSION MODEL {}".format(unet_path))
         raise RuntimeError("ERROR: Could not detect model type of: {}\n{}".format(unet_path, model_detection_error_hint(unet_path, sd)))
+    set_weights_file(model, weights_file, weights_prefix)
     return model
 
+def set_weights_file(model_patcher, path, weights_prefix=None):
+    # lets the model weights be dropped back to the mmaped file when they are evicted from ram
+    if weights_prefix is not None:
+        model_patcher.model.weights_prefix = weights_prefix  # the prefix of the keys in path, stripped before the sd was loaded
+    if path.lower().endswith(".safetensors") or path.lower().endswith(".sft"):
+        if not comfy.utils.DISABLE_MMAP:
+            model_patcher.model.set_weights_file(path)
+
 def load_unet(unet_path, dtype=None):
     logging.warning("The load_unet function has been deprecated and will be removed please switch to: load_diffusion_model")
     return load_diffusion_model(unet_path, model_options={"dtype": dtype})
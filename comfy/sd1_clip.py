@@ -1,6 +1,8 @@
 import os
+import collections
+import functools
 
-from transformers import CLIPTokenizer
+from transformers import CLIPTokenizer, PreTrainedTokenizerBase
 import comfy.ops
 import torch
 import traceback
@@ -341,6 +343,14 @@ def token_weights(string, current_weight):
             out += [(x, current_weight)]
     return out
 
+@functools.lru_cache(maxsize=256)
+def parse_weighted_prompt(text, disable_weights=False):
+    """Parsed (segment, weight) pairs of text, shared by all the tokenizers that tokenize the same prompt."""
+    text = escape_important(text)
+    if disable_weights:
+        return ((text, 1.0),)
+    return tuple(token_weights(text, 1.0))
+
 def escape_important(text):
     text = text.replace("\\)", "\0\1")
     text = text.replace("\\(", "\0\2")
@@ -388,38 +398,90 @@ def bundled_embed(embed, prefix, suffix): #bundled embedding in lora format
 
     return torch.cat(out_list, dim=0)
 
-def load_embed(embedding_name, embedding_directory, embedding_size, embed_key=None):
+EMBEDDING_EXTENSIONS = ['.safetensors', '.pt', '.bin']
+EMBEDDING_CACHE_MAX_ENTRIES = 128
+TOKENIZE_CACHE_MAX_ENTRIES = 256
+
+# name -> file index of the embedding directories, rebuilt when one of the directories is modified
+embedding_indexes = {}
+# decoded embeddings keyed by file identity
+embedding_cache = collections.OrderedDict()
+
+def build_embedding_index(embedding_directory):
+    files = {}
+    dirs = {}
+    for root in embedding_directory:
+        root = os.path.abspath(root)
+        for dirpath, subdirs, filenames in os.walk(root, followlinks=True):
+            try:
+                dirs[dirpath] = os.path.getmtime(dirpath)
+            except OSError:
+                continue
+            for file_name in filenames:
+                path = os.path.join(dirpath, file_name)
+                # every directory from the root down to the file can be used as the base of the name
+                base = dirpath
+                while True:
+                    files.setdefault(os.path.normcase(os.path.relpath(path, base)), path)
+                    if base == root:
+                        break
+                    base = os.path.dirname(base)
+    return files, dirs
+
+def embedding_index(embedding_directory):
+    key = tuple(embedding_directory)
+    index = embedding_indexes.get(key, None)
+    if index is not None:
+        try:
+            if all(os.path.getmtime(d) == m for d, m in index[1].items()) and all(not os.path.isdir(d) or os.path.abspath(d) in index[1] for d in embedding_directory):
+                return index[0]
+        except OSError:
+            pass
+    index = build_embedding_index(embedding_directory)
+    embedding_indexes[key] = index
+    return index[0]
+
+def find_embed(embedding_name, embedding_directory):
     if isinstance(embedding_directory, str):
         embedding_directory = [embedding_directory]
 
-    embedding_directory = expand_directory_list(embedding_directory)
-
-    valid_file = None
-    for embed_dir in embedding_directory:
-        embed_path = os.path.abspath(os.path.join(embed_dir, embedding_name))
-        embed_dir = os.path.abspath(embed_dir)
-        try:
-            if os.path.commonpath((embed_dir, embed_path)) != embed_dir:
-                continue
-        except:
-            continue
-        if not os.path.isfile(embed_path):
-            extensions = ['.safetensors', '.pt', '.bin']
-            for x in extensions:
-                t = embed_path + x
-                if os.path.isfile(t):
-                    valid_file = t
-                    break
-        else:
-            valid_file = embed_path
-        if valid_file is not None:
-            break
+    name = os.path.normcase(os.path.normpath(embedding_name))
+    if os.path.isabs(name) or name == ".." or name.startswith(".." + os.sep):
+        return None
 
+    files = embedding_index(embedding_directory)
+    valid_file = files.get(name, None)
     if valid_file is None:
+        for x in EMBEDDING_EXTENSIONS:
+            valid_file = files.get(name + x, None)
+            if valid_file is not None:
+                break
+    return valid_file
+
+def load_embed(embedding_name, embedding_directory, embedding_size, embed_key=None):
+    embed_path = find_embed(embedding_name, embedding_directory)
+    if embed_path is None:
+        return None
+
+    try:
+        st = os.stat(embed_path)
+    except OSError:
         return None
 
-    embed_path = valid_file
+    key = (embed_path, st.st_size, st.st_mtime_ns, embedding_size, embed_key)
+    embed_out = embedding_cache.get(key, None)
+    if embed_out is not None:
+        embedding_cache.move_to_end(key)
+        return embed_out
+
+    embed_out = load_embed_file(embed_path, embedding_name, embedding_size, embed_key)
+    if embed_out is not None:
+        embedding_cache[key] = embed_out
+        while len(embedding_cache) > EMBEDDING_CACHE_MAX_ENTRIES:
+            embedding_cache.popitem(last=False)
+    return embed_out
 
+def load_embed_file(embed_path, embedding_name, embedding_size, embed_key=None):
     embed_out = None
 
     try:
@@ -505,6 +567,13 @@ class SDTokenizer:
         self.embedding_identifier = "embedding:"
         self.embedding_size = embedding_size
         self.embedding_key = embedding_key
+        self.tokenize_cache = collections.OrderedDict()
+
+    def tokenize_words(self, words):
+        """input_ids of each word, huggingface tokenizers encode the whole list in one batch call."""
+        if isinstance(self.tokenizer, PreTrainedTokenizerBase):
+            return self.tokenizer(words)["input_ids"]
+        return [self.tokenizer(word)["input_ids"] for word in words]
 
     def _try_get_embedding(self, embedding_name:str):
         '''
@@ -532,15 +601,22 @@ class SDTokenizer:
         '''
         min_length = tokenizer_options.get("{}_min_length".format(self.embedding_key), self.min_length)
         min_padding = tokenizer_options.get("{}_min_padding".format(self.embedding_key), self.min_padding)
+        disable_weights = kwargs.get("disable_weights", False)
 
-        text = escape_important(text)
-        if kwargs.get("disable_weights", False):
-            parsed_weights = [(text, 1.0)]
-        else:
-            parsed_weights = token_weights(text, 1.0)
+        # prompts with embeddings are not memoized since the embedding files can change
+        cache_key = None
+        if self.embedding_directory is None or self.embedding_identifier not in text:
+            cache_key = (text, return_word_ids, min_length, min_padding, disable_weights)
+            cached = self.tokenize_cache.get(cache_key, None)
+            if cached is not None:
+                self.tokenize_cache.move_to_end(cache_key)
+                return [list(x) for x in cached]
+
+        parsed_weights = parse_weighted_prompt(text, disable_weights)
 
-        # tokenize words
+        # split words and embeddings, the words are then tokenized in one batch
         tokens = []
+        words = []
         for weighted_segment, weight in parsed_weights:
             to_tokenize = unescape_important(weighted_segment)
             split = re.split(' {0}|\n{0}'.format(self.embedding_identifier), to_tokenize)
@@ -566,11 +642,18 @@ class SDTokenizer:
                         word = leftover
                     else:
                         continue
-                end = 999999999999
-                if self.tokenizer_adds_end_token:
-                    end = -1
-                #parse word
-                tokens.append([(t, weight) for t in self.tokenizer(word)["input_ids"][self.tokens_start:end]])
+                #placeholder for the tokens of the word
+                tokens.append(None)
+                words.append((len(tokens) - 1, word, weight))
+
+        if len(words) > 0:
+            end = 999999999999
+            if self.tokenizer_adds_end_token:
+                end = -1
+            #parse words
+            word_ids = self.tokenize_words([w for _, w, _ in words])
+            for (index, _, weight), ids in zip(words, word_ids):
+                tokens[index] = [(t, weight) for t in ids[self.tokens_start:end]]
 
         #reshape token array to CLIP input size
         batched_tokens = []
@@ -623,6 +706,10 @@ class SDTokenizer:
         if not return_word_ids:
             batched_tokens = [[(t, w) for t, w,_ in x] for x in batched_tokens]
 
+        if cache_key is not None:
+            self.tokenize_cache[cache_key] = [list(x) for x in batched_tokens]
+            while len(self.tokenize_cache) > TOKENIZE_CACHE_MAX_ENTRIES:
+                self.tokenize_cache.popitem(last=False)
         return batched_tokens
 
 
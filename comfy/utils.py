@@ -21,11 +21,14 @@ import torch
 import math
 import struct
 import comfy.checkpoint_pickle
+import comfy.model_store
 import safetensors.torch
 import numpy as np
 from PIL import Image
 import logging
 import itertools
+import contextlib
+import threading
 from torch.nn.functional import interpolate
 from einops import rearrange
 from comfy.cli_args import args
@@ -74,25 +77,28 @@ def load_torch_file(ckpt, safe_load=False, device=None, return_metadata=False):
                     raise ValueError("{}\n\nFile path: {}\n\nThe safetensors file is corrupt/incomplete. Check the file size and make sure you have copied/downloaded it correctly.".format(message, ckpt))
             raise e
     else:
-        torch_args = {}
-        if MMAP_TORCH_FILES:
-            torch_args["mmap"] = True
-
-        if safe_load or ALWAYS_SAFE_LOAD:
-            pl_sd = torch.load(ckpt, map_location=device, weights_only=True, **torch_args)
-        else:
-            logging.warning("WARNING: loading {} unsafely, upgrade your pytorch to 2.4 or newer to load this file safely.".format(ckpt))
-            pl_sd = torch.load(ckpt, map_location=device, pickle_module=comfy.checkpoint_pickle)
-        if "state_dict" in pl_sd:
-            sd = pl_sd["state_dict"]
-        else:
-            if len(pl_sd) == 1:
-                key = list(pl_sd.keys())[0]
-                sd = pl_sd[key]
-                if not isinstance(sd, dict):
-                    sd = pl_sd
+        sd = comfy.model_store.load(ckpt, device=device)
+        if sd is None:
+            torch_args = {}
+            if MMAP_TORCH_FILES:
+                torch_args["mmap"] = True
+
+            if safe_load or ALWAYS_SAFE_LOAD:
+                pl_sd = torch.load(ckpt, map_location=device, weights_only=True, **torch_args)
+            else:
+                logging.warning("WARNING: loading {} unsafely, upgrade your pytorch to 2.4 or newer to load this file safely.".format(ckpt))
+                pl_sd = torch.load(ckpt, map_location=device, pickle_module=comfy.checkpoint_pickle)
+            if "state_dict" in pl_sd:
+                sd = pl_sd["state_dict"]
             else:
-                sd = pl_sd
+                if len(pl_sd) == 1:
+                    key = list(pl_sd.keys())[0]
+                    sd = pl_sd[key]
+                    if not isinstance(sd, dict):
+                        sd = pl_sd
+                else:
+                    sd = pl_sd
+            comfy.model_store.save(ckpt, sd)
     return (sd, metadata) if return_metadata else sd
 
 def save_torch_file(sd, ckpt, metadata=None):
@@ -751,6 +757,77 @@ def copy_to_param(obj, attr, value):
     prev = getattr(obj, attrs[-1])
     prev.data.copy_(value)
 
+_meta_parameter_init = threading.local()
+_meta_parameter_hook = None
+_meta_parameter_hook_lock = threading.Lock()
+
+def _meta_parameter_registration_hook(module, name, param):
+    if param is None or getattr(_meta_parameter_init, "depth", 0) == 0:
+        return None
+    return torch.nn.Parameter(param.to(torch.device("meta")), requires_grad=param.requires_grad)
+
+@contextlib.contextmanager
+def meta_parameter_init(enabled=True):
+    """Creates every parameter registered inside the context on the meta device.
+
+    Buffers are left alone so values computed in __init__ are kept. The
+    parameters get real storage later with assign_state_dict. The context
+    only applies to the current thread and can be nested.
+    """
+    if not enabled:
+        yield
+        return
+
+    global _meta_parameter_hook
+    with _meta_parameter_hook_lock:
+        if _meta_parameter_hook is None:
+            _meta_parameter_hook = torch.nn.modules.module.register_module_parameter_registration_hook(_meta_parameter_registration_hook)
+
+    _meta_parameter_init.depth = getattr(_meta_parameter_init, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _meta_parameter_init.depth -= 1
+
+def has_meta_parameters(module):
+    for p in module.parameters():
+        if p.is_meta:
+            return True
+    return False
+
+def assign_state_dict(module, sd, device=None):
+    """Loads sd into a module created with meta_parameter_init without copying.
+
+    The tensors in sd become the module parameters, they are only converted when
+    their dtype is different from the one the module was created with. Parameters
+    missing from sd get uninitialized storage on device like they would with
+    the disable_weight_init ops.
+    Returns the missing and unexpected keys like load_state_dict.
+    """
+    if device is None:
+        device = torch.device("cpu")
+
+    current = module.state_dict(keep_vars=True)
+    to_load = {}
+    for k in sd:
+        v = sd[k]
+        c = current.get(k, None)
+        if c is not None and c.dtype != v.dtype and c.is_floating_point():
+            v = v.to(dtype=c.dtype)
+        to_load[k] = v
+
+    m, u = module.load_state_dict(to_load, strict=False, assign=True)
+    del to_load
+    materialize_meta_parameters(module, device=device)
+    return m, u
+
+def materialize_meta_parameters(module, device=None):
+    if device is None:
+        device = torch.device("cpu")
+    for name, param in list(module.named_parameters()):
+        if param.is_meta:
+            set_attr(module, name, torch.nn.Parameter(torch.empty_like(param, device=device), requires_grad=param.requires_grad))
+
 def get_attr(obj, attr: str):
     """Retrieves a nested attribute from an object using dot notation.
 
@@ -897,9 +974,64 @@ def get_tiled_scale_steps(width, height, tile_x, tile_y, overlap):
     cols = 1 if width <= tile_x else math.ceil((width - overlap) / (tile_x - overlap))
     return rows * cols
 
+def tiled_scale_batch_size(memory_per_tile, free_memory, max_batch=None):
+    """Number of tiles that can go through function in one batch."""
+    batch = max(1, int(free_memory // max(1, memory_per_tile)))
+    if max_batch is not None:
+        batch = min(batch, max_batch)
+    return batch
+
+def plan_tiled_scale(shape, tile, overlap, memory_used, free_memory, min_tile=None):
+    """Picks the tile size, overlap and tiles per batch for tiled_scale_multidim from the memory model of
+    function. memory_used(shape) returns the memory needed to run function on an input of shape, the tiles
+    are halved until one of them fits in free_memory."""
+    dims = len(tile)
+    if not isinstance(overlap, (tuple, list)):
+        overlap = [overlap] * dims
+    if min_tile is None:
+        min_tile = [1] * dims
+    elif not isinstance(min_tile, (tuple, list)):
+        min_tile = [min_tile] * dims
+
+    tile = list(tile)
+    overlap = list(overlap)
+
+    def tile_memory():
+        return memory_used([1, shape[1]] + [min(tile[d], shape[d + 2]) for d in range(dims)])
+
+    while tile_memory() > free_memory:
+        halved = False
+        for d in range(dims):
+            if tile[d] // 2 >= min_tile[d]:
+                overlap[d] = max(0, (overlap[d] * (tile[d] // 2)) // tile[d])
+                tile[d] = tile[d] // 2
+                halved = True
+        if not halved:
+            break
+
+    tiles = shape[0]
+    for d in range(dims):
+        if shape[d + 2] > tile[d]:
+            tiles *= math.ceil((shape[d + 2] - overlap[d]) / max(1, tile[d] - overlap[d]))
+    return tile, overlap, tiled_scale_batch_size(tile_memory(), free_memory, max_batch=tiles)
+
+def tiled_scale_feather_mask(shape, feather, device):
+    mask = torch.ones([1, 1] + list(shape), device=device)
+    for d in range(len(shape)):
+        f = feather[d]
+        if f <= 0 or f >= shape[d]:
+            continue
+        w = torch.ones(shape[d], device=device)
+        ramp = torch.arange(1, f + 1, device=device, dtype=torch.float32) / f
+        w[:f] *= ramp
+        w[-f:] *= ramp.flip(0)
+        mask = mask * w.reshape([-1] + [1] * (len(shape) - d - 1))
+    return mask
+
 @torch.inference_mode()
-def tiled_scale_multidim(samples, function, tile=(64, 64), overlap=8, upscale_amount=4, out_channels=3, output_device="cpu", downscale=False, index_formulas=None, pbar=None):
+def tiled_scale_multidim(samples, function, tile=(64, 64), overlap=8, upscale_amount=4, out_channels=3, output_device="cpu", downscale=False, index_formulas=None, pbar=None, max_batch=1):
     dims = len(tile)
+    max_batch = max(1, max_batch)
 
     if not (isinstance(upscale_amount, (tuple, list))):
         upscale_amount = [upscale_amount] * dims
@@ -954,62 +1086,72 @@ def tiled_scale_multidim(samples, function, tile=(64, 64), overlap=8, upscale_am
             out.append(round(get_scale(i, a[i])))
         return out
 
-    output = torch.empty([samples.shape[0], out_channels] + mult_list_upscale(samples.shape[2:]), device=output_device)
-
-    for b in range(samples.shape[0]):
-        s = samples[b:b+1]
-
-        # handle entire input fitting in a single tile
-        if all(s.shape[d+2] <= tile[d] for d in range(dims)):
-            output[b:b+1] = function(s).to(output_device)
+    # handle entire input fitting in a single tile
+    if all(samples.shape[d+2] <= tile[d] for d in range(dims)):
+        output = torch.empty([samples.shape[0], out_channels] + mult_list_upscale(samples.shape[2:]), device=output_device)
+        for b in range(0, samples.shape[0], max_batch):
+            s = samples[b:b+max_batch]
+            output[b:b+s.shape[0]] = function(s).to(output_device)
             if pbar is not None:
-                pbar.update(1)
-            continue
-
-        out = torch.zeros([s.shape[0], out_channels] + mult_list_upscale(s.shape[2:]), device=output_device)
-        out_div = torch.zeros([s.shape[0], out_channels] + mult_list_upscale(s.shape[2:]), device=output_device)
-
-        positions = [range(0, s.shape[d+2] - overlap[d], tile[d] - overlap[d]) if s.shape[d+2] > tile[d] else [0] for d in range(dims)]
-
-        for it in itertools.product(*positions):
-            s_in = s
-            upscaled = []
-
-            for d in range(dims):
-                pos = max(0, min(s.shape[d + 2] - overlap[d], it[d]))
-                l = min(tile[d], s.shape[d + 2] - pos)
-                s_in = s_in.narrow(d + 2, pos, l)
-                upscaled.append(round(get_pos(d, pos)))
-
-            ps = function(s_in).to(output_device)
-            mask = torch.ones_like(ps)
-
-            for d in range(2, dims + 2):
-                feather = round(get_scale(d - 2, overlap[d - 2]))
-                if feather >= mask.shape[d]:
-                    continue
-                for t in range(feather):
-                    a = (t + 1) / feather
-                    mask.narrow(d, t, 1).mul_(a)
-                    mask.narrow(d, mask.shape[d] - 1 - t, 1).mul_(a)
-
-            o = out
-            o_d = out_div
-            for d in range(dims):
-                o = o.narrow(d + 2, upscaled[d], mask.shape[d + 2])
-                o_d = o_d.narrow(d + 2, upscaled[d], mask.shape[d + 2])
-
-            o.add_(ps * mask)
-            o_d.add_(mask)
+                pbar.update(s.shape[0])
+        return output
+
+    # tiles with the same shape are stacked (across the whole batch) and run through function together
+    positions = [range(0, samples.shape[d+2] - overlap[d], tile[d] - overlap[d]) if samples.shape[d+2] > tile[d] else [0] for d in range(dims)]
+    tile_groups = {}
+    for it in itertools.product(*positions):
+        pos = []
+        size = []
+        for d in range(dims):
+            p = max(0, min(samples.shape[d + 2] - overlap[d], it[d]))
+            pos.append(p)
+            size.append(min(tile[d], samples.shape[d + 2] - p))
+        tile_groups.setdefault(tuple(size), []).append(pos)
+
+    output = torch.zeros([samples.shape[0], out_channels] + mult_list_upscale(samples.shape[2:]), device=output_device)
+    # the weights only depend on the tile positions so they are accumulated once for all the batch and channels
+    out_div = torch.zeros([1, 1] + list(output.shape[2:]), device=output_device)
+    feather = [round(get_scale(d, overlap[d])) for d in range(dims)]
+    masks = {}
+
+    for size, group in tile_groups.items():
+        work = [(b, pos) for b in range(samples.shape[0]) for pos in group]
+        for i in range(0, len(work), max_batch):
+            chunk = work[i:i + max_batch]
+            s_in = []
+            for b, pos in chunk:
+                s = samples[b:b+1]
+                for d in range(dims):
+                    s = s.narrow(d + 2, pos[d], size[d])
+                s_in.append(s)
+
+            ps = function(torch.cat(s_in) if len(s_in) > 1 else s_in[0]).to(output_device)
+            tile_shape = tuple(ps.shape[2:])
+            mask = masks.get(tile_shape, None)
+            if mask is None:
+                mask = tiled_scale_feather_mask(tile_shape, feather, output_device)
+                masks[tile_shape] = mask
+
+            for j, (b, pos) in enumerate(chunk):
+                o = output[b:b+1]
+                for d in range(dims):
+                    o = o.narrow(d + 2, round(get_pos(d, pos[d])), tile_shape[d])
+                o.addcmul_(ps[j:j+1], mask)
+
+                if b == 0:
+                    o_d = out_div
+                    for d in range(dims):
+                        o_d = o_d.narrow(d + 2, round(get_pos(d, pos[d])), tile_shape[d])
+                    o_d.add_(mask)
 
             if pbar is not None:
-                pbar.update(1)
+                pbar.update(len(chunk))
 
-        output[b:b+1] = out/out_div
+    output /= out_div
     return output
 
-def tiled_scale(samples, function, tile_x=64, tile_y=64, overlap = 8, upscale_amount = 4, out_channels = 3, output_device="cpu", pbar = None):
-    return tiled_scale_multidim(samples, function, (tile_y, tile_x), overlap=overlap, upscale_amount=upscale_amount, out_channels=out_channels, output_device=output_device, pbar=pbar)
+def tiled_scale(samples, function, tile_x=64, tile_y=64, overlap = 8, upscale_amount = 4, out_channels = 3, output_device="cpu", pbar = None, max_batch=1):
+    return tiled_scale_multidim(samples, function, (tile_y, tile_x), overlap=overlap, upscale_amount=upscale_amount, out_channels=out_channels, output_device=output_device, pbar=pbar, max_batch=max_batch)
 
 PROGRESS_BAR_ENABLED = True
 def set_progress_bar_enabled(enabled):
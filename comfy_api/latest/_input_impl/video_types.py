@@ -9,7 +9,10 @@ import io
 import json
 import numpy as np
 import math
+import queue
+import threading
 import torch
+import comfy.compact_image
 from comfy_api.latest._util import VideoContainer, VideoCodec, VideoComponents
 
 
@@ -52,23 +55,262 @@ def get_open_write_kwargs(
     return open_kwargs
 
 
+def decode_frames(
+    container: InputContainer,
+    start_time: float = 0.0,
+    end_time: Optional[float] = None,
+    frame_step: int = 1,
+    frame_limit: Optional[int] = None,
+    size: Optional[tuple[int, int]] = None,
+):
+    """
+    Yields the selected frames of the first video stream of the container as uint8 rgb24 arrays
+    of shape (H, W, 3). Times are in seconds from the start of the stream, the container seeks to
+    the keyframe before start_time instead of decoding the frames before it.
+    """
+    stream = container.streams.video[0]
+    offset = float(stream.start_time * stream.time_base) if stream.start_time is not None else 0.0
+    if start_time > 0:
+        container.seek(int((start_time + offset) / stream.time_base), stream=stream)
+
+    reformat = {}
+    if size is not None:
+        reformat = {"width": size[0], "height": size[1]}
+
+    eps = 1e-6
+    index = 0
+    count = 0
+    for frame in container.decode(stream):
+        if frame.time is not None:
+            t = frame.time - offset
+            if t < start_time - eps:
+                continue
+            if end_time is not None and t >= end_time - eps:
+                break
+        if index % frame_step == 0:
+            yield frame.to_ndarray(format="rgb24", **reformat)
+            count += 1
+            if frame_limit is not None and count >= frame_limit:
+                break
+        index += 1
+
+
+def iter_frame_chunks(open_source, chunk_size: int = 16, **selection):
+    """
+    Decodes the selected frames in a background thread and yields them in uint8 [N, H, W, 3]
+    tensors of up to chunk_size frames, at most two chunks are decoded ahead.
+    """
+    chunks = queue.Queue(maxsize=2)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def decode():
+        try:
+            with av.open(open_source(), mode="r") as container:
+                if len(container.streams.video) == 0:
+                    raise ValueError("No video stream found")
+                frames = []
+                for frame in decode_frames(container, **selection):
+                    frames.append(frame)
+                    if len(frames) == chunk_size:
+                        if not put(np.stack(frames)):
+                            return
+                        frames = []
+                if len(frames) > 0 and not put(np.stack(frames)):
+                    return
+            put(None)
+        except Exception as e:
+            put(e)
+
+    thread = threading.Thread(target=decode, daemon=True, name="video_decode")
+    thread.start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield torch.from_numpy(item)
+    finally:
+        stop.set()
+
+
+def encode_video(
+    path: str | io.BytesIO,
+    chunks,
+    width: int,
+    height: int,
+    frame_rate: Fraction,
+    audio: Optional[AudioInput] = None,
+    metadata: Optional[dict] = None,
+    format: VideoContainer = VideoContainer.AUTO,
+    codec: VideoCodec = VideoCodec.AUTO,
+):
+    """
+    Encodes uint8 [N, H, W, 3] frame chunks to a H264 MP4, the frames are encoded as the chunks
+    are produced so the whole video never has to be in memory.
+    """
+    if format != VideoContainer.AUTO and format != VideoContainer.MP4:
+        raise ValueError("Only MP4 format is supported for now")
+    if codec != VideoCodec.AUTO and codec != VideoCodec.H264:
+        raise ValueError("Only H264 codec is supported for now")
+    open_kwargs = {"mode": "w", "options": {"movflags": "use_metadata_tags"}}
+    if isinstance(path, io.BytesIO):
+        open_kwargs["format"] = "mp4"
+    with av.open(path, **open_kwargs) as output:
+        # Add metadata before writing any streams
+        if metadata is not None:
+            for key, value in metadata.items():
+                output.metadata[key] = json.dumps(value)
+
+        frame_rate = Fraction(round(frame_rate * 1000), 1000)
+        # Create a video stream
+        video_stream = output.add_stream('h264', rate=frame_rate)
+        video_stream.width = width
+        video_stream.height = height
+        video_stream.pix_fmt = 'yuv420p'
+
+        # Create an audio stream
+        audio_sample_rate = 1
+        audio_stream: Optional[av.AudioStream] = None
+        if audio:
+            audio_sample_rate = int(audio['sample_rate'])
+            audio_stream = output.add_stream('aac', rate=audio_sample_rate)
+
+        # Encode video
+        frame_count = 0
+        for chunk in chunks:
+            for img in chunk.cpu().numpy():
+                frame = av.VideoFrame.from_ndarray(img, format='rgb24') # shape: (H, W, 3)
+                frame = frame.reformat(format='yuv420p')  # Convert to YUV420P as required by h264
+                packet = video_stream.encode(frame)
+                output.mux(packet)
+                frame_count += 1
+
+        # Flush video
+        packet = video_stream.encode(None)
+        output.mux(packet)
+
+        if audio_stream and audio:
+            waveform = audio['waveform']
+            waveform = waveform[:, :, :math.ceil((audio_sample_rate / frame_rate) * frame_count)]
+            frame = av.AudioFrame.from_ndarray(waveform.movedim(2, 1).reshape(1, -1).float().numpy(), format='flt', layout='mono' if waveform.shape[1] == 1 else 'stereo')
+            frame.sample_rate = audio_sample_rate
+            frame.pts = 0
+            output.mux(audio_stream.encode(frame))
+
+            # Flush encoder
+            output.mux(audio_stream.encode(None))
+
+
 class VideoFromFile(VideoInput):
     """
     Class representing video input from a file.
     """
 
-    def __init__(self, file: str | io.BytesIO):
+    def __init__(
+        self,
+        file: str | io.BytesIO,
+        start_time: float = 0.0,
+        duration: Optional[float] = None,
+        frame_step: int = 1,
+        frame_limit: Optional[int] = None,
+        size: Optional[tuple[int, int]] = None,
+    ):
         """
         Initialize the VideoFromFile object based off of either a path on disk or a BytesIO object
         containing the file contents.
+
+        The optional selection (start_time and duration in seconds, every frame_step-th frame, at most
+        frame_limit frames, resized to size (width, height)) is applied when the frames are decoded.
         """
         self.__file = file
+        self.__start_time = max(0.0, start_time)
+        self.__duration = duration
+        self.__frame_step = max(1, frame_step)
+        self.__frame_limit = frame_limit
+        self.__size = size
+
+    def has_selection(self) -> bool:
+        return self.__start_time > 0 or self.__duration is not None or self.__frame_step != 1 or self.__frame_limit is not None or self.__size is not None
+
+    def select(
+        self,
+        start_time: float = 0.0,
+        duration: Optional[float] = None,
+        frame_step: int = 1,
+        frame_limit: Optional[int] = None,
+        size: Optional[tuple[int, int]] = None,
+    ) -> VideoFromFile:
+        """
+        Returns a lazy selection of this video, times are relative to the start of this video.
+        """
+        start = self.__start_time + max(0.0, start_time)
+        end = self.__end_time()
+        if duration is not None:
+            end = start + duration if end is None else min(end, start + duration)
+        limit = frame_limit
+        if self.__frame_limit is not None:
+            if start_time > 0:
+                # the frames of this video end at an absolute time once the start moves
+                frame_rate = float(VideoFromFile(self.__file).get_frame_rate())
+                limit_end = self.__start_time + self.__frame_limit * self.__frame_step / frame_rate
+                end = limit_end if end is None else min(end, limit_end)
+            else:
+                remaining = math.ceil(self.__frame_limit / max(1, frame_step))
+                limit = remaining if limit is None else min(limit, remaining)
+        return VideoFromFile(
+            self.__file,
+            start_time=start,
+            duration=None if end is None else max(0.0, end - start),
+            frame_step=self.__frame_step * max(1, frame_step),
+            frame_limit=limit,
+            size=size if size is not None else self.__size,
+        )
+
+    def __end_time(self) -> Optional[float]:
+        if self.__duration is None:
+            return None
+        return self.__start_time + self.__duration
+
+    def __selection(self) -> dict:
+        return {
+            "start_time": self.__start_time,
+            "end_time": self.__end_time(),
+            "frame_step": self.__frame_step,
+            "frame_limit": self.__frame_limit,
+            "size": self.__size,
+        }
+
+    def __open_source(self) -> str | io.BytesIO:
+        # The decoding thread gets its own buffer so it doesn't share the read position of ours
+        if isinstance(self.__file, io.BytesIO):
+            return io.BytesIO(self.__file.getvalue())
+        return self.__file
+
+    def iter_frames(self, chunk_size: int = 16):
+        """
+        Yields the selected frames in uint8 [N, H, W, 3] tensors of up to chunk_size frames,
+        decoded in a background thread.
+        """
+        return iter_frame_chunks(self.__open_source, chunk_size=chunk_size, **self.__selection())
 
     def get_stream_source(self) -> str | io.BytesIO:
         """
         Return the underlying file source for efficient streaming.
         This avoids unnecessary memory copies when the source is already a file path.
         """
+        if self.has_selection():
+            return super().get_stream_source()
         if isinstance(self.__file, io.BytesIO):
             self.__file.seek(0)
         return self.__file
@@ -80,6 +322,8 @@ class VideoFromFile(VideoInput):
         Returns:
             Tuple of (width, height)
         """
+        if self.__size is not None:
+            return self.__size
         if isinstance(self.__file, io.BytesIO):
             self.__file.seek(0)  # Reset the BytesIO object to the beginning
         with av.open(self.__file, mode='r') as container:
@@ -96,6 +340,8 @@ class VideoFromFile(VideoInput):
         Returns:
             Duration in seconds
         """
+        if self.has_selection():
+            return self.__selected_duration()
         if isinstance(self.__file, io.BytesIO):
             self.__file.seek(0)
         with av.open(self.__file, mode="r") as container:
@@ -128,26 +374,44 @@ class VideoFromFile(VideoInput):
         Returns:
             Container format as string
         """
+        if self.has_selection():
+            return "mp4"  # selections are encoded by save_to
         if isinstance(self.__file, io.BytesIO):
             self.__file.seek(0)
         with av.open(self.__file, mode='r') as container:
             return container.format.name
 
-    def get_components_internal(self, container: InputContainer) -> VideoComponents:
-        # Get video frames
-        frames = []
-        for frame in container.decode(video=0):
-            img = frame.to_ndarray(format='rgb24')  # shape: (H, W, 3)
-            img = torch.from_numpy(img) / 255.0  # shape: (H, W, 3)
-            frames.append(img)
+    def __selected_duration(self) -> float:
+        total = VideoFromFile(self.__file).get_duration()
+        end = total if self.__duration is None else min(total, self.__start_time + self.__duration)
+        duration = max(0.0, end - self.__start_time)
+        if self.__frame_limit is not None:
+            duration = min(duration, self.__frame_limit / float(self.get_frame_rate()))
+        return duration
 
-        images = torch.stack(frames) if len(frames) > 0 else torch.zeros(0, 3, 0, 0)
+    def get_frame_rate(self) -> Fraction:
+        """
+        Returns the frame rate of the selected frames.
+        """
+        if isinstance(self.__file, io.BytesIO):
+            self.__file.seek(0)
+        with av.open(self.__file, mode='r') as container:
+            return self.__frame_rate(container)
 
-        # Get frame rate
+    def __frame_rate(self, container: InputContainer) -> Fraction:
         video_stream = next(s for s in container.streams if s.type == 'video')
         frame_rate = Fraction(video_stream.average_rate) if video_stream and video_stream.average_rate else Fraction(1)
+        return frame_rate / self.__frame_step
 
-        # Get audio if available
+    def __audio_end_time(self, container: InputContainer) -> Optional[float]:
+        # The audio ends with the last selected frame, the frame limit can end the selection before its duration.
+        end = self.__end_time()
+        if self.__frame_limit is not None:
+            limit_end = self.__start_time + self.__frame_limit / float(self.__frame_rate(container))
+            end = limit_end if end is None else min(end, limit_end)
+        return end
+
+    def __get_audio(self, container: InputContainer) -> Optional[AudioInput]:
         audio = None
         try:
             container.seek(0)  # Reset the container to the beginning
@@ -162,14 +426,39 @@ class VideoFromFile(VideoInput):
                         audio_frames.append(frame.to_ndarray())  # shape: (channels, samples)
                 if len(audio_frames) > 0:
                     audio_data = np.concatenate(audio_frames, axis=1)  # shape: (channels, total_samples)
+                    sample_rate = int(stream.sample_rate) if stream.sample_rate else 1
+                    if self.has_selection():
+                        end = self.__audio_end_time(container)
+                        audio_data = audio_data[:, int(self.__start_time * sample_rate):None if end is None else int(end * sample_rate)]
                     audio_tensor = torch.from_numpy(audio_data).unsqueeze(0)  # shape: (1, channels, total_samples)
                     audio = AudioInput({
                         "waveform": audio_tensor,
-                        "sample_rate": int(stream.sample_rate) if stream.sample_rate else 1,
+                        "sample_rate": sample_rate,
                     })
         except StopIteration:
             pass  # No audio stream
+        return audio
+
+    @staticmethod
+    def __uint8_images(chunks) -> Optional[torch.Tensor]:
+        chunks = list(chunks)
+        if len(chunks) == 0:
+            return None
+        return torch.cat(chunks)
+
+    @staticmethod
+    def __images(chunks) -> torch.Tensor:
+        images = VideoFromFile.__uint8_images(chunks)
+        if images is None:
+            return torch.zeros(0, 3, 0, 0)
+        return images.float() / 255.0
 
+    def get_components_internal(self, container: InputContainer) -> VideoComponents:
+        # Get video frames
+        images = self.__images(torch.from_numpy(f)[None] for f in decode_frames(container, **self.__selection()))
+        frame_rate = self.__frame_rate(container)
+        # Get audio if available
+        audio = self.__get_audio(container)
         metadata = container.metadata
         return VideoComponents(images=images, audio=audio, frame_rate=frame_rate, metadata=metadata)
 
@@ -177,8 +466,24 @@ class VideoFromFile(VideoInput):
         if isinstance(self.__file, io.BytesIO):
             self.__file.seek(0)  # Reset the BytesIO object to the beginning
         with av.open(self.__file, mode='r') as container:
-            return self.get_components_internal(container)
-        raise ValueError(f"No video stream found in file '{self.__file}'")
+            if len(container.streams.video) == 0:
+                raise ValueError(f"No video stream found in file '{self.__file}'")
+            images = self.__images(self.iter_frames())
+            return VideoComponents(images=images, audio=self.__get_audio(container), frame_rate=self.__frame_rate(container), metadata=container.metadata)
+
+    def get_compact_components(self) -> VideoComponents:
+        """
+        Same as get_components, but the images are a comfy.compact_image.CompactImage when --compact-images is on.
+        Only for the nodes whose IMAGE outputs the executor promotes, other callers expect the float32 tensor.
+        """
+        if isinstance(self.__file, io.BytesIO):
+            self.__file.seek(0)
+        with av.open(self.__file, mode='r') as container:
+            if len(container.streams.video) == 0:
+                raise ValueError(f"No video stream found in file '{self.__file}'")
+            images = self.__uint8_images(self.iter_frames())
+            images = torch.zeros(0, 3, 0, 0) if images is None else comfy.compact_image.from_uint8(images)
+            return VideoComponents(images=images, audio=self.__get_audio(container), frame_rate=self.__frame_rate(container), metadata=container.metadata)
 
     def save_to(
         self,
@@ -197,15 +502,21 @@ class VideoFromFile(VideoInput):
                 reuse_streams = False
             if codec != VideoCodec.AUTO and codec != video_encoding and video_encoding is not None:
                 reuse_streams = False
+            if self.has_selection():
+                reuse_streams = False
 
             if not reuse_streams:
-                components = self.get_components_internal(container)
-                video = VideoFromComponents(components)
-                return video.save_to(
+                width, height = self.get_dimensions()
+                return encode_video(
                     path,
+                    self.iter_frames(),
+                    width,
+                    height,
+                    self.__frame_rate(container),
+                    audio=self.__get_audio(container),
+                    metadata=metadata,
                     format=format,
                     codec=codec,
-                    metadata=metadata
                 )
 
             streams = container.streams
@@ -248,7 +559,7 @@ class VideoFromComponents(VideoInput):
 
     def get_components(self) -> VideoComponents:
         return VideoComponents(
-            images=self.__components.images,
+            images=comfy.compact_image.to_float(self.__components.images),
             audio=self.__components.audio,
             frame_rate=self.__components.frame_rate
         )
@@ -260,49 +571,17 @@ class VideoFromComponents(VideoInput):
         codec: VideoCodec = VideoCodec.AUTO,
         metadata: Optional[dict] = None
     ):
-        if format != VideoContainer.AUTO and format != VideoContainer.MP4:
-            raise ValueError("Only MP4 format is supported for now")
-        if codec != VideoCodec.AUTO and codec != VideoCodec.H264:
-            raise ValueError("Only H264 codec is supported for now")
-        with av.open(path, mode='w', options={'movflags': 'use_metadata_tags'}) as output:
-            # Add metadata before writing any streams
-            if metadata is not None:
-                for key, value in metadata.items():
-                    output.metadata[key] = json.dumps(value)
-
-            frame_rate = Fraction(round(self.__components.frame_rate * 1000), 1000)
-            # Create a video stream
-            video_stream = output.add_stream('h264', rate=frame_rate)
-            video_stream.width = self.__components.images.shape[2]
-            video_stream.height = self.__components.images.shape[1]
-            video_stream.pix_fmt = 'yuv420p'
-
-            # Create an audio stream
-            audio_sample_rate = 1
-            audio_stream: Optional[av.AudioStream] = None
-            if self.__components.audio:
-                audio_sample_rate = int(self.__components.audio['sample_rate'])
-                audio_stream = output.add_stream('aac', rate=audio_sample_rate)
-
-            # Encode video
-            for i, frame in enumerate(self.__components.images):
-                img = (frame * 255).clamp(0, 255).byte().cpu().numpy() # shape: (H, W, 3)
-                frame = av.VideoFrame.from_ndarray(img, format='rgb24')
-                frame = frame.reformat(format='yuv420p')  # Convert to YUV420P as required by h264
-                packet = video_stream.encode(frame)
-                output.mux(packet)
-
-            # Flush video
-            packet = video_stream.encode(None)
-            output.mux(packet)
-
-            if audio_stream and self.__components.audio:
-                waveform = self.__components.audio['waveform']
-                waveform = waveform[:, :, :math.ceil((audio_sample_rate / frame_rate) * self.__components.images.shape[0])]
-                frame = av.AudioFrame.from_ndarray(waveform.movedim(2, 1).reshape(1, -1).float().numpy(), format='flt', layout='mono' if waveform.shape[1] == 1 else 'stereo')
-                frame.sample_rate = audio_sample_rate
-                frame.pts = 0
-                output.mux(audio_stream.encode(frame))
-
-                # Flush encoder
-                output.mux(audio_stream.encode(None))
+        images = self.__components.images
+        chunk_size = 16
+        chunks = (comfy.compact_image.to_uint8(images[i:i + chunk_size]) for i in range(0, images.shape[0], chunk_size))
+        encode_video(
+            path,
+            chunks,
+            images.shape[2],
+            images.shape[1],
+            self.__components.frame_rate,
+            audio=self.__components.audio,
+            metadata=metadata,
+            format=format,
+            codec=codec,
+        )
@@ -1,5 +1,6 @@
-from .torch_compile import set_torch_compile_wrapper
+from .torch_compile import set_torch_compile_wrapper, warmup_torch_compile
 
 __all__ = [
     "set_torch_compile_wrapper",
+    "warmup_torch_compile",
 ]
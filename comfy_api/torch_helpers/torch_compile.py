@@ -1,7 +1,11 @@
 from __future__ import annotations
+import logging
+import os
+import time
 import torch
 
 import comfy.utils
+from comfy.cli_args import args
 from comfy.patcher_extension import WrappersMP
 from typing import TYPE_CHECKING, Callable, Optional
 if TYPE_CHECKING:
@@ -11,11 +15,106 @@ if TYPE_CHECKING:
 
 COMPILE_KEY = "torch.compile"
 TORCH_COMPILE_KWARGS = "torch_compile_kwargs"
+TORCH_COMPILE_STATS = "torch_compile_stats"
 
+# compiled modules reused when the same module is compiled again with the same settings, stored in a dict attribute of
+# the module keyed by (key, patches_uuid, compile kwargs): the compiled module references the module, it is collected with it
+COMPILED_MODULES_ATTR = "_comfy_compiled_modules"
+cache_artifacts_loaded = False
 
-def apply_torch_compile_factory(compiled_module_dict: dict[str, Callable]) -> Callable:
+
+def compile_cache_directory() -> str:
+    if args.torch_compile_cache_directory is not None:
+        return args.torch_compile_cache_directory
+    import folder_paths
+    return os.path.join(folder_paths.get_user_directory(), "torch_compile_cache")
+
+
+def cache_artifacts_file() -> str:
+    return os.path.join(compile_cache_directory(), "cache_artifacts.bin")
+
+
+def setup_compile_cache():
+    '''
+    Point the inductor and triton caches to the compile cache directory and load the saved cache artifacts, once per process.
+    '''
+    global cache_artifacts_loaded
+    if cache_artifacts_loaded:
+        return
+    cache_artifacts_loaded = True
+    directory = compile_cache_directory()
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError as e:
+        logging.warning("Could not create the torch.compile cache directory {}: {}".format(directory, e))
+        return
+    # torch sets TORCHINDUCTOR_CACHE_DIR to its temp directory default the first time it is used, so always override it
+    os.environ["TORCHINDUCTOR_CACHE_DIR"] = os.path.join(directory, "inductor")
+    os.environ["TRITON_CACHE_DIR"] = os.path.join(directory, "triton")
+    try:
+        import torch._inductor.config
+        torch._inductor.config.fx_graph_cache = True
+    except Exception:
+        pass
+
+    if not hasattr(torch.compiler, "load_cache_artifacts"):
+        return
+    try:
+        with open(cache_artifacts_file(), "rb") as f:
+            torch.compiler.load_cache_artifacts(f.read())
+        logging.info("Loaded the torch.compile cache artifacts from {}".format(directory))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logging.warning("Could not load the torch.compile cache artifacts: {}".format(e))
+
+
+def save_compile_cache():
+    '''
+    Save the cache artifacts of everything compiled by this process so the next start skips the compilation.
+    '''
+    if not hasattr(torch.compiler, "save_cache_artifacts"):
+        return
+    try:
+        result = torch.compiler.save_cache_artifacts()
+        if result is None:
+            return
+        path = cache_artifacts_file()
+        temp = "{}.{}.tmp".format(path, os.getpid())
+        with open(temp, "wb") as f:
+            f.write(result[0])
+        os.replace(temp, path)
+    except Exception as e:
+        logging.warning("Could not save the torch.compile cache artifacts: {}".format(e))
+
+
+def compiled_graph_count() -> int:
+    import torch._dynamo.utils
+    return torch._dynamo.utils.counters["stats"]["unique_graphs"]
+
+
+def get_compiled_module(model: ModelPatcher, key: str, compile_kwargs: dict) -> Callable:
+    '''
+    torch.compile the model object at key, reusing the compiled module of a previous call for the same module, patches and settings.
+    '''
+    module = model.get_model_object(key)
+    cache_key = (key, model.patches_uuid, repr(sorted(compile_kwargs.items())))
+    compiled_modules = getattr(module, COMPILED_MODULES_ATTR, None)
+    if compiled_modules is None:
+        compiled_modules = {}
+        setattr(module, COMPILED_MODULES_ATTR, compiled_modules)
+    compiled = compiled_modules.get(cache_key, None)
+    if compiled is None:
+        compiled = torch.compile(model=module, **compile_kwargs)
+        compiled_modules[cache_key] = compiled
+    return compiled
+
+
+def apply_torch_compile_factory(compiled_module_dict: dict[str, Callable], stats: Optional[dict]=None) -> Callable:
     '''
     Create a wrapper that will refer to the compiled_diffusion_model.
+
+    When stats is set, the calls that compiled new graphs are recorded in stats["compiles"] as (input shape, seconds).
     '''
     def apply_torch_compile_wrapper(executor: WrapperExecutor, *args, **kwargs):
         try:
@@ -23,7 +122,18 @@ def apply_torch_compile_factory(compiled_module_dict: dict[str, Callable]) -> Ca
             for key, value in compiled_module_dict.items():
                 orig_modules[key] = comfy.utils.get_attr(executor.class_obj, key)
                 comfy.utils.set_attr(executor.class_obj, key, value)
-            return executor(*args, **kwargs)
+            if stats is None:
+                return executor(*args, **kwargs)
+            graphs = compiled_graph_count()
+            start = time.perf_counter()
+            out = executor(*args, **kwargs)
+            if compiled_graph_count() != graphs:
+                elapsed = time.perf_counter() - start
+                shape = tuple(args[0].shape) if len(args) > 0 and torch.is_tensor(args[0]) else None
+                stats["compiles"].append((shape, elapsed))
+                logging.info("torch.compile: compiled the model for input shape {} in {:.2f} seconds".format(shape, elapsed))
+                save_compile_cache()
+            return out
         finally:
             for key, value in orig_modules.items():
                 comfy.utils.set_attr(executor.class_obj, key, value)
@@ -38,7 +148,10 @@ def set_torch_compile_wrapper(model: ModelPatcher, backend: str, options: Option
 
     When keys is None, it will default to using ["diffusion_model"], compiling the whole diffusion_model.
     When a list of keys is provided, it will perform torch.compile on only the selected modules.
+    The compiled modules are reused when the same model is compiled again with the same settings and the compile
+    caches are kept in the torch.compile cache directory so the compiled kernels survive restarts.
     '''
+    setup_compile_cache()
     # clear out any other torch.compile wrappers
     model.remove_wrappers_with_key(WrappersMP.APPLY_MODEL, COMPILE_KEY)
     # if no keys, default to 'diffusion_model'
@@ -55,15 +168,66 @@ def set_torch_compile_wrapper(model: ModelPatcher, backend: str, options: Option
     # get a dict of compiled keys
     compiled_modules = {}
     for key in keys:
-        compiled_modules[key] = torch.compile(
-                model=model.get_model_object(key),
-                **compile_kwargs,
-            )
+        compiled_modules[key] = get_compiled_module(model, key, compile_kwargs)
     # add torch.compile wrapper
+    stats = {"compiles": []}
     wrapper_func = apply_torch_compile_factory(
         compiled_module_dict=compiled_modules,
+        stats=stats,
     )
     # store wrapper to run on BaseModel's apply_model function
     model.add_wrapper_with_key(WrappersMP.APPLY_MODEL, COMPILE_KEY, wrapper_func)
-    # keep compile kwargs for reference
+    # keep compile kwargs and stats for reference
     model.model_options[TORCH_COMPILE_KWARGS] = compile_kwargs
+    model.model_options[TORCH_COMPILE_STATS] = stats
+
+
+def parse_warmup_shapes(resolutions: str, batch_sizes: str) -> list[tuple[int, int, int]]:
+    '''
+    Parse "1024x1024, 832x1216" and "1, 2" to a list of (batch_size, width, height).
+    '''
+    shapes = []
+    sizes = [int(b) for b in batch_sizes.replace(",", " ").split()] or [1]
+    for r in resolutions.replace(",", " ").split():
+        width, height = r.lower().split("x")
+        for batch_size in sizes:
+            shapes.append((batch_size, int(width), int(height)))
+    return shapes
+
+
+def warmup_torch_compile(model: ModelPatcher, positive, negative, shapes: list[tuple[int, int, int]], steps: int=2,
+                         cfg: float=8.0, sampler_name: str="euler", scheduler: str="simple") -> list[dict]:
+    '''
+    Compile a model that has the torch.compile wrapper for a list of (batch_size, width, height) by sampling empty latents of
+    these sizes, so the first real prompts don't wait for the compilation.
+
+    Each shape is sampled twice, the returned list has the compile time (first run minus second run) and the steady state
+    step time (second run) of each shape.
+    '''
+    import comfy.sample
+    import comfy.model_management
+
+    stats = model.model_options.get(TORCH_COMPILE_STATS, None)
+    if stats is None:
+        logging.warning("torch.compile warmup: the model has no torch.compile wrapper.")
+    results = []
+    for batch_size, width, height in shapes:
+        latent = torch.zeros([batch_size, 4, height // 8, width // 8], device=comfy.model_management.intermediate_device())
+        latent = comfy.sample.fix_empty_latent_channels(model, latent)
+        noise = comfy.sample.prepare_noise(latent, 0)
+        times = []
+        for _ in range(2):
+            start = time.perf_counter()
+            comfy.sample.sample(model, noise, steps, cfg, sampler_name, scheduler, positive, negative, latent, disable_pbar=True, seed=0)
+            times.append(time.perf_counter() - start)
+        result = {
+            "batch_size": batch_size,
+            "width": width,
+            "height": height,
+            "compile_time": max(0.0, times[0] - times[1]),
+            "step_time": times[1] / steps,
+        }
+        results.append(result)
+        logging.info("torch.compile warmup {}x{} batch {}: compile {:.2f} s, steady state {:.1f} ms per step".format(
+            width, height, batch_size, result["compile_time"], result["step_time"] * 1000))
+    return results
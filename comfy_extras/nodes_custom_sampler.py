@@ -129,10 +129,14 @@ class SDTurboScheduler:
     FUNCTION = "get_sigmas"
 
     def get_sigmas(self, model, steps, denoise):
-        start_step = 10 - int(10 * denoise)
-        timesteps = torch.flip(torch.arange(1, 11) * 100 - 1, (0,))[start_step:start_step + steps]
-        sigmas = model.get_model_object("model_sampling").sigma(timesteps)
-        sigmas = torch.cat([sigmas, sigmas.new_zeros([1])])
+        model_sampling = model.get_model_object("model_sampling")
+
+        def calculate():
+            start_step = 10 - int(10 * denoise)
+            timesteps = torch.flip(torch.arange(1, 11) * 100 - 1, (0,))[start_step:start_step + steps]
+            sigmas = model_sampling.sigma(timesteps)
+            return torch.cat([sigmas, sigmas.new_zeros([1])])
+        sigmas = comfy.samplers.cached_sigmas(model_sampling, ("sd_turbo", steps, denoise), calculate)
         return (sigmas, )
 
 class BetaSamplingScheduler:
@@ -151,7 +155,8 @@ class BetaSamplingScheduler:
     FUNCTION = "get_sigmas"
 
     def get_sigmas(self, model, steps, alpha, beta):
-        sigmas = comfy.samplers.beta_scheduler(model.get_model_object("model_sampling"), steps, alpha=alpha, beta=beta)
+        model_sampling = model.get_model_object("model_sampling")
+        sigmas = comfy.samplers.cached_sigmas(model_sampling, ("beta", steps, alpha, beta), lambda: comfy.samplers.beta_scheduler(model_sampling, steps, alpha=alpha, beta=beta))
         return (sigmas, )
 
 class VPScheduler:
@@ -609,8 +614,7 @@ class Noise_RandomNoise:
 
     def generate_noise(self, input_latent):
         latent_image = input_latent["samples"]
-        batch_inds = input_latent["batch_index"] if "batch_index" in input_latent else None
-        return comfy.sample.prepare_noise(latent_image, self.seed, batch_inds)
+        return comfy.sample.prepare_latent_noise(input_latent, latent_image, self.seed)
 
 class SamplerCustom:
     @classmethod
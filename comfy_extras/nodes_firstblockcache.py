@@ -0,0 +1,288 @@
+from __future__ import annotations
+from typing import Optional
+from comfy_api.latest import io, ComfyExtension
+import comfy.patcher_extension
+import comfy.model_management
+import comfy.ldm.flux.model
+import comfy.ldm.chroma.model
+import comfy.ldm.wan.model
+import comfy.ldm.qwen_image.model
+import comfy.ldm.hidream.model
+import comfy.ldm.lumina.model
+import logging
+import torch
+
+
+# Block hooks of the supported diffusion models: the ("dit", block type, index) replace patches
+# of each stage of blocks in the order they run and the attribute holding the blocks.
+# Only exact classes are listed, subclasses that inject features between the blocks (VACE, S2V...)
+# would get their injections applied twice when the blocks are skipped.
+BLOCK_STAGES = {
+    comfy.ldm.flux.model.Flux: [("double_block", "double_blocks"), ("single_block", "single_blocks")],
+    comfy.ldm.chroma.model.Chroma: [("double_block", "double_blocks"), ("single_block", "single_blocks")],
+    comfy.ldm.wan.model.WanModel: [("double_block", "blocks")],
+    comfy.ldm.wan.model.CameraWanModel: [("double_block", "blocks")],
+    comfy.ldm.qwen_image.model.QwenImageTransformer2DModel: [("double_block", "transformer_blocks")],
+    comfy.ldm.hidream.model.HiDreamImageTransformer2DModel: [("double_block", "double_stream_blocks"), ("single_block", "single_stream_blocks")],
+    comfy.ldm.lumina.model.NextDiT: [("double_block", "layers")],
+}
+
+def get_block_stages(diffusion_model) -> Optional[list[tuple[str, int]]]:
+    stages = BLOCK_STAGES.get(type(diffusion_model), None)
+    if stages is None:
+        return None
+    return [(block_type, len(getattr(diffusion_model, attr))) for block_type, attr in stages]
+
+
+class FirstBlockCachePatch:
+    def __init__(self, holder: FirstBlockCacheHolder, stage: str, previous_patch=None):
+        self.holder = holder
+        self.stage = stage
+        # the replace patch of the block set before FirstBlockCache, it runs in place of the block
+        self.previous_patch = previous_patch
+
+    def __call__(self, args, extra_args):
+        original_block = extra_args["original_block"]
+        if self.previous_patch is not None:
+            original_block = lambda a: self.previous_patch(a, extra_args)
+        return self.holder.run_block(self.stage, args, original_block)
+
+
+def has_other_block_patches(transformer_options) -> bool:
+    """True when some blocks are replaced by other patches than the cache for this call, like the skipped layers of SLG."""
+    blocks_replace = transformer_options.get("patches_replace", {}).get("dit", {})
+    return any(not isinstance(patch, FirstBlockCachePatch) for patch in blocks_replace.values())
+
+
+def fbcache_forward_wrapper(executor, *args, **kwargs):
+    transformer_options: dict[str] = args[-1]
+    if not isinstance(transformer_options, dict):
+        transformer_options = kwargs.get("transformer_options")
+        if not transformer_options:
+            transformer_options = args[-2]
+    fbcache: FirstBlockCacheHolder = transformer_options["first_block_cache"]
+    sigmas = transformer_options["sigmas"]
+    patches = transformer_options.get("patches", {})
+    # controlnets and block patches add to the hidden states between the blocks, the cached residuals can't be used with them
+    # and the blocks replaced for some of the calls (SLG) would share the cache of the calls that run all the blocks
+    if kwargs.get("control", None) is not None or "double_block" in patches or "single_block" in patches or has_other_block_patches(transformer_options) or not fbcache.should_do_fbcache(sigmas):
+        return executor(*args, **kwargs)
+    x: torch.Tensor = args[0]
+    windows = transformer_options.get("context_windows", None)
+    fbcache.begin(x, tuple(transformer_options["uuids"]), [tuple(w.index_list) for w in windows] if windows is not None else None)
+    try:
+        return executor(*args, **kwargs)
+    finally:
+        fbcache.end()
+
+def fbcache_sample_wrapper(executor, *args, **kwargs):
+    """
+    This OUTER_SAMPLE wrapper prepares the timestep range of the cache and logs the statistics and clears the cache at the end.
+    """
+    guider = executor.class_obj
+    fbcache: FirstBlockCacheHolder = guider.model_options["transformer_options"]["first_block_cache"]
+    try:
+        fbcache.reset().prepare_timesteps(guider.model_patcher.model.model_sampling)
+        logging.info(f"{fbcache.name} enabled - threshold: {fbcache.reuse_threshold}, first_blocks: {fbcache.first_blocks}, start_percent: {fbcache.start_percent}, end_percent: {fbcache.end_percent}")
+        return executor(*args, **kwargs)
+    finally:
+        if fbcache.verbose:
+            logging.info(f"{fbcache.name} [verbose] - change_rates {len(fbcache.change_rates)}: {fbcache.change_rates}")
+        computed_blocks = fbcache.total_forwards * fbcache.total_blocks - fbcache.total_skipped * (fbcache.total_blocks - fbcache.first_blocks)
+        try:
+            speedup = fbcache.total_forwards * fbcache.total_blocks / computed_blocks
+        except ZeroDivisionError:
+            speedup = 1.0
+        logging.info(f"{fbcache.name} - skipped the remaining blocks in {fbcache.total_skipped}/{fbcache.total_forwards} model calls (~{speedup:.2f}x block speedup).")
+        fbcache.reset()
+
+
+class FirstBlockCacheHolder:
+    def __init__(self, reuse_threshold: float, first_blocks: int, start_percent: float, end_percent: float, total_blocks: int, offload_cache: bool, verbose: bool=False):
+        self.name = "FirstBlockCache"
+        self.reuse_threshold = reuse_threshold
+        self.first_blocks = first_blocks
+        self.start_percent = start_percent
+        self.end_percent = end_percent
+        self.total_blocks = total_blocks
+        self.offload_cache = offload_cache
+        self.verbose = verbose
+        # timestep values
+        self.start_t = 0.0
+        self.end_t = 0.0
+        # cache values, per batch of conds
+        self.prev_residuals: dict[tuple, torch.Tensor] = {}
+        self.cached_residuals: dict[tuple, dict[str, dict[str, torch.Tensor]]] = {}
+        self.change_rates = []
+        self.total_forwards = 0
+        self.total_skipped = 0
+        self.mismatch_warned = False
+        self.end_forward()
+
+    def prepare_timesteps(self, model_sampling):
+        self.start_t = model_sampling.percent_to_sigma(self.start_percent)
+        self.end_t = model_sampling.percent_to_sigma(self.end_percent)
+        return self
+
+    def should_do_fbcache(self, timestep: torch.Tensor) -> bool:
+        return (timestep[0] <= self.start_t).item() and (timestep[0] > self.end_t).item()
+
+    def cache_device(self, device):
+        if self.offload_cache:
+            return comfy.model_management.unet_offload_device()
+        return device
+
+    def begin(self, x: torch.Tensor, uuids: tuple, window_indexes: Optional[list[tuple[int, ...]]]):
+        self.active = True
+        self.key = (uuids, tuple(x.shape), x.dtype, tuple(window_indexes) if window_indexes is not None else None)
+        self.total_forwards += 1
+
+    def end_forward(self):
+        # state of the current model call
+        self.active = False
+        self.key = None
+        self.skip = None
+        self.calls = 0
+        self.first_stage = None
+        self.first_input = None
+        self.first_output = None
+        self.skipped_stages = set()
+        self.stage_start: dict[str, dict[str, torch.Tensor]] = {}
+        self.stage_last: dict[str, dict[str, torch.Tensor]] = {}
+
+    def end(self):
+        if self.skip is False:
+            # the residuals of the blocks after the first ones of each stage
+            residuals = {}
+            for stage, start in self.stage_start.items():
+                last = self.stage_last[stage]
+                if any(k not in last or last[k].shape != v.shape for k, v in start.items()):
+                    if not self.mismatch_warned:
+                        logging.warning(f"{self.name} - the block outputs don't match the block inputs, the blocks can't be skipped")
+                        self.mismatch_warned = True
+                    residuals = None
+                    break
+                residuals[stage] = {k: (last[k] - v).to(self.cache_device(v.device)) for k, v in start.items()}
+            if residuals is None:
+                self.cached_residuals.pop(self.key, None)
+                self.prev_residuals.pop(self.key, None)
+            else:
+                self.cached_residuals[self.key] = residuals
+        elif self.skip:
+            self.total_skipped += 1
+        self.end_forward()
+
+    def decide(self):
+        residual = self.first_output - self.first_input
+        prev = self.prev_residuals.get(self.key, None)
+        self.skip = False
+        if prev is not None and self.key in self.cached_residuals and prev.shape == residual.shape:
+            prev = prev.to(residual.device)
+            change_rate = ((residual - prev).abs().mean() / prev.abs().mean()).item()
+            self.change_rates.append(change_rate)
+            self.skip = change_rate < self.reuse_threshold
+            if self.verbose:
+                logging.info(f"{self.name} [verbose] - {'skipping' if self.skip else 'NOT skipping'} the remaining blocks; change_rate: {change_rate}, reuse_threshold: {self.reuse_threshold}")
+        if not self.skip:
+            # compare to the last model call that ran all the blocks
+            self.prev_residuals[self.key] = residual.to(self.cache_device(residual.device))
+        self.first_input = None
+        self.first_output = None
+
+    def run_block(self, stage: str, args: dict, original_block):
+        if not self.active:
+            return original_block(args)
+        if self.skip is None:
+            if self.first_stage is None:
+                self.first_stage = stage
+            if stage == self.first_stage:
+                # the first blocks, their residual decides if the remaining blocks are skipped
+                if self.calls == 0:
+                    self.first_input = args["img"]
+                out = original_block(args)
+                self.calls += 1
+                self.first_output = out["img"]
+                if self.calls >= self.first_blocks:
+                    self.decide()
+                return out
+            self.decide()
+
+        if self.skip:
+            residuals = self.cached_residuals[self.key].get(stage, None)
+            if residuals is None:
+                return original_block(args)
+            if stage not in self.skipped_stages:
+                self.skipped_stages.add(stage)
+                return {k: args[k] + r.to(args[k].device) for k, r in residuals.items()}
+            return {k: args[k] for k in residuals}
+
+        if stage not in self.stage_start:
+            self.stage_start[stage] = {k: args[k] for k in ("img", "txt") if torch.is_tensor(args.get(k, None))}
+        out = original_block(args)
+        self.stage_last[stage] = out
+        return out
+
+    def reset(self):
+        self.prev_residuals = {}
+        self.cached_residuals = {}
+        self.change_rates = []
+        self.total_forwards = 0
+        self.total_skipped = 0
+        self.mismatch_warned = False
+        self.end_forward()
+        return self
+
+
+class FirstBlockCacheNode(io.ComfyNode):
+    @classmethod
+    def define_schema(cls) -> io.Schema:
+        return io.Schema(
+            node_id="FirstBlockCache",
+            display_name="FirstBlockCache",
+            description="Runs the first blocks of a transformer model and reuses the cached output of the remaining blocks when the output of the first blocks barely changed since the last step. Supports Flux, Chroma, Wan, Qwen Image, HiDream and Lumina models.",
+            category="advanced/debug/model",
+            is_experimental=True,
+            inputs=[
+                io.Model.Input("model", tooltip="The model to add FirstBlockCache to."),
+                io.Float.Input("reuse_threshold", min=0.0, default=0.1, max=3.0, step=0.01, tooltip="The relative change of the first blocks output below which the remaining blocks are skipped."),
+                io.Int.Input("first_blocks", min=1, default=1, max=16, tooltip="The number of blocks that always run."),
+                io.Float.Input("start_percent", min=0.0, default=0.15, max=1.0, step=0.01, tooltip="The relative sampling step to begin use of FirstBlockCache."),
+                io.Float.Input("end_percent", min=0.0, default=0.95, max=1.0, step=0.01, tooltip="The relative sampling step to end use of FirstBlockCache."),
+                io.Boolean.Input("offload_cache", default=False, tooltip="Keep the cached residuals in RAM instead of VRAM."),
+                io.Boolean.Input("verbose", default=False, tooltip="Whether to log verbose information."),
+            ],
+            outputs=[
+                io.Model.Output(tooltip="The model with FirstBlockCache."),
+            ],
+        )
+
+    @classmethod
+    def execute(cls, model: io.Model.Type, reuse_threshold: float, first_blocks: int, start_percent: float, end_percent: float, offload_cache: bool, verbose: bool) -> io.NodeOutput:
+        stages = get_block_stages(model.get_model_object("diffusion_model"))
+        if stages is None:
+            logging.warning("FirstBlockCache - unsupported model {}, the model is returned unchanged.".format(type(model.get_model_object("diffusion_model")).__name__))
+            return io.NodeOutput(model)
+        model = model.clone()
+        fbcache = FirstBlockCacheHolder(reuse_threshold, first_blocks, start_percent, end_percent, sum(count for _, count in stages), offload_cache, verbose=verbose)
+        model.model_options["transformer_options"]["first_block_cache"] = fbcache
+        blocks_replace = model.model_options["transformer_options"].get("patches_replace", {}).get("dit", {})
+        for block_type, count in stages:
+            patch = FirstBlockCachePatch(fbcache, block_type)
+            for i in range(count):
+                previous_patch = blocks_replace.get((block_type, i), None)
+                if isinstance(previous_patch, FirstBlockCachePatch):
+                    previous_patch = previous_patch.previous_patch
+                model.set_model_patch_replace(patch if previous_patch is None else FirstBlockCachePatch(fbcache, block_type, previous_patch), "dit", block_type, i)
+        model.add_wrapper_with_key(comfy.patcher_extension.WrappersMP.OUTER_SAMPLE, "first_block_cache", fbcache_sample_wrapper)
+        model.add_wrapper_with_key(comfy.patcher_extension.WrappersMP.DIFFUSION_MODEL, "first_block_cache", fbcache_forward_wrapper)
+        return io.NodeOutput(model)
+
+
+class FirstBlockCacheExtension(ComfyExtension):
+    async def get_node_list(self) -> list[type[io.ComfyNode]]:
+        return [
+            FirstBlockCacheNode,
+        ]
+
+def comfy_entrypoint():
+    return FirstBlockCacheExtension()
@@ -596,7 +596,7 @@ class SaveGLB:
     CATEGORY = "3d"
 
     def save(self, mesh, filename_prefix, prompt=None, extra_pnginfo=None):
-        full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, folder_paths.get_output_directory())
+        full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, folder_paths.get_output_directory(), count=mesh.vertices.shape[0])
         results = []
 
         metadata = {}
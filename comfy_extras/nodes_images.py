@@ -7,14 +7,15 @@ from comfy.cli_args import args
 from PIL import Image
 from PIL.PngImagePlugin import PngInfo
 
-import numpy as np
 import json
 import os
 import re
+import math
 from io import BytesIO
 from inspect import cleandoc
 import torch
 import comfy.utils
+import comfy.output_writer
 
 from comfy.comfy_types import FileLocator, IO
 from server import PromptServer
@@ -120,19 +121,17 @@ class SaveAnimatedWEBP:
     FUNCTION = "save_images"
 
     OUTPUT_NODE = True
+    ACCEPTS_COMPACT_IMAGES = True
 
     CATEGORY = "image/animation"
 
     def save_images(self, images, fps, filename_prefix, lossless, quality, method, num_frames=0, prompt=None, extra_pnginfo=None):
         method = self.methods.get(method)
         filename_prefix += self.prefix_append
-        full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, self.output_dir, images[0].shape[1], images[0].shape[0])
+        num_files = 1 if num_frames == 0 else math.ceil(len(images) / num_frames)
+        full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, self.output_dir, images[0].shape[1], images[0].shape[0], count=num_files)
         results: list[FileLocator] = []
-        pil_images = []
-        for image in images:
-            i = 255. * image.cpu().numpy()
-            img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-            pil_images.append(img)
+        pil_images = [Image.fromarray(image) for image in comfy.output_writer.to_uint8(images)]
 
         metadata = pil_images[0].getexif()
         if not args.disable_metadata:
@@ -182,18 +181,15 @@ class SaveAnimatedPNG:
     FUNCTION = "save_images"
 
     OUTPUT_NODE = True
+    ACCEPTS_COMPACT_IMAGES = True
 
     CATEGORY = "image/animation"
 
     def save_images(self, images, fps, compress_level, filename_prefix="ComfyUI", prompt=None, extra_pnginfo=None):
         filename_prefix += self.prefix_append
-        full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, self.output_dir, images[0].shape[1], images[0].shape[0])
+        full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, self.output_dir, images[0].shape[1], images[0].shape[0], count=1)
         results = list()
-        pil_images = []
-        for image in images:
-            i = 255. * image.cpu().numpy()
-            img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-            pil_images.append(img)
+        pil_images = [Image.fromarray(image) for image in comfy.output_writer.to_uint8(images)]
 
         metadata = None
         if not args.disable_metadata:
@@ -502,7 +498,7 @@ class SaveSVGNode:
 
     def save_svg(self, svg: SVG, filename_prefix="svg/ComfyUI", prompt=None, extra_pnginfo=None):
         filename_prefix += self.prefix_append
-        full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, self.output_dir)
+        full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(filename_prefix, self.output_dir, count=len(svg.data))
         results = list()
 
         # Prepare metadata JSON
@@ -217,6 +217,31 @@ class LatentBatchSeedBehavior:
 
         return (samples_out,)
 
+class LatentNoiseSeeds:
+    @classmethod
+    def INPUT_TYPES(s):
+        return {"required": { "samples": ("LATENT",),
+                              "seed_mode": (["batch", "per_sample", "list"], {"tooltip": "batch: the sampler seed generates the noise of the whole batch. per_sample: each latent gets the noise of a batch of one with seed + batch index. list: each latent gets the noise of the seed at its batch index in seeds."}),
+                              "seeds": ("STRING", {"default": "", "tooltip": "Comma separated seeds for the list mode."}),
+                              "noise_device": (["cpu", "gpu"], {"tooltip": "Generating the noise on the gpu is faster for large batches but gives different noise than the cpu."}),}}
+
+    RETURN_TYPES = ("LATENT",)
+    FUNCTION = "op"
+
+    CATEGORY = "latent/advanced"
+
+    def op(self, samples, seed_mode, seeds, noise_device):
+        samples_out = samples.copy()
+        options = {"device": noise_device}
+        if seed_mode == "per_sample":
+            options["seeds"] = "per_sample"
+        elif seed_mode == "list":
+            options["seeds"] = [int(x) for x in seeds.replace("\n", ",").split(",") if len(x.strip()) > 0]
+            if len(options["seeds"]) == 0:
+                raise ValueError("The list seed mode needs at least one seed.")
+        samples_out["noise_options"] = options
+        return (samples_out,)
+
 class LatentApplyOperation:
     @classmethod
     def INPUT_TYPES(s):
@@ -351,6 +376,7 @@ NODE_CLASS_MAPPINGS = {
     "LatentCut": LatentCut,
     "LatentBatch": LatentBatch,
     "LatentBatchSeedBehavior": LatentBatchSeedBehavior,
+    "LatentNoiseSeeds": LatentNoiseSeeds,
     "LatentApplyOperation": LatentApplyOperation,
     "LatentApplyOperationCFG": LatentApplyOperationCFG,
     "LatentOperationTonemapReinhard": LatentOperationTonemapReinhard,
@@ -1,6 +1,8 @@
 from typing_extensions import override
-from comfy_api.latest import ComfyExtension, io
-from comfy_api.torch_helpers import set_torch_compile_wrapper
+from comfy_api.latest import ComfyExtension, io, ui
+from comfy_api.torch_helpers import set_torch_compile_wrapper, warmup_torch_compile
+from comfy_api.torch_helpers.torch_compile import parse_warmup_shapes
+import comfy.samplers
 
 
 class TorchCompileModel(io.ComfyNode):
@@ -27,11 +29,43 @@ class TorchCompileModel(io.ComfyNode):
         return io.NodeOutput(m)
 
 
+class TorchCompileWarmup(io.ComfyNode):
+    @classmethod
+    def define_schema(cls) -> io.Schema:
+        return io.Schema(
+            node_id="TorchCompileWarmup",
+            category="_for_testing",
+            description="Compiles a model from TorchCompileModel for a list of resolutions and batch sizes by sampling empty latents, and reports the compile time and the steady state step time of each.",
+            inputs=[
+                io.Model.Input("model"),
+                io.Conditioning.Input("positive"),
+                io.Conditioning.Input("negative"),
+                io.String.Input("resolutions", default="1024x1024", tooltip="Comma separated list of widthxheight."),
+                io.String.Input("batch_sizes", default="1", tooltip="Comma separated list of batch sizes, each resolution is compiled for each batch size."),
+                io.Int.Input("steps", default=2, min=1, max=100),
+                io.Float.Input("cfg", default=8.0, min=0.0, max=100.0, step=0.1, round=0.01),
+                io.Combo.Input("sampler_name", options=comfy.samplers.SAMPLER_NAMES),
+                io.Combo.Input("scheduler", options=comfy.samplers.SCHEDULER_NAMES),
+            ],
+            outputs=[io.Model.Output()],
+            is_experimental=True,
+        )
+
+    @classmethod
+    def execute(cls, model, positive, negative, resolutions, batch_sizes, steps, cfg, sampler_name, scheduler) -> io.NodeOutput:
+        shapes = parse_warmup_shapes(resolutions, batch_sizes)
+        results = warmup_torch_compile(model, positive, negative, shapes, steps=steps, cfg=cfg, sampler_name=sampler_name, scheduler=scheduler)
+        report = "\n".join("{}x{} batch {}: compile {:.2f} s, {:.1f} ms per step".format(
+            r["width"], r["height"], r["batch_size"], r["compile_time"], r["step_time"] * 1000) for r in results)
+        return io.NodeOutput(model, ui=ui.PreviewText(report))
+
+
 class TorchCompileExtension(ComfyExtension):
     @override
     async def get_node_list(self) -> list[type[io.ComfyNode]]:
         return [
             TorchCompileModel,
+            TorchCompileWarmup,
         ]
 
 
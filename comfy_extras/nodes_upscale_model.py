@@ -1,4 +1,5 @@
 import logging
+import math
 from spandrel import ModelLoader, ImageModelDescriptor
 from comfy import model_management
 import torch
@@ -58,17 +59,21 @@ class ImageUpscaleWithModel:
         upscale_model.to(device)
         in_img = image.movedim(-1,-3).to(device)
 
-        tile = 512
-        overlap = 32
+        def tile_memory(shape): # same estimate as above for a tile of shape
+            return math.prod(shape) * image.element_size() * max(upscale_model.scale, 1.0) * 384.0
+        (tile, _), (overlap, _), max_batch = comfy.utils.plan_tiled_scale(in_img.shape, (512, 512), 32, tile_memory, model_management.get_free_memory(device), min_tile=128)
 
         oom = True
         while oom:
             try:
                 steps = in_img.shape[0] * comfy.utils.get_tiled_scale_steps(in_img.shape[3], in_img.shape[2], tile_x=tile, tile_y=tile, overlap=overlap)
                 pbar = comfy.utils.ProgressBar(steps)
-                s = comfy.utils.tiled_scale(in_img, lambda a: upscale_model(a), tile_x=tile, tile_y=tile, overlap=overlap, upscale_amount=upscale_model.scale, pbar=pbar)
+                s = comfy.utils.tiled_scale(in_img, lambda a: upscale_model(a), tile_x=tile, tile_y=tile, overlap=overlap, upscale_amount=upscale_model.scale, pbar=pbar, max_batch=max_batch)
                 oom = False
             except model_management.OOM_EXCEPTION as e:
+                if max_batch > 1:
+                    max_batch = 1
+                    continue
                 tile //= 2
                 if tile < 128:
                     raise e
@@ -13,6 +13,8 @@ from comfy_api.input_impl import VideoFromComponents, VideoFromFile
 from comfy_api.util import VideoCodec, VideoComponents, VideoContainer
 from comfy_api.latest import ComfyExtension, io, ui
 from comfy.cli_args import args
+import comfy.compact_image
+import comfy.utils
 
 class SaveWEBM(io.ComfyNode):
     @classmethod
@@ -36,7 +38,7 @@ class SaveWEBM(io.ComfyNode):
     @classmethod
     def execute(cls, images, codec, fps, filename_prefix, crf) -> io.NodeOutput:
         full_output_folder, filename, counter, subfolder, filename_prefix = folder_paths.get_save_image_path(
-            filename_prefix, folder_paths.get_output_directory(), images[0].shape[1], images[0].shape[0]
+            filename_prefix, folder_paths.get_output_directory(), images[0].shape[1], images[0].shape[0], count=1
         )
 
         file = f"{filename}_{counter:05}_.webm"
@@ -94,7 +96,8 @@ class SaveVideo(io.ComfyNode):
             filename_prefix,
             folder_paths.get_output_directory(),
             width,
-            height
+            height,
+            count=1
         )
         saved_metadata = None
         if not args.disable_metadata:
@@ -117,6 +120,8 @@ class SaveVideo(io.ComfyNode):
 
 
 class CreateVideo(io.ComfyNode):
+    ACCEPTS_COMPACT_IMAGES = True
+
     @classmethod
     def define_schema(cls):
         return io.Schema(
@@ -160,10 +165,69 @@ class GetVideoComponents(io.ComfyNode):
 
     @classmethod
     def execute(cls, video: VideoInput) -> io.NodeOutput:
-        components = video.get_components()
+        if isinstance(video, VideoFromFile):
+            components = video.get_compact_components()
+        else:
+            components = video.get_components()
 
         return io.NodeOutput(components.images, components.audio, float(components.frame_rate))
 
+class SliceVideo(io.ComfyNode):
+    @classmethod
+    def define_schema(cls):
+        return io.Schema(
+            node_id="SliceVideo",
+            display_name="Slice Video",
+            category="image/video",
+            description="Selects a time range, every n-th frame and a size of a video. Loaded videos only decode the selected frames.",
+            inputs=[
+                io.Video.Input("video"),
+                io.Float.Input("start_time", default=0.0, min=0.0, max=1e6, step=0.01, tooltip="Start of the selection in seconds."),
+                io.Float.Input("duration", default=0.0, min=0.0, max=1e6, step=0.01, tooltip="Length of the selection in seconds, 0 for the rest of the video."),
+                io.Int.Input("frame_step", default=1, min=1, max=1000, tooltip="Keep every n-th frame, the frame rate is divided accordingly."),
+                io.Int.Input("max_frames", default=0, min=0, max=1000000, tooltip="Maximum number of frames, 0 for no limit."),
+                io.Int.Input("width", default=0, min=0, max=16384, step=2, tooltip="Output width, 0 to keep the width (or the aspect ratio if height is set)."),
+                io.Int.Input("height", default=0, min=0, max=16384, step=2, tooltip="Output height, 0 to keep the height (or the aspect ratio if width is set)."),
+            ],
+            outputs=[
+                io.Video.Output(),
+            ],
+        )
+
+    @classmethod
+    def execute(cls, video: VideoInput, start_time, duration, frame_step, max_frames, width, height) -> io.NodeOutput:
+        size = None
+        if width > 0 or height > 0:
+            w, h = video.get_dimensions()
+            if width == 0:
+                width = max(1, round(w * height / h))
+            if height == 0:
+                height = max(1, round(h * width / w))
+            size = (width, height)
+        duration = duration if duration > 0 else None
+        max_frames = max_frames if max_frames > 0 else None
+
+        if isinstance(video, VideoFromFile):
+            return io.NodeOutput(video.select(start_time=start_time, duration=duration, frame_step=frame_step, frame_limit=max_frames, size=size))
+
+        components = video.get_components()
+        frame_rate = components.frame_rate
+        start = round(start_time * frame_rate)
+        end = None if duration is None else start + round(duration * frame_rate)
+        images = components.images[start:end:frame_step]
+        if max_frames is not None:
+            images = images[:max_frames]
+        if size is not None:
+            images = comfy.compact_image.to_float(images).movedim(-1, 1)
+            images = comfy.utils.common_upscale(images, size[0], size[1], "bilinear", "disabled").movedim(1, -1)
+
+        audio = components.audio
+        if audio is not None:
+            sample_rate = audio["sample_rate"]
+            audio_end = None if end is None else round(end / frame_rate * sample_rate)
+            audio = {"waveform": audio["waveform"][:, :, round(start / frame_rate * sample_rate):audio_end], "sample_rate": sample_rate}
+        return io.NodeOutput(VideoFromComponents(VideoComponents(images=images, audio=audio, frame_rate=frame_rate / frame_step)))
+
 class LoadVideo(io.ComfyNode):
     @classmethod
     def define_schema(cls):
@@ -211,6 +275,7 @@ class VideoExtension(ComfyExtension):
             SaveVideo,
             CreateVideo,
             GetVideoComponents,
+            SliceVideo,
             LoadVideo,
         ]
 
@@ -12,7 +12,10 @@ import asyncio
 
 import torch
 
+import comfy.compact_image
 import comfy.model_management
+import comfy.output_writer
+import folder_paths
 import nodes
 from comfy_execution.caching import (
     BasicCache,
@@ -144,6 +147,7 @@ def get_input_data(inputs, class_def, unique_id, outputs=None, dynprompt=None, e
     input_data_all = {}
     missing_keys = {}
     hidden_inputs_v3 = {}
+    accepts_compact_images = comfy.compact_image.accepts_compact_images(class_def)
     for x in inputs:
         input_data = inputs[x]
         _, input_category, input_info = get_input_info(class_def, x, valid_inputs)
@@ -164,6 +168,8 @@ def get_input_data(inputs, class_def, unique_id, outputs=None, dynprompt=None, e
                 mark_missing()
                 continue
             obj = cached_output[output_index]
+            if not accepts_compact_images:
+                obj = comfy.compact_image.promote(obj)
             input_data_all[x] = obj
         elif input_category is not None:
             input_data_all[x] = [input_data]
@@ -503,6 +509,9 @@ async def execute(server, dynprompt, caches, current_item, extra_data, executed,
                     unblock()
                 asyncio.create_task(await_completion())
                 return (ExecutionResult.PENDING, None, None)
+        if getattr(class_def, "OUTPUT_NODE", False) is True:
+            # the files saved by the node don't make the next save in their folder list it again
+            folder_paths.save_counter_index.saved()
         if len(output_ui) > 0:
             caches.ui.set(unique_id, {
                 "meta": {
@@ -685,6 +694,7 @@ class PromptExecutor:
             for node_id in list(execute_outputs):
                 execution_list.add_node(node_id)
 
+            completed = False
             while not execution_list.is_empty():
                 node_id, error, ex = await execution_list.stage_node_execution()
                 if error is not None:
@@ -703,6 +713,32 @@ class PromptExecutor:
                     execution_list.complete_node_execution()
             else:
                 # Only execute when the while-loop ends without break
+                completed = True
+
+            # the files saved by the output nodes are complete before the history is finalized,
+            # a file that couldn't be written fails the prompt like an error of its node
+            try:
+                await asyncio.to_thread(comfy.output_writer.wait)
+            except comfy.output_writer.SaveError as ex:
+                node_id = dynamic_prompt.get_real_node_id(ex.node_id) if ex.node_id is not None else None
+                if node_id not in dynamic_prompt.original_prompt:
+                    node_id = next((n for n in executed if n in dynamic_prompt.original_prompt), None)
+                if completed:
+                    self.success = False
+                    completed = False
+                    if node_id is None:
+                        logging.error(str(ex))
+                    else:
+                        error = {
+                            "node_id": node_id,
+                            "exception_message": str(ex),
+                            "exception_type": full_type_name(type(ex)),
+                            "traceback": traceback.format_tb((ex.__cause__ or ex).__traceback__),
+                            "current_inputs": {},
+                        }
+                        self.handle_execution_error(prompt_id, dynamic_prompt.original_prompt, current_outputs, executed, error, ex)
+
+            if completed:
                 self.add_message("execution_success", { "prompt_id": prompt_id }, broadcast=False)
 
             ui_outputs = {}
@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 import os
+import json
 import time
 import mimetypes
 import logging
+import threading
 from typing import Literal, List
 from collections.abc import Collection
 
@@ -233,6 +235,157 @@ def get_folder_paths(folder_name: str) -> list[str]:
     folder_name = map_legacy(folder_name)
     return folder_names_and_paths[folder_name][0][:]
 
+class FolderIndex:
+    """
+    Index of the entries of the model directories keyed by their mtime.
+
+    Listing a directory tree only stats its directories, the directories whose mtime
+    changed are listed again with os.scandir so only the changed parts of the tree are
+    re-walked. The index is persisted (load/save) so it survives restarts and can be
+    refreshed by a background thread (start_watcher), the filename lists are then
+    served without checking the directories.
+    """
+    def __init__(self):
+        self.dirs: dict[str, tuple[float, list[str], list[str]]] = {}
+        self.index_file: str | None = None
+        self.roots: dict[str, list[str]] = {}
+        self.dirty = False
+        self.watching = False
+        self.lock = threading.RLock()
+
+    def load(self, index_file: str) -> None:
+        """Loads the persisted index, it is saved to the same file when it changes."""
+        with self.lock:
+            self.index_file = index_file
+            try:
+                with open(index_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                for path, (mtime, files, subdirs) in data.items():
+                    self.dirs.setdefault(path, (mtime, files, subdirs))
+                logging.debug("loaded the model folder index {} with {} directories".format(index_file, len(data)))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logging.warning("Could not load the model folder index {}: {}".format(index_file, e))
+
+    def save(self) -> None:
+        with self.lock:
+            if not self.dirty or self.index_file is None:
+                return
+            temp = "{}.tmp".format(self.index_file)
+            try:
+                os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+                with open(temp, "w", encoding="utf-8") as f:
+                    json.dump(self.dirs, f)
+                os.replace(temp, self.index_file)
+                self.dirty = False
+            except OSError as e:
+                logging.warning("Could not save the model folder index {}: {}".format(self.index_file, e))
+
+    def remove_tree(self, path: str) -> None:
+        self.dirs.pop(path, None)
+        prefix = os.path.join(path, "")
+        for p in [p for p in self.dirs if p.startswith(prefix)]:
+            self.dirs.pop(p)
+
+    def scan_directory(self, path: str) -> tuple[float, list[str], list[str]] | None:
+        """Entry of the directory, listed again if its mtime changed. None if it can't be accessed."""
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            if path in self.dirs:
+                self.remove_tree(path)
+                self.dirty = True
+            return None
+
+        entry = self.dirs.get(path, None)
+        if entry is not None and entry[0] == mtime:
+            return entry
+
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(path) as it:
+                for e in it:
+                    try:
+                        is_dir = e.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        subdirs.append(e.name)
+                    else:
+                        files.append(e.name)
+        except OSError:
+            return None
+
+        if entry is not None:
+            for d in set(entry[2]) - set(subdirs):
+                self.remove_tree(os.path.join(path, d))
+        entry = (mtime, files, subdirs)
+        self.dirs[path] = entry
+        self.dirty = True
+        return entry
+
+    def walk(self, directory: str, excluded_dir_names: list[str], refresh: bool = True) -> tuple[list[str], dict[str, float]]:
+        """Files relative to directory and the mtimes of the directories of the tree, like recursive_search.
+
+        With refresh False the indexed entries of a tree that was walked before are used without
+        checking the directories."""
+        result = []
+        dirs = {}
+        with self.lock:
+            refresh = refresh or directory not in self.roots
+            self.roots[directory] = excluded_dir_names
+            stack = [directory]
+            while len(stack) > 0:
+                path = stack.pop()
+                entry = None if refresh else self.dirs.get(path, None)
+                if entry is None:
+                    entry = self.scan_directory(path)
+                    if entry is None:
+                        logging.warning(f"Warning: Unable to access {path}. Skipping this path.")
+                        continue
+                mtime, files, subdirs = entry
+                dirs[path] = mtime
+                relative = os.path.relpath(path, directory)
+                if relative == ".":
+                    result.extend(files)
+                else:
+                    result.extend(os.path.join(relative, f) for f in files)
+                stack.extend(os.path.join(path, d) for d in reversed(subdirs) if d not in excluded_dir_names)
+        return result, dirs
+
+    def refresh(self) -> set[str]:
+        """Refreshes the trees that were listed, returns the model folder names containing the trees that changed."""
+        changed = set()
+        for root, excluded_dir_names in list(self.roots.items()):
+            with self.lock:
+                dirty = self.dirty
+                self.dirty = False
+                self.walk(root, excluded_dir_names)
+                if self.dirty:
+                    changed.update(name for name, (paths, _) in list(folder_names_and_paths.items()) if root in paths)
+                self.dirty = self.dirty or dirty
+        return changed
+
+    def start_watcher(self, interval: float) -> None:
+        """Refreshes the index every interval seconds in a daemon thread."""
+        def watch():
+            while True:
+                try:
+                    for folder_name in self.refresh():
+                        logging.debug("model folder {} changed".format(folder_name))
+                        filename_list_cache.pop(folder_name, None)
+                    self.save()
+                except Exception as e:
+                    logging.warning("Error refreshing the model folder index: {}".format(e))
+                self.watching = True
+                time.sleep(interval)
+
+        threading.Thread(target=watch, daemon=True, name="model_folder_watcher").start()
+
+folder_index = FolderIndex()
+
 def recursive_search(directory: str, excluded_dir_names: list[str] | None=None) -> tuple[list[str], dict[str, float]]:
     if not os.path.isdir(directory):
         return [], {}
@@ -240,37 +393,8 @@ def recursive_search(directory: str, excluded_dir_names: list[str] | None=None)
     if excluded_dir_names is None:
         excluded_dir_names = []
 
-    result = []
-    dirs = {}
-
-    # Attempt to add the initial directory to dirs with error handling
-    try:
-        dirs[directory] = os.path.getmtime(directory)
-    except FileNotFoundError:
-        logging.warning(f"Warning: Unable to access {directory}. Skipping this path.")
-
     logging.debug("recursive file list on directory {}".format(directory))
-    dirpath: str
-    subdirs: list[str]
-    filenames: list[str]
-
-    for dirpath, subdirs, filenames in os.walk(directory, followlinks=True, topdown=True):
-        subdirs[:] = [d for d in subdirs if d not in excluded_dir_names]
-        for file_name in filenames:
-            try:
-                relative_path = os.path.relpath(os.path.join(dirpath, file_name), directory)
-                result.append(relative_path)
-            except:
-                logging.warning(f"Warning: Unable to access {file_name}. Skipping this file.")
-                continue
-
-        for d in subdirs:
-            path: str = os.path.join(dirpath, d)
-            try:
-                dirs[path] = os.path.getmtime(path)
-            except FileNotFoundError:
-                logging.warning(f"Warning: Unable to access {path}. Skipping this path.")
-                continue
+    result, dirs = folder_index.walk(directory, excluded_dir_names, refresh=not folder_index.watching)
     logging.debug("found {} files".format(len(result)))
     return result, dirs
 
@@ -334,11 +458,13 @@ def cached_filename_list_(folder_name: str) -> tuple[list[str], dict[str, float]
         return None
     out = filename_list_cache[folder_name]
 
-    for x in out[1]:
-        time_modified = out[1][x]
-        folder = x
-        if os.path.getmtime(folder) != time_modified:
-            return None
+    # the watcher removes the lists of the folders that changed
+    if not folder_index.watching:
+        for x in out[1]:
+            time_modified = out[1][x]
+            folder = x
+            if os.path.getmtime(folder) != time_modified:
+                return None
 
     folders = folder_names_and_paths[folder_name]
     for x in folders[0]:
@@ -355,19 +481,169 @@ def get_filename_list(folder_name: str) -> list[str]:
         out = get_filename_list_(folder_name)
         global filename_list_cache
         filename_list_cache[folder_name] = out
+        folder_index.save()
     cache_helper.set(folder_name, out)
     return list(out[0])
 
-def get_save_image_path(filename_prefix: str, output_dir: str, image_width=0, image_height=0) -> tuple[str, str, int, str, str]:
-    def map_filename(filename: str) -> tuple[int, str]:
-        prefix_len = len(os.path.basename(filename_prefix))
-        prefix = filename[:prefix_len + 1]
-        try:
-            digits = int(filename[prefix_len + 1:].split('_')[0])
-        except:
-            digits = 0
-        return digits, prefix
+class SaveCounterIndex:
+    """
+    Last counter used by the saved files of each (folder, filename prefix).
+
+    A folder is scanned once, the counters are then reserved in memory so saving a
+    file does not list the whole folder. The modification time of the folder is
+    recorded after the scan and again right after our own files are written (saved()),
+    a folder modified since by something else (another instance sharing the folder, a
+    copy or a sync tool) or that was deleted or replaced is scanned again. Files
+    deleted from a folder are never reused. The counters of the folders in the output
+    directory are persisted and trusted on the next start if the folder was not
+    modified since.
+    """
+    def __init__(self):
+        self.folders: dict[str, dict] = {}
+        self.persisted: dict[str, dict] | None = None
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def scan(folder: str) -> dict[str, int]:
+        """Last counter of every prefix in folder, for files named {prefix}_{counter}[_...]."""
+        counters: dict[str, int] = {}
+        for name in os.listdir(folder):
+            i = name.find("_")
+            while i >= 0:
+                try:
+                    digits = int(name[i + 1:].split('_')[0])
+                except ValueError:
+                    digits = None
+                if digits is not None:
+                    prefix = os.path.normcase(name[:i])
+                    counters[prefix] = max(counters.get(prefix, 0), digits)
+                i = name.find("_", i + 1)
+        return counters
+
+    def index_file(self) -> str:
+        return os.path.join(get_user_directory(), "save_counters.json")
+
+    def load_persisted(self) -> dict[str, dict]:
+        if self.persisted is None:
+            self.persisted = {}
+            try:
+                with open(self.index_file(), "r", encoding="utf-8") as f:
+                    self.persisted = json.load(f)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logging.warning("Could not load the save counter index {}: {}".format(self.index_file(), e))
+        return self.persisted
 
+    def folder_counters(self, folder: str, key: str) -> dict:
+        try:
+            st = os.stat(folder)
+        except FileNotFoundError:
+            self.folders.pop(key, None)
+            os.makedirs(folder, exist_ok=True)
+            st = os.stat(folder)
+
+        entry = self.folders.get(key, None)
+        if entry is not None and entry["ino"] == st.st_ino and entry["mtime_ns"] == st.st_mtime_ns and not entry["rescan"]:
+            return entry
+
+        persisted = self.load_persisted().pop(key, None)
+        if entry is None and persisted is not None and persisted.get("ino") == st.st_ino and persisted.get("mtime_ns") == st.st_mtime_ns:
+            counters = persisted["counters"]
+        else:
+            counters = self.scan(folder)
+            if entry is not None and entry["ino"] == st.st_ino:
+                # keep the counters reserved for files that are not written yet
+                for prefix, c in entry["counters"].items():
+                    counters[prefix] = max(counters.get(prefix, 0), c)
+
+        entry = {"ino": st.st_ino, "mtime_ns": st.st_mtime_ns, "counters": counters, "rescan": False}
+        self.folders[key] = entry
+        return entry
+
+    def reserve(self, folder: str, prefix: str, count: int | None = None) -> int:
+        """First of count consecutive counters for prefix in folder, count None is an unknown number
+        of files: the folder is scanned again on the next call."""
+        key = os.path.normcase(os.path.abspath(folder))
+        prefix = os.path.normcase(prefix)
+        with self.lock:
+            entry = self.folder_counters(folder, key)
+            counter = entry["counters"].get(prefix, 0) + 1
+            if count is None:
+                entry["rescan"] = True
+            elif count > 0:
+                entry["counters"][prefix] = counter + count - 1
+                self.dirty = True
+            return counter
+
+    def record_mtimes(self, keys) -> None:
+        for key in keys:
+            entry = self.folders.get(key, None)
+            if entry is None:
+                continue
+            try:
+                st = os.stat(key)
+            except OSError:
+                continue
+            if st.st_ino == entry["ino"]:
+                entry["mtime_ns"] = st.st_mtime_ns
+
+    def saved(self, folder: str | None = None) -> None:
+        """Records the modification time of folder (of all the folders if None), called right after files
+        were written to it so the next save in the folder doesn't list it again."""
+        with self.lock:
+            if folder is None:
+                self.record_mtimes(list(self.folders.keys()))
+            else:
+                self.record_mtimes([os.path.normcase(os.path.abspath(folder))])
+
+    def save(self) -> None:
+        """Records the modification time of the folders and persists the counters of the folders in the output
+        directory, called once the saved files are written."""
+        with self.lock:
+            self.record_mtimes(list(self.folders.keys()))
+
+            if not self.dirty:
+                return
+            output_dir = os.path.normcase(os.path.abspath(get_output_directory()))
+            data = dict(self.load_persisted())
+            for key, entry in self.folders.items():
+                if entry["rescan"]:
+                    continue
+                try:
+                    if os.path.commonpath((output_dir, key)) != output_dir:
+                        continue
+                except ValueError:
+                    continue
+                if os.path.isdir(key):
+                    data[key] = {"ino": entry["ino"], "mtime_ns": entry["mtime_ns"], "counters": entry["counters"]}
+
+            path = self.index_file()
+            temp = "{}.tmp".format(path)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(temp, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(temp, path)
+                self.dirty = False
+            except OSError as e:
+                logging.warning("Could not save the save counter index {}: {}".format(path, e))
+
+    def clear(self) -> None:
+        with self.lock:
+            self.folders.clear()
+            self.persisted = None
+            self.dirty = False
+
+save_counter_index = SaveCounterIndex()
+
+def get_save_image_path(filename_prefix: str, output_dir: str, image_width=0, image_height=0, count: int | None = None) -> tuple[str, str, int, str, str]:
+    """
+    Output folder, filename and first counter for the files saved with filename_prefix. count is
+    the number of consecutive counters the caller uses, when it is None the next call lists the
+    folder to find the files that were saved.
+    """
     def compute_vars(input: str, image_width: int, image_height: int) -> str:
         input = input.replace("%width%", str(image_width))
         input = input.replace("%height%", str(image_height))
@@ -396,13 +672,7 @@ def get_save_image_path(filename_prefix: str, output_dir: str, image_width=0, im
         logging.error(err)
         raise Exception(err)
 
-    try:
-        counter = max(filter(lambda a: os.path.normcase(a[1][:-1]) == os.path.normcase(filename) and a[1][-1] == "_", map(map_filename, os.listdir(full_output_folder))))[0] + 1
-    except ValueError:
-        counter = 1
-    except FileNotFoundError:
-        os.makedirs(full_output_folder, exist_ok=True)
-        counter = 1
+    counter = save_counter_index.reserve(full_output_folder, filename, count)
     return full_output_folder, filename, counter, subfolder, filename_prefix
 
 def get_input_subfolders() -> list[str]:
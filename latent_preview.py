@@ -5,7 +5,9 @@ from comfy.taesd.taesd import TAESD
 import comfy.model_management
 import folder_paths
 import comfy.utils
+import collections
 import logging
+import time
 
 MAX_PREVIEW_RESOLUTION = args.preview_size
 
@@ -19,6 +21,12 @@ def preview_to_image(latent_image):
 
         return Image.fromarray(latents_ubyte.numpy())
 
+def preview_latent(x0):
+    """Only the first sample and the first frame of video latents are decoded for previews."""
+    if x0.ndim == 5:
+        return x0[:1, :, :1]
+    return x0[:1]
+
 class LatentPreviewer:
     def decode_latent_to_preview(self, x0):
         pass
@@ -32,7 +40,10 @@ class TAESDPreviewerImpl(LatentPreviewer):
         self.taesd = taesd
 
     def decode_latent_to_preview(self, x0):
-        x_sample = self.taesd.decode(x0[:1])[0].movedim(0, 2)
+        x0 = preview_latent(x0)
+        if x0.ndim == 5:
+            x0 = x0[:, :, 0]
+        x_sample = self.taesd.decode(x0)[0].movedim(0, 2)
         return preview_to_image(x_sample)
 
 
@@ -44,6 +55,7 @@ class Latent2RGBPreviewer(LatentPreviewer):
             self.latent_rgb_factors_bias = torch.tensor(latent_rgb_factors_bias, device="cpu")
 
     def decode_latent_to_preview(self, x0):
+        x0 = preview_latent(x0)
         self.latent_rgb_factors = self.latent_rgb_factors.to(dtype=x0.dtype, device=x0.device)
         if self.latent_rgb_factors_bias is not None:
             self.latent_rgb_factors_bias = self.latent_rgb_factors_bias.to(dtype=x0.dtype, device=x0.device)
@@ -59,6 +71,10 @@ class Latent2RGBPreviewer(LatentPreviewer):
         return preview_to_image(latent_image)
 
 
+# previewers are kept resident so the TAESD weights aren't loaded again on every sampling run
+previewer_cache = collections.OrderedDict()
+MAX_CACHED_PREVIEWERS = 4
+
 def get_previewer(device, latent_format):
     previewer = None
     method = args.preview_method
@@ -76,6 +92,11 @@ def get_previewer(device, latent_format):
         if method == LatentPreviewMethod.Auto:
             method = LatentPreviewMethod.Latent2RGB
 
+        key = (method, type(latent_format), latent_format.latent_channels, taesd_decoder_path, str(device))
+        if key in previewer_cache:
+            previewer_cache.move_to_end(key)
+            return previewer_cache[key]
+
         if method == LatentPreviewMethod.TAESD:
             if taesd_decoder_path:
                 taesd = TAESD(None, taesd_decoder_path, latent_channels=latent_format.latent_channels).to(device)
@@ -86,14 +107,43 @@ def get_previewer(device, latent_format):
         if previewer is None:
             if latent_format.latent_rgb_factors is not None:
                 previewer = Latent2RGBPreviewer(latent_format.latent_rgb_factors, latent_format.latent_rgb_factors_bias)
+
+        previewer_cache[key] = previewer
+        while len(previewer_cache) > MAX_CACHED_PREVIEWERS:
+            previewer_cache.popitem(last=False)
     return previewer
 
+class PreviewScheduler:
+    """Decides on which steps a preview gets decoded: at most every --preview-interval ms (or every
+    --preview-steps steps) and never more often than what keeps previews below max_cost of the sampling time."""
+    def __init__(self, interval=None, steps=None, max_cost=0.1):
+        self.interval = (args.preview_interval if interval is None else interval) / 1000.0
+        self.steps = args.preview_steps if steps is None else steps
+        self.max_cost = max_cost
+        self.last_step = None
+        self.last_time = 0.0
+        self.decode_time = 0.0
+
+    def should_preview(self, step, total_steps):
+        if self.last_step is None or step + 1 >= total_steps:
+            return True
+        if self.steps > 0:
+            return step - self.last_step >= self.steps
+        interval = max(self.interval, self.decode_time * (1.0 - self.max_cost) / self.max_cost)
+        return time.perf_counter() - self.last_time >= interval
+
+    def previewed(self, step, decode_time):
+        self.last_step = step
+        self.last_time = time.perf_counter()
+        self.decode_time = decode_time
+
 def prepare_callback(model, steps, x0_output_dict=None):
     preview_format = "JPEG"
     if preview_format not in ["JPEG", "PNG"]:
         preview_format = "JPEG"
 
     previewer = get_previewer(model.load_device, model.model.latent_format)
+    scheduler = PreviewScheduler()
 
     pbar = comfy.utils.ProgressBar(steps)
     def callback(step, x0, x, total_steps):
@@ -101,8 +151,9 @@ def prepare_callback(model, steps, x0_output_dict=None):
             x0_output_dict["x0"] = x0
 
         preview_bytes = None
-        if previewer:
+        if previewer and scheduler.should_preview(step, total_steps):
+            start = time.perf_counter()
             preview_bytes = previewer.decode_latent_to_preview_image(preview_format, x0)
+            scheduler.previewed(step, time.perf_counter() - start)
         pbar.update_absolute(step + 1, total_steps, preview_bytes)
     return callback
-
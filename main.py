@@ -202,6 +202,7 @@ def prompt_worker(q, server_instance):
                             messages=e.status_messages))
             if server_instance.client_id is not None:
                 server_instance.send_sync("executing", {"node": None, "prompt_id": prompt_id}, server_instance.client_id)
+            folder_paths.save_counter_index.save()
 
             current_time = time.perf_counter()
             execution_time = current_time - execution_start_time
@@ -302,6 +303,10 @@ def start_comfyui(asyncio_loop=None):
         folder_paths.set_temp_directory(temp_dir)
     cleanup_temp()
 
+    folder_paths.folder_index.load(os.path.join(folder_paths.get_user_directory(), "model_folder_index.json"))
+    if args.model_folder_watch_interval > 0:
+        folder_paths.folder_index.start_watcher(args.model_folder_watch_interval)
+
     if args.windows_standalone_build:
         try:
             import new_updater
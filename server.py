@@ -26,6 +26,7 @@ import mimetypes
 from comfy.cli_args import args
 import comfy.utils
 import comfy.model_management
+import comfy.output_writer
 from comfy_api import feature_flags
 import node_helpers
 from comfyui_version import __version__
@@ -48,6 +49,22 @@ async def send_socket_catch_exception(function, message):
     except (aiohttp.ClientError, aiohttp.ClientPayloadError, ConnectionResetError, BrokenPipeError, ConnectionError) as err:
         logging.warning("send error: {}".format(err))
 
+def encode_preview_image(image_data):
+    image_type = image_data[0]
+    image = image_data[1]
+    max_size = image_data[2]
+    if max_size is not None:
+        if hasattr(Image, 'Resampling'):
+            resampling = Image.Resampling.BILINEAR
+        else:
+            resampling = Image.Resampling.LANCZOS
+
+        image = ImageOps.contain(image, (max_size, max_size), resampling)
+
+    bytesIO = BytesIO()
+    image.save(bytesIO, format=image_type, quality=95, compress_level=1)
+    return bytesIO.getvalue()
+
 @web.middleware
 async def compress_body(request: web.Request, handler):
     accept_encoding = request.headers.get("Accept-Encoding", "")
@@ -442,6 +459,9 @@ class PromptServer():
                 filename = os.path.basename(filename)
                 file = os.path.join(output_dir, filename)
 
+                if comfy.output_writer.is_pending(file):
+                    await asyncio.to_thread(comfy.output_writer.wait_for_file, file)
+
                 if os.path.isfile(file):
                     if 'preview' in request.rel_url.query:
                         with Image.open(file) as img:
@@ -565,7 +585,8 @@ class PromptServer():
                     "python_version": sys.version,
                     "pytorch_version": comfy.model_management.torch_version,
                     "embedded_python": os.path.split(os.path.split(sys.executable)[0])[1] == "python_embeded",
-                    "argv": sys.argv
+                    "argv": sys.argv,
+                    **comfy.model_management.host_memory_stats(),
                 },
                 "devices": [
                     {
@@ -864,40 +885,19 @@ class PromptServer():
 
     async def send_image(self, image_data, sid=None):
         image_type = image_data[0]
-        image = image_data[1]
-        max_size = image_data[2]
-        if max_size is not None:
-            if hasattr(Image, 'Resampling'):
-                resampling = Image.Resampling.BILINEAR
-            else:
-                resampling = Image.Resampling.LANCZOS
-
-            image = ImageOps.contain(image, (max_size, max_size), resampling)
         type_num = 1
         if image_type == "JPEG":
             type_num = 1
         elif image_type == "PNG":
             type_num = 2
 
-        bytesIO = BytesIO()
-        header = struct.pack(">I", type_num)
-        bytesIO.write(header)
-        image.save(bytesIO, format=image_type, quality=95, compress_level=1)
-        preview_bytes = bytesIO.getvalue()
+        # the resize and encode run in a worker thread so they don't block the event loop
+        image_bytes = await asyncio.to_thread(encode_preview_image, image_data)
+        preview_bytes = struct.pack(">I", type_num) + image_bytes
         await self.send_bytes(BinaryEventTypes.PREVIEW_IMAGE, preview_bytes, sid=sid)
 
     async def send_image_with_metadata(self, image_data, metadata=None, sid=None):
         image_type = image_data[0]
-        image = image_data[1]
-        max_size = image_data[2]
-        if max_size is not None:
-            if hasattr(Image, 'Resampling'):
-                resampling = Image.Resampling.BILINEAR
-            else:
-                resampling = Image.Resampling.LANCZOS
-
-            image = ImageOps.contain(image, (max_size, max_size), resampling)
-
         mimetype = "image/png" if image_type == "PNG" else "image/jpeg"
 
         # Prepare metadata
@@ -911,9 +911,7 @@ class PromptServer():
         metadata_length = len(metadata_json)
 
         # Prepare image data
-        bytesIO = BytesIO()
-        image.save(bytesIO, format=image_type, quality=95, compress_level=1)
-        image_bytes = bytesIO.getvalue()
+        image_bytes = await asyncio.to_thread(encode_preview_image, image_data)
 
         # Combine metadata and image
         combined_data = bytearray()
@@ -0,0 +1,46 @@
+import gc
+import torch
+import uuid
+import weakref
+
+from comfy_api.torch_helpers import torch_compile
+
+
+class FakePatcher:
+    def __init__(self, module):
+        self.module = module
+        self.patches_uuid = uuid.uuid4()
+
+    def get_model_object(self, key):
+        return self.module
+
+
+def test_compiled_module_reused():
+    kwargs = {"backend": "inductor", "options": None, "mode": None, "fullgraph": False, "dynamic": None}
+    model = FakePatcher(torch.nn.Linear(4, 4))
+    compiled = torch_compile.get_compiled_module(model, "diffusion_model", kwargs)
+    assert torch_compile.get_compiled_module(model, "diffusion_model", kwargs) is compiled
+    assert torch_compile.get_compiled_module(model, "diffusion_model", dict(kwargs, mode="max-autotune")) is not compiled
+
+    model.patches_uuid = uuid.uuid4()
+    assert torch_compile.get_compiled_module(model, "diffusion_model", kwargs) is not compiled
+
+
+def test_compiled_module_collected():
+    kwargs = {"backend": "eager", "options": None, "mode": None, "fullgraph": False, "dynamic": None}
+    module = torch.nn.Linear(4, 4)
+    compiled = torch_compile.get_compiled_module(FakePatcher(module), "diffusion_model", kwargs)
+    compiled(torch.randn(2, 4))
+    # the compiled module isn't registered as a submodule
+    assert len(list(module.children())) == 0
+    assert list(module.state_dict().keys()) == ["weight", "bias"]
+
+    ref = weakref.ref(module)
+    del module, compiled
+    gc.collect()
+    assert ref() is None
+
+
+def test_parse_warmup_shapes():
+    assert torch_compile.parse_warmup_shapes("1024x1024, 832X1216", "1,2") == [(1, 1024, 1024), (2, 1024, 1024), (1, 832, 1216), (2, 832, 1216)]
+    assert torch_compile.parse_warmup_shapes("512x768", "") == [(1, 512, 768)]
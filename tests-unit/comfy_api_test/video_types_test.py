@@ -52,7 +52,7 @@ def create_test_video(width=4, height=4, frames=3, fps=30):
 
         for i in range(frames):
             frame = av.VideoFrame.from_ndarray(
-                torch.ones(height, width, 3, dtype=torch.uint8).numpy() * (i * 85),
+                torch.ones(height, width, 3, dtype=torch.uint8).numpy() * (i * 85 % 256),
                 format="rgb24",
             )
             frame = frame.reformat(format="yuv420p")
@@ -237,3 +237,118 @@ def test_duration_consistency(video_components):
     manual_duration = float(components.images.shape[0] / components.frame_rate)
 
     assert duration == pytest.approx(manual_duration)
+
+
+def test_video_from_file_selection():
+    """Selections decode the selected frames only and compose"""
+    file_path = create_test_video(width=8, height=8, frames=30, fps=30)
+    try:
+        video = VideoFromFile(file_path)
+        full = video.get_components()
+        assert full.images.shape == (30, 8, 8, 3)
+
+        selected = video.select(start_time=0.2, duration=0.5, frame_step=3)
+        components = selected.get_components()
+        assert torch.equal(components.images, full.images[6:21:3])
+        assert components.frame_rate == 10
+        assert abs(selected.get_duration() - 0.5) < EPSILON
+
+        selected = selected.select(start_time=0.1, frame_limit=2, size=(4, 6))
+        assert selected.get_dimensions() == (4, 6)
+        assert selected.get_components().images.shape == (2, 6, 4, 3)
+    finally:
+        os.unlink(file_path)
+
+
+def test_video_from_file_chained_selection():
+    """The frame limit of a selection still applies when a selection of it moves the start"""
+    file_path = create_test_video(width=8, height=8, frames=30, fps=30)
+    try:
+        full = VideoFromFile(file_path).get_components()
+        selected = VideoFromFile(file_path).select(frame_limit=10).select(start_time=0.2)
+        assert torch.equal(selected.get_components().images, full.images[6:10])
+
+        selected = VideoFromFile(file_path).select(start_time=0.1, frame_step=2, frame_limit=6).select(start_time=0.2)
+        assert torch.equal(selected.get_components().images, full.images[9:15:2])
+
+        selected = VideoFromFile(file_path).select(frame_limit=10).select(start_time=0.1, frame_limit=2)
+        assert torch.equal(selected.get_components().images, full.images[3:5])
+    finally:
+        os.unlink(file_path)
+
+
+def test_video_from_file_selection_save_to():
+    """Saving a selection re-encodes the selected frames"""
+    file_path = create_test_video(width=8, height=8, frames=30, fps=30)
+    try:
+        selected = VideoFromFile(file_path).select(frame_step=2, frame_limit=5)
+        output = io.BytesIO()
+        selected.save_to(output)
+        saved = VideoFromFile(output).get_components()
+        assert saved.images.shape == (5, 8, 8, 3)
+        assert saved.frame_rate == 15
+    finally:
+        os.unlink(file_path)
+
+
+def create_test_video_with_audio(frames=30, fps=30, sample_rate=8000):
+    """Helper to create a temporary video file with a mono audio track as long as the video"""
+    tmp = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False)
+    with av.open(tmp.name, mode="w") as container:
+        stream = container.add_stream("h264", rate=fps)
+        stream.width = 8
+        stream.height = 8
+        stream.pix_fmt = "yuv420p"
+        audio_stream = container.add_stream("aac", rate=sample_rate)
+        audio_stream.layout = "mono"
+
+        for i in range(frames):
+            frame = av.VideoFrame.from_ndarray(torch.full((8, 8, 3), i * 8, dtype=torch.uint8).numpy(), format="rgb24")
+            container.mux(stream.encode(frame.reformat(format="yuv420p")))
+        container.mux(stream.encode(None))
+
+        samples = sample_rate * frames // fps
+        audio_frame = av.AudioFrame.from_ndarray(torch.zeros(1, samples).numpy(), format="fltp", layout="mono")
+        audio_frame.sample_rate = sample_rate
+        audio_frame.pts = 0
+        container.mux(audio_stream.encode(audio_frame))
+        container.mux(audio_stream.encode(None))
+
+    return tmp.name
+
+
+def test_video_from_file_selection_audio():
+    """The audio of a selection ends with its last frame, also when the frame limit ends it"""
+    file_path = create_test_video_with_audio(frames=30, fps=30, sample_rate=8000)
+    try:
+        audio = VideoFromFile(file_path).select(start_time=0.2, frame_limit=6).get_components().audio
+        assert audio["waveform"].shape[-1] == 1600
+
+        audio = VideoFromFile(file_path).select(frame_step=2, frame_limit=3).get_components().audio
+        assert audio["waveform"].shape[-1] == 1600
+
+        audio = VideoFromFile(file_path).select(start_time=0.2, duration=0.1, frame_limit=6).get_components().audio
+        assert audio["waveform"].shape[-1] == 800
+    finally:
+        os.unlink(file_path)
+
+
+def test_video_from_file_compact_components(simple_video_file, monkeypatch):
+    """get_components returns float32 images, only get_compact_components returns compact ones"""
+    import comfy.compact_image
+    from comfy.cli_args import args
+    monkeypatch.setattr(args, "compact_images", True)
+
+    video = VideoFromFile(simple_video_file)
+    images = video.get_components().images
+    assert isinstance(images, torch.Tensor) and images.dtype == torch.float32
+    compact = video.get_compact_components().images
+    assert isinstance(compact, comfy.compact_image.CompactImage)
+    assert torch.equal(compact.to_float(), images)
+
+
+def test_video_from_file_iter_frames(simple_video_file):
+    """Frames are streamed as uint8 chunks"""
+    chunks = list(VideoFromFile(simple_video_file).iter_frames(chunk_size=2))
+    assert [c.shape[0] for c in chunks] == [2, 1]
+    assert chunks[0].dtype == torch.uint8
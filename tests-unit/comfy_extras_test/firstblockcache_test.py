@@ -0,0 +1,72 @@
+import pytest
+import torch
+from unittest.mock import patch
+
+import comfy.model_patcher
+import comfy.sample
+import comfy.supported_models
+from comfy_extras.nodes_firstblockcache import FirstBlockCacheHolder, FirstBlockCacheNode
+from comfy_extras.nodes_slg import SkipLayerGuidanceDiT
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    unet_config = {"image_model": "flux", "guidance_embed": True, "in_channels": 16, "out_channels": 16, "vec_in_dim": 32,
+                   "context_in_dim": 32, "hidden_size": 32, "mlp_ratio": 2.0, "num_heads": 2, "depth": 2, "depth_single_blocks": 2,
+                   "axes_dim": [4, 6, 6], "theta": 10000, "patch_size": 2, "qkv_bias": True}
+    model_config = comfy.supported_models.Flux(unet_config)
+    model_config.set_inference_dtype(torch.float32, None)
+    base_model = model_config.get_model({})
+    for p in base_model.parameters():
+        torch.nn.init.normal_(p, std=0.05)
+    return comfy.model_patcher.ModelPatcher(base_model, torch.device("cpu"), torch.device("cpu"))
+
+
+def sample(model, cfg=1.0):
+    torch.manual_seed(1)
+    positive = [[torch.randn(1, 8, 32), {"pooled_output": torch.randn(1, 32), "guidance": 3.5}]]
+    negative = [[torch.randn(1, 8, 32), {"pooled_output": torch.randn(1, 32), "guidance": 3.5}]]
+    latent = torch.zeros(1, 16, 8, 8)
+    noise = comfy.sample.prepare_noise(latent, 0)
+    with torch.no_grad():
+        return comfy.sample.sample(model, noise, 6, cfg, "euler", "simple", positive, negative, latent, seed=0, disable_pbar=True)
+
+
+def first_block_cache(model, reuse_threshold):
+    return FirstBlockCacheNode.execute(model, reuse_threshold, 1, 0.0, 1.0, False, False).result[0]
+
+
+def skip_block(args, extra_args):
+    return args
+
+
+def test_threshold_zero_matches_unpatched(model):
+    expected = sample(model)
+    assert torch.equal(sample(first_block_cache(model, 0.0)), expected)
+    # the remaining blocks are skipped with a high threshold
+    assert not torch.equal(sample(first_block_cache(model, 3.0)), expected)
+
+
+def test_previous_block_patches_are_kept(model):
+    patched = model.clone()
+    patched.set_model_patch_replace(skip_block, "dit", "double_block", 1)
+    expected = sample(patched)
+    assert not torch.equal(expected, sample(model))
+    assert torch.equal(sample(first_block_cache(patched, 0.0)), expected)
+
+
+def test_slg_calls_bypass_the_cache(model):
+    slg = lambda m: SkipLayerGuidanceDiT().skip_guidance(m, 3.0, 0.0, 1.0, double_layers="1", single_layers="")[0]
+    expected = sample(slg(model), cfg=2.0)
+
+    begin = FirstBlockCacheHolder.begin
+    calls = []
+    def counted_begin(self, *args):
+        calls.append(self.total_forwards)
+        return begin(self, *args)
+
+    with patch.object(FirstBlockCacheHolder, "begin", counted_begin):
+        assert torch.equal(sample(slg(first_block_cache(model, 0.0)), cfg=2.0), expected)
+    # only the cond/uncond call of each step uses the cache, not the SLG call with the skipped layer
+    assert len(calls) == 6
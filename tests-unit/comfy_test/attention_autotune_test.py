@@ -0,0 +1,79 @@
+import json
+import os
+import pytest
+import torch
+from unittest.mock import patch
+
+import comfy.ldm.modules.attention as attention
+
+
+@pytest.fixture
+def table_file(tmp_path):
+    path = str(tmp_path / "attention_autotune.json")
+    with patch.object(attention, "autotune_file", return_value=path), patch.object(attention, "autotune_table", None):
+        yield path
+
+
+def qkv(batch=2, length=24, heads=2, dim_head=8):
+    torch.manual_seed(0)
+    return [torch.randn(batch, length, heads * dim_head) for _ in range(3)]
+
+
+def test_key_contains_batch_size():
+    q, k, _ = qkv(batch=1)
+    q2, k2, _ = qkv(batch=4)
+    assert attention.autotune_key(q, k, 2, None, False) != attention.autotune_key(q2, k2, 2, None, False)
+    # the sequence lengths are bucketed
+    q3, k3, _ = qkv(batch=1, length=30)
+    assert attention.autotune_key(q, k, 2, None, False) == attention.autotune_key(q3, k3, 2, None, False)
+
+
+def test_failing_choice_is_tuned_again(table_file):
+    q, k, v = qkv()
+    key = attention.autotune_key(q, k, 2, None, False)
+    with open(table_file, "w") as f:
+        json.dump({key: "failing"}, f)
+
+    def failing(q, k, v, heads, **kwargs):
+        raise RuntimeError("unsupported sequence length")
+
+    with patch.dict(attention.REGISTERED_ATTENTION_FUNCTIONS, {"failing": failing}), patch.object(attention, "AUTOTUNE_CPU_FUNCTIONS", attention.AUTOTUNE_CPU_FUNCTIONS + ["failing"]):
+        out = attention.attention_autotune(q, k, v, 2)
+    assert torch.allclose(out, attention.attention_basic(q, k, v, 2), atol=1e-5)
+    with open(table_file) as f:
+        assert json.load(f)[key] in attention.autotune_candidates(q.device)
+
+
+def test_save_replaces_the_file(table_file):
+    with open(table_file, "w") as f:
+        json.dump({"previous": "basic"}, f)
+    attention.get_autotune_table()["new"] = "pytorch"
+    # a failed save leaves the previous results intact
+    with patch.object(os, "replace", side_effect=OSError("disk full")):
+        attention.save_autotune_table()
+    with open(table_file) as f:
+        assert json.load(f) == {"previous": "basic"}
+    assert os.listdir(os.path.dirname(table_file)) == ["attention_autotune.json"]
+
+    attention.save_autotune_table()
+    with open(table_file) as f:
+        assert json.load(f) == {"previous": "basic", "new": "pytorch"}
+    assert os.listdir(os.path.dirname(table_file)) == ["attention_autotune.json"]
+
+
+def test_gpu_candidates_are_exact():
+    registered = {name: attention.attention_basic for name in ["sage", "flash", "xformers", "pytorch", "sub_quad", "split", "custom"]}
+    with patch.dict(attention.REGISTERED_ATTENTION_FUNCTIONS, registered, clear=True):
+        assert set(attention.autotune_candidates(torch.device("cuda", 0))) == {"flash", "xformers", "pytorch", "sub_quad", "split"}
+        with patch.object(attention, "AUTOTUNE_GPU_FUNCTIONS", attention.AUTOTUNE_GPU_FUNCTIONS + ["sage"]):
+            assert "sage" in attention.autotune_candidates(torch.device("cuda", 0))
+        assert set(attention.autotune_candidates(torch.device("cpu"))) == {"basic", "pytorch", "sub_quad", "split"}
+
+
+def test_device_name_is_looked_up_once():
+    attention.autotune_device_name.cache_clear()
+    with patch.object(torch.cuda, "get_device_name", return_value="GPU") as get_device_name:
+        assert attention.autotune_device_name(torch.device("cuda", 0)) == "GPU"
+        assert attention.autotune_device_name(torch.device("cuda", 0)) == "GPU"
+    assert get_device_name.call_count == 1
+    attention.autotune_device_name.cache_clear()
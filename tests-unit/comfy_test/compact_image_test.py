@@ -0,0 +1,60 @@
+import numpy as np
+import torch
+from unittest.mock import patch
+
+import comfy.compact_image
+from comfy.compact_image import CompactImage
+from comfy.cli_args import args
+
+
+def test_uint8_round_trip():
+    data = torch.arange(256, dtype=torch.uint8).reshape(1, 16, 16, 1).expand(2, 16, 16, 3).contiguous()
+    image = CompactImage(data)
+    assert image.shape == (2, 16, 16, 3)
+    assert len(image) == 2
+
+    # same values as the float32 images of the loaders
+    expected = torch.from_numpy(data.numpy().astype(np.float32) / 255.0)
+    assert torch.equal(image.to_float(), expected)
+    assert image.to_uint8() is data
+    assert torch.equal(comfy.compact_image.to_uint8(expected), data)
+
+
+def test_fp16():
+    images = torch.rand(1, 8, 8, 3)
+    image = CompactImage(images.half())
+    assert image.to_float().dtype == torch.float32
+    assert torch.allclose(image.to_float(), images, atol=1e-3)
+    assert torch.equal(image.to_uint8(), comfy.compact_image.to_uint8(images.half().float()))
+
+
+def test_from_uint8_and_promote():
+    data = torch.randint(0, 256, (1, 4, 4, 3), dtype=torch.uint8)
+    with patch.object(args, "compact_images", False):
+        assert torch.equal(comfy.compact_image.from_uint8(data), data.float() / 255.0)
+    with patch.object(args, "compact_images", True):
+        image = comfy.compact_image.from_uint8(data)
+    assert isinstance(image, CompactImage)
+
+    values = comfy.compact_image.promote([image, 5])
+    assert torch.equal(values[0], data.float() / 255.0)
+    assert values[1] == 5
+    values = [torch.zeros(1)]
+    assert comfy.compact_image.promote(values) is values
+
+
+def test_opt_in_is_not_inherited():
+    import execution
+    import nodes
+
+    class CustomSaveImage(nodes.SaveImage):
+        pass
+
+    image = CompactImage(torch.randint(0, 256, (1, 4, 4, 3), dtype=torch.uint8))
+    outputs = {"1": [[image]]}
+    inputs = {"images": ["1", 0], "filename_prefix": "test"}
+    for class_def in (nodes.SaveImage, nodes.PreviewImage):
+        input_data = execution.get_input_data(inputs, class_def, "2", outputs)[0]
+        assert input_data["images"][0] is image
+    input_data = execution.get_input_data(inputs, CustomSaveImage, "2", outputs)[0]
+    assert isinstance(input_data["images"][0], torch.Tensor) and input_data["images"][0].dtype == torch.float32
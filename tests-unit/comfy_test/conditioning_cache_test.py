@@ -0,0 +1,61 @@
+import pytest
+import torch
+from unittest.mock import patch
+
+import comfy.conditioning_cache as conditioning_cache
+from comfy.cli_args import args
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    conditioning_cache.clear()
+    yield
+    conditioning_cache.clear()
+
+
+def tokens(weight=1.0, embedding=None):
+    return {"l": [[(49406, 1.0, 0), (320, weight, 1), (embedding if embedding is not None else 1125, 1.0, 2)]]}
+
+
+def test_key_depends_on_tokens_weights_and_identity():
+    key = conditioning_cache.cache_key(["weights", None], {"layer_idx": None}, tokens())
+    assert key == conditioning_cache.cache_key(["weights", None], {"layer_idx": None}, tokens())
+    assert key != conditioning_cache.cache_key(["weights", None], {"layer_idx": None}, tokens(weight=1.1))
+    assert key != conditioning_cache.cache_key(["weights", None], {"layer_idx": -2}, tokens())
+    assert key != conditioning_cache.cache_key(["weights", "patches"], {"layer_idx": None}, tokens())
+    assert key != conditioning_cache.cache_key(["weights", None], {"layer_idx": None}, tokens(embedding=torch.zeros(8)))
+    assert conditioning_cache.cache_key(["weights", None], {}, tokens(embedding=torch.zeros(8))) != conditioning_cache.cache_key(["weights", None], {}, tokens(embedding=torch.ones(8)))
+
+
+def test_lru_eviction():
+    out = lambda: {"cond": torch.zeros(256, 1024), "pooled_output": None}  # 1MB
+    with patch.object(args, "conditioning_cache_size", 2):
+        conditioning_cache.put("a", out())
+        conditioning_cache.put("b", out())
+        assert conditioning_cache.get("a") is not None
+        conditioning_cache.put("c", out())
+
+        assert conditioning_cache.get("b") is None
+        assert conditioning_cache.get("a") is not None
+        assert conditioning_cache.get("c") is not None
+        assert conditioning_cache.cache_size == 2 * 1024 * 1024
+
+
+def test_get_returns_copy():
+    conditioning_cache.put("a", {"cond": torch.ones(2), "pooled_output": None})
+    conditioning_cache.get("a").pop("cond")
+    assert "cond" in conditioning_cache.get("a")
+
+
+def test_disk_persistence(tmp_path):
+    out = {"cond": torch.randn(1, 4, 8), "pooled_output": torch.randn(1, 8), "attention_mask": torch.ones(1, 4)}
+    with patch.object(args, "conditioning_cache_directory", str(tmp_path)):
+        conditioning_cache.put("a", out, persistent=True)
+        conditioning_cache.put("b", out, persistent=False)
+        conditioning_cache.clear()
+
+        assert conditioning_cache.get("b", persistent=True) is None
+        stored = conditioning_cache.get("a", persistent=True)
+        assert set(stored.keys()) == set(out.keys())
+        for k in out:
+            assert torch.equal(stored[k], out[k])
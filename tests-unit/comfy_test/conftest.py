@@ -0,0 +1,4 @@
+from comfy.cli_args import args
+
+# the tests of the model code run on the cpu, model_management picks the device when it is imported
+args.cpu = True
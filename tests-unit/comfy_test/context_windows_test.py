@@ -0,0 +1,86 @@
+import pytest
+import torch
+import uuid
+
+import comfy.conds
+import comfy.context_windows
+import comfy.samplers
+
+
+class Patcher:
+    def prepare_hook_patches_current_keyframe(self, *args):
+        pass
+
+    def prepare_state(self, *args):
+        pass
+
+    def apply_hooks(self, hooks):
+        return {}
+
+
+class Model(torch.nn.Module):
+    current_patcher = Patcher()
+
+    def __init__(self):
+        super().__init__()
+        self.conv = torch.nn.Conv3d(4, 4, 3, padding=1)
+        self.windows = []
+
+    def memory_required(self, input_shape, cond_shapes={}):
+        return 1
+
+    def apply_model(self, x, t, c_crossattn=None, c_concat=None, transformer_options={}, **kwargs):
+        windows = transformer_options["context_windows"]
+        self.windows.append([w.index_list for w in windows])
+        # the frames of the stacked windows line up with the batch
+        assert x.shape[0] % len(windows) == 0 and x.shape[2] == len(windows[0].index_list)
+        if len(windows) > 1:
+            assert transformer_options["context_window"] is None
+        else:
+            assert transformer_options["context_window"] is windows[0]
+        return self.conv(x + c_concat) + c_crossattn.mean()
+
+
+def cond():
+    return [{"model_conds": {"c_crossattn": comfy.conds.CONDCrossAttn(torch.randn(1, 7, 8)), "c_concat": comfy.conds.CONDNoiseShape(torch.randn(1, 4, 1, 8, 8))}, "uuid": uuid.uuid4()}]
+
+
+@pytest.mark.filterwarnings("error:Using a non-tuple sequence for multidimensional indexing")
+@pytest.mark.parametrize("schedule", ["standard_static", "looped_uniform"])
+@pytest.mark.parametrize("fuse_method", ["pyramid", "relative", "overlap-linear"])
+def test_batched_windows_match_sequential(schedule, fuse_method):
+    torch.manual_seed(0)
+    model = Model()
+    x = torch.randn(1, 4, 29, 8, 8)
+    conds = [cond(), cond()]
+    sigmas = torch.linspace(1, 0.1, 3)
+
+    def run(batch_windows):
+        handler = comfy.context_windows.IndexListContextHandler(comfy.context_windows.get_matching_context_schedule(schedule), comfy.context_windows.get_matching_fuse_method(fuse_method),
+                                                                context_length=8, context_overlap=3, dim=2, batch_windows=batch_windows)
+        model_options = {"context_handler": handler, "transformer_options": {"sample_sigmas": sigmas}}
+        model.windows.clear()
+        with torch.no_grad():
+            out = [comfy.samplers.calc_cond_batch(model, conds, x, sigma.view(1), model_options) for sigma in sigmas]
+        return out, [w for call in model.windows for w in call], len(model.windows)
+
+    expected, sequential_windows, sequential_calls = run(False)
+    out, batched_windows, batched_calls = run(True)
+    assert batched_calls < sequential_calls
+    # the same windows are evaluated, context_windows lists the ones stacked in each call
+    assert batched_windows == sequential_windows
+    for a, b in zip(expected, out):
+        for x_a, x_b in zip(a, b):
+            assert torch.allclose(x_a, x_b, atol=1e-5)
+
+
+def test_weights_cache_key_has_dtype_and_device():
+    handler = comfy.context_windows.IndexListContextHandler(comfy.context_windows.get_matching_context_schedule("standard_static"), comfy.context_windows.get_matching_fuse_method("pyramid"),
+                                                            context_length=8, context_overlap=3, dim=2)
+    window = comfy.context_windows.IndexListContextWindow(list(range(8)), dim=2)
+    timestep = torch.ones(1)
+    weights = handler.get_weights_tensor(window, torch.zeros(1, 4, 29, 8, 8), timestep)
+    assert handler.get_weights_tensor(window, torch.zeros(1, 4, 29, 8, 8), timestep) is weights
+    handler.get_weights_tensor(window, torch.zeros(1, 4, 29, 8, 8, dtype=torch.float16), timestep)
+    handler.get_weights_tensor(window, torch.zeros(1, 4, 29, 8, 8, device="meta"), timestep)
+    assert len(handler._weights_cache) == 3
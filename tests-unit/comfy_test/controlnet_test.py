@@ -0,0 +1,161 @@
+import pytest
+import torch
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import comfy.controlnet
+import comfy.model_management
+from comfy.cli_args import args
+
+
+class ControlModel(torch.nn.Module):
+    def __init__(self, seed, max_batch=None):
+        super().__init__()
+        generator = torch.Generator().manual_seed(seed)
+        self.w = torch.nn.Parameter(torch.randn(4, 4, generator=generator))
+        self.dtype = torch.float32
+        self.max_batch = max_batch
+        self.calls = []
+
+    def forward(self, x, hint, timesteps, context, y=None, **kwargs):
+        self.calls.append(x.shape[0])
+        if self.max_batch is not None and x.shape[0] > self.max_batch:
+            raise comfy.model_management.OOM_EXCEPTION("out of memory")
+        h = torch.nn.functional.interpolate(hint, size=x.shape[-2:]).mean(1, keepdim=True)
+        base = torch.einsum("bchw,cd->bdhw", x + h, self.w) + timesteps.view(-1, 1, 1, 1) + context.mean()
+        shared = base * 2
+        return {"input": [base, None, shared], "middle": [base.mean(1, keepdim=True)], "output": [shared]}
+
+
+class ModelSampling:
+    def timestep(self, t):
+        return t
+
+    def calculate_input(self, t, x):
+        return x
+
+
+class LatentFormat:
+    def process_in(self, x):
+        return x * 0.5
+
+
+class VAE:
+    def __init__(self):
+        self.encodes = 0
+
+    def spacial_compression_encode(self):
+        return 2
+
+    def encode(self, image):
+        self.encodes += 1
+        return image.movedim(-1, 1).mean(1, keepdim=True).repeat(1, 4, 1, 1)[:, :, ::2, ::2]
+
+
+@pytest.fixture(autouse=True)
+def empty_hint_cache():
+    comfy.controlnet.hint_cache.clear()
+    yield
+    comfy.controlnet.hint_cache.clear()
+
+
+def controlnet(control_model, hint, strength, previous=None, vae=None, timestep_percent_range=(0.0, 1.0), preprocess_image=lambda a: a):
+    c = comfy.controlnet.ControlNet(control_model, load_device=torch.device("cpu"), preprocess_image=preprocess_image)
+    if vae is not None:
+        c.latent_format = LatentFormat()
+    c.set_cond_hint(hint, strength, timestep_percent_range=timestep_percent_range, vae=vae)
+    if previous is not None:
+        c.set_previous_controlnet(previous)
+    return c
+
+
+def get_control(c):
+    torch.manual_seed(0)
+    x = torch.randn(4, 4, 8, 8)
+    t = torch.tensor([0.5] * 4)
+    cond = {"c_crossattn": torch.randn(4, 5, 16)}
+    c.pre_run(SimpleNamespace(model_sampling=ModelSampling()), lambda percent: 1.0 - percent)
+    out = c.get_control(x, t, cond, 2, {})
+    c.cleanup()
+    return out
+
+
+def assert_control_equal(a, b):
+    assert a.keys() == b.keys()
+    for k in a:
+        for x, y in zip(a[k], b[k]):
+            assert (x is None) == (y is None)
+            if x is not None:
+                assert torch.allclose(x, y, atol=1e-6)
+
+
+def chain(shared_model, other_model, vae, head_range=(0.0, 1.0)):
+    # the first two controlnets share their model and are fused, the last one runs on its own
+    hints = [torch.rand(1, 3, 32, 32), torch.rand(2, 3, 32, 32), torch.rand(1, 3, 16, 16)]
+    c3 = controlnet(other_model, hints[2], 0.3)
+    c2 = controlnet(shared_model, hints[1], 0.7, previous=c3, vae=vae)
+    return controlnet(shared_model, hints[0], 0.5, previous=c2, vae=vae, timestep_percent_range=head_range)
+
+
+@pytest.mark.parametrize("head_active", [True, False])
+def test_fused_matches_unfused(head_active):
+    shared_model, other_model = ControlModel(1), ControlModel(2)
+    c = chain(shared_model, other_model, VAE(), (0.0, 1.0) if head_active else (0.6, 1.0))
+    expected = get_control(c)
+    assert shared_model.calls == ([4, 4] if head_active else [4])
+
+    shared_model.calls.clear()
+    with patch.object(args, "fuse_controlnets", True):
+        assert_control_equal(get_control(c), expected)
+    # one forward for both active controlnets of the shared model
+    assert shared_model.calls == ([8] if head_active else [4])
+
+
+def test_fused_falls_back_on_oom():
+    shared_model, other_model = ControlModel(1), ControlModel(2)
+    c = chain(shared_model, other_model, VAE())
+    expected = get_control(c)
+    shared_model.max_batch = 4
+    shared_model.calls.clear()
+    with patch.object(args, "fuse_controlnets", True):
+        assert_control_equal(get_control(c), expected)
+        assert shared_model.calls == [8, 4, 4]
+        shared_model.calls.clear()
+        # the batched forward isn't tried again
+        assert_control_equal(get_control(c), expected)
+        assert shared_model.calls == [4, 4]
+
+
+def test_chunk_control():
+    base = torch.arange(8.0).reshape(4, 2)
+    shared = base * 2
+    chunks = comfy.controlnet.chunk_control({"input": [base, None, shared], "output": [shared]}, 2)
+    assert len(chunks) == 2
+    for i, chunk in enumerate(chunks):
+        assert torch.equal(chunk["input"][0], base[i * 2:i * 2 + 2])
+        assert chunk["input"][1] is None
+        # the tensors that are shared between the outputs stay shared in the chunks
+        assert chunk["input"][2] is chunk["output"][0]
+
+
+def test_hint_cache():
+    model, vae = ControlModel(1), VAE()
+    hint = torch.rand(1, 3, 16, 16)
+    c = controlnet(model, hint, 1.0, vae=vae)
+    expected = get_control(c)
+    get_control(c)
+    assert vae.encodes == 1
+    # a copy of the controlnet with the same hint and VAE uses the cached hint
+    assert_control_equal(get_control(c.copy()), expected)
+    assert vae.encodes == 1
+
+    # a different hint image, VAE or preprocess function is encoded again
+    get_control(controlnet(model, hint.clone(), 1.0, vae=vae))
+    assert vae.encodes == 2
+    other_vae = VAE()
+    get_control(controlnet(model, hint, 1.0, vae=other_vae))
+    assert other_vae.encodes == 1
+    get_control(controlnet(model, hint, 1.0, vae=vae, preprocess_image=lambda a: a * 2))
+    assert vae.encodes == 3
+    get_control(c)
+    assert vae.encodes == 3
@@ -93,6 +93,42 @@ def test_recursive_search(temp_dir):
     assert set(files) == {"file1.txt", os.path.join("subdir", "file2.txt")}
     assert len(dirs) == 2  # temp_dir and subdir
 
+def test_folder_index(temp_dir):
+    index = folder_paths.FolderIndex()
+    os.makedirs(os.path.join(temp_dir, "a", "b"))
+    os.makedirs(os.path.join(temp_dir, ".git"))
+    open(os.path.join(temp_dir, "a", "b", "file1.txt"), "w").close()
+    files, dirs = index.walk(temp_dir, [".git"])
+    assert files == [os.path.join("a", "b", "file1.txt")]
+    assert len(dirs) == 3
+
+    # only the directories that changed are listed again
+    open(os.path.join(temp_dir, "a", "file2.txt"), "w").close()
+    listed = []
+    scandir = os.scandir
+    def scandir_spy(path):
+        listed.append(path)
+        return scandir(path)
+    with patch("os.scandir", side_effect=scandir_spy):
+        files, dirs = index.walk(temp_dir, [".git"])
+    assert listed == [os.path.join(temp_dir, "a")]
+    assert sorted(files) == [os.path.join("a", "b", "file1.txt"), os.path.join("a", "file2.txt")]
+
+    # persisted index
+    index.load(os.path.join(temp_dir, "index.json"))
+    index.dirty = True
+    index.save()
+    loaded = folder_paths.FolderIndex()
+    loaded.load(os.path.join(temp_dir, "index.json"))
+    with patch("os.scandir", side_effect=AssertionError("os.scandir should not be called")):
+        assert sorted(loaded.walk(os.path.join(temp_dir, "a"), [])[0]) == [os.path.join("b", "file1.txt"), "file2.txt"]
+
+    os.remove(os.path.join(temp_dir, "a", "b", "file1.txt"))
+    os.rmdir(os.path.join(temp_dir, "a", "b"))
+    assert loaded.refresh() == set()
+    assert loaded.walk(os.path.join(temp_dir, "a"), [], refresh=False)[0] == ["file2.txt"]
+    assert os.path.join(temp_dir, "a", "b") not in loaded.dirs
+
 def test_filter_files_extensions():
     files = ["file1.txt", "file2.jpg", "file3.png", "file4.txt"]
     assert folder_paths.filter_files_extensions(files, [".txt"]) == ["file1.txt", "file4.txt"]
@@ -116,6 +152,69 @@ def test_get_save_image_path(temp_dir):
         assert filename_prefix == "test"
 
 
+def test_save_image_path_counter_index(temp_dir):
+    def touch(name):
+        open(os.path.join(temp_dir, name), "w").close()
+
+    user_dir = tempfile.TemporaryDirectory()
+    with user_dir, patch("folder_paths.output_directory", temp_dir), patch("folder_paths.user_directory", user_dir.name):
+        folder_paths.save_counter_index.clear()
+        touch("test_00007_.png")
+        touch("test_b_00020_.png")
+        touch("other_00003_.png")
+        assert folder_paths.get_save_image_path("test", temp_dir, count=2)[2] == 8
+        # reserved counters are not listed from the folder
+        with patch("os.listdir", side_effect=AssertionError("os.listdir should not be called")):
+            assert folder_paths.get_save_image_path("test", temp_dir, count=1)[2] == 10
+            assert folder_paths.get_save_image_path("test_b", temp_dir, count=1)[2] == 21
+            assert folder_paths.get_save_image_path("new", temp_dir, count=1)[2] == 1
+
+        # unknown number of files, the folder is listed again on the next save
+        assert folder_paths.get_save_image_path("other", temp_dir)[2] == 4
+        touch("other_00004_.png")
+        touch("other_00005_.png")
+        assert folder_paths.get_save_image_path("other", temp_dir, count=1)[2] == 6
+        assert folder_paths.get_save_image_path("test", temp_dir, count=1)[2] == 11
+
+        # persisted counters are used when the folder did not change
+        folder_paths.save_counter_index.save()
+        folder_paths.save_counter_index.clear()
+        with patch("os.listdir", side_effect=AssertionError("os.listdir should not be called")):
+            assert folder_paths.get_save_image_path("test", temp_dir, count=1)[2] == 12
+
+        folder_paths.save_counter_index.save()
+        folder_paths.save_counter_index.clear()
+        touch("test_00030_.png")
+        assert folder_paths.get_save_image_path("test", temp_dir, count=1)[2] == 31
+
+        # our own files written before save() don't make the folder listed again, files written by something else do
+        folder_paths.save_counter_index.save()
+        assert folder_paths.get_save_image_path("test", temp_dir, count=1)[2] == 32
+        touch("test_00032_.png")
+        folder_paths.save_counter_index.save()
+        with patch("os.listdir", side_effect=AssertionError("os.listdir should not be called")):
+            assert folder_paths.get_save_image_path("test", temp_dir, count=1)[2] == 33
+        folder_paths.save_counter_index.save()
+        touch("test_00033_.png")
+        touch("test_00034_.png")
+        st = os.stat(temp_dir)
+        os.utime(temp_dir, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))  # the file system timestamps can be coarse
+        assert folder_paths.get_save_image_path("test", temp_dir, count=1)[2] == 35
+
+        # files written by the executor are recorded right away, without waiting for save()
+        assert folder_paths.get_save_image_path("test", temp_dir, count=1)[2] == 36
+        touch("test_00036_.png")
+        folder_paths.save_counter_index.saved(temp_dir)
+        with patch("os.listdir", side_effect=AssertionError("os.listdir should not be called")):
+            assert folder_paths.get_save_image_path("test", temp_dir, count=1)[2] == 37
+
+        # deleted folders start again from 1
+        full_output_folder = folder_paths.get_save_image_path("sub/test", temp_dir, count=1)[0]
+        os.rmdir(full_output_folder)
+        assert folder_paths.get_save_image_path("sub/test", temp_dir, count=1)[2] == 1
+        folder_paths.save_counter_index.clear()
+
+
 def test_base_path_changes(set_base_dir):
     test_dir = os.path.abspath("/test/dir")
     set_base_dir(test_dir)
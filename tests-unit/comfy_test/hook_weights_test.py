@@ -0,0 +1,138 @@
+import pytest
+import threading
+import torch
+from unittest.mock import patch
+
+import comfy.hooks
+import comfy.lora
+import comfy.model_patcher
+from comfy.cli_args import args
+
+SIGMAS = torch.tensor([1.0, 0.8, 0.6, 0.5, 0.3, 0.2, 0.0])
+
+
+class Model(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.a = torch.nn.Linear(32, 32)
+        self.b = torch.nn.Linear(32, 32)
+
+
+class HookedModel:
+    def __init__(self):
+        torch.manual_seed(0)
+        self.model = Model()
+        self.base = {k: v.clone() for k, v in self.model.state_dict().items()}
+        self.diff = {k: torch.randn_like(v) * 0.1 for k, v in self.base.items()}
+        self.patcher = comfy.model_patcher.ModelPatcher(self.model, load_device=torch.device("cpu"), offload_device=torch.device("cpu"))
+        self.hook = comfy.hooks.WeightHook()
+        keyframes = comfy.hooks.HookKeyframeGroup()
+        for strength, start_percent, start_t in [(1.0, 0.0, 999.0), (0.5, 0.3, 0.7), (0.0, 0.6, 0.4)]:
+            keyframe = comfy.hooks.HookKeyframe(strength=strength, start_percent=start_percent, guarantee_steps=1)
+            keyframe.start_t = start_t
+            keyframes.add(keyframe)
+        self.hook.hook_keyframe = keyframes
+        self.patcher.add_hook_patches(self.hook, {k: ("diff", (self.diff[k],)) for k in self.diff})
+        self.group = comfy.hooks.HookGroup()
+        self.group.add(self.hook)
+
+    def run(self):
+        """Steps through the keyframes like sampling, returns the strength and the weights at every step."""
+        self.hook.reset()
+        model_options = {"transformer_options": {"sample_sigmas": SIGMAS}}
+        if args.precompute_hook_weights:
+            self.patcher.precompute_hook_weights([self.group], SIGMAS)
+        steps = []
+        for sigma in SIGMAS[:-1]:
+            self.patcher.prepare_hook_patches_current_keyframe(sigma.view(1), self.group, model_options)
+            self.patcher.apply_hooks(self.group)
+            steps.append((self.hook.strength, {k: v.clone() for k, v in self.model.state_dict().items()}))
+        self.patcher.cleanup()
+        for k, v in self.model.state_dict().items():
+            assert torch.equal(v, self.base[k])
+        return steps
+
+
+@pytest.fixture
+def calculate_weight_calls():
+    calls = []
+    calculate_weight = comfy.lora.calculate_weight
+    def counted(*args, **kwargs):
+        calls.append(threading.current_thread().name)
+        return calculate_weight(*args, **kwargs)
+    with patch.object(comfy.lora, "calculate_weight", counted):
+        yield calls
+
+
+@pytest.mark.parametrize("cache_size", [0, 1.0])
+def test_weights_follow_keyframes(cache_size):
+    hooked = HookedModel()
+    with patch.object(args, "hook_weight_cache_size", cache_size):
+        steps = hooked.run()
+    assert [strength for strength, _ in steps] == [1.0, 1.0, 0.5, 0.5, 0.0, 0.0]
+    for strength, weights in steps:
+        for k in weights:
+            assert torch.allclose(weights[k], hooked.base[k] + hooked.diff[k] * strength, atol=1e-6)
+
+
+def test_cached_weights_are_reused(calculate_weight_calls):
+    hooked = HookedModel()
+    with patch.object(args, "hook_weight_cache_size", 1.0):
+        first = hooked.run()
+        assert len(calculate_weight_calls) == 3 * len(hooked.base)
+        calculate_weight_calls.clear()
+        assert len(hooked.patcher.cached_hook_patches) == 3
+        second = hooked.run()
+    assert len(calculate_weight_calls) == 0
+    for (_, a), (_, b) in zip(first, second):
+        assert all(torch.equal(a[k], b[k]) for k in a)
+
+
+def test_default_cache_keeps_current_weights_only(calculate_weight_calls):
+    hooked = HookedModel()
+    with patch.object(args, "hook_weight_cache_size", 0):
+        hooked.run()
+        assert len(hooked.patcher.cached_hook_patches) == 0
+        hooked.run()
+    # each keyframe is calculated once per run
+    assert len(calculate_weight_calls) == 2 * 3 * len(hooked.base)
+
+
+def test_cache_size_limit():
+    hooked = HookedModel()
+    weight_set_size = sum(v.nelement() * v.element_size() for v in hooked.base.values())
+    with patch.object(args, "hook_weight_cache_size", 2.5 * weight_set_size / (1024 ** 3)):
+        hooked.run()
+        assert len(hooked.patcher.cached_hook_patches) == 2
+        assert hooked.patcher.cached_hook_weights_size() <= 2 * weight_set_size
+
+
+def test_precomputed_weights_match(calculate_weight_calls):
+    hooked = HookedModel()
+    with patch.object(args, "hook_weight_cache_size", 1.0):
+        expected = hooked.run()
+        hooked.patcher.clear_cached_hook_weights()
+        calculate_weight_calls.clear()
+        with patch.object(args, "precompute_hook_weights", True):
+            precomputed = hooked.run()
+    # all the weights were calculated in the background
+    assert calculate_weight_calls == ["hook_weights"] * (3 * len(hooked.base))
+    for (_, a), (_, b) in zip(expected, precomputed):
+        assert all(torch.equal(a[k], b[k]) for k in a)
+
+
+@pytest.mark.parametrize("cache_size,max_unused", [(0, 0), (1.0, 2)])
+def test_precompute_stays_within_cache_size(cache_size, max_unused):
+    hooked = HookedModel()
+    unused = []
+    calculate = comfy.model_patcher.HookWeightsPrecompute.calculate
+    def counted(self, hooks, strengths):
+        unused.append(len(self.results))
+        return calculate(self, hooks, strengths)
+    with patch.object(args, "hook_weight_cache_size", cache_size), patch.object(args, "precompute_hook_weights", True):
+        with patch.object(comfy.model_patcher.HookWeightsPrecompute, "calculate", counted):
+            steps = hooked.run()
+    assert len(unused) == 3 and max(unused) <= max_unused
+    for strength, weights in steps:
+        for k in weights:
+            assert torch.allclose(weights[k], hooked.base[k] + hooked.diff[k] * strength, atol=1e-6)
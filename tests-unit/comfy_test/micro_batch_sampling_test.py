@@ -0,0 +1,57 @@
+import pytest
+import torch
+from unittest.mock import patch
+
+import comfy.model_management
+import comfy.model_patcher
+import comfy.sample
+import comfy.samplers
+import comfy.supported_models
+from comfy.cli_args import args
+
+BATCH = 5
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    unet_config = {"image_model": "flux", "guidance_embed": True, "in_channels": 16, "out_channels": 16, "vec_in_dim": 32,
+                   "context_in_dim": 32, "hidden_size": 32, "mlp_ratio": 2.0, "num_heads": 2, "depth": 1, "depth_single_blocks": 1,
+                   "axes_dim": [4, 6, 6], "theta": 10000, "patch_size": 2, "qkv_bias": True}
+    model_config = comfy.supported_models.Flux(unet_config)
+    model_config.set_inference_dtype(torch.float32, None)
+    base_model = model_config.get_model({})
+    for p in base_model.parameters():
+        torch.nn.init.normal_(p, std=0.05)
+    return comfy.model_patcher.ModelPatcher(base_model, torch.device("cpu"), torch.device("cpu"))
+
+
+@pytest.mark.parametrize("sampler", ["euler_ancestral", "dpmpp_sde", "ddim"])
+def test_split_matches_unsplit(model, sampler):
+    torch.manual_seed(1)
+    positive = [[torch.randn(1, 8, 32), {"pooled_output": torch.randn(1, 32), "guidance": 3.5}]]
+    # a cond mask and a denoise mask with one entry per latent, sliced for each chunk
+    negative = [[torch.randn(1, 8, 32), {"pooled_output": torch.randn(1, 32), "guidance": 3.5, "mask": torch.rand(BATCH, 16, 16)}]]
+    latent = torch.randn(BATCH, 16, 16, 16) * 0.1
+    noise_mask = torch.rand(BATCH, 1, 16, 16)
+    noise = comfy.sample.prepare_noise(latent, 0)
+
+    def sample():
+        return comfy.sample.sample(model, noise, 4, 2.0, sampler, "simple", positive, negative, latent, denoise=0.8, noise_mask=noise_mask, seed=3, disable_pbar=True)
+
+    expected = sample()
+
+    # free memory for the model calls of 2 latents
+    free_memory = model.model.memory_required([4, 16, 16, 16]) * 1.6 + model.model_size()
+    chunks = []
+    micro_batches = comfy.samplers.CFGGuider.micro_batches
+    def recorded_micro_batches(self, noise_shape):
+        chunks.extend(micro_batches(self, noise_shape))
+        return chunks
+
+    with patch.object(args, "micro_batch_sampling", True), \
+         patch.object(comfy.model_management, "get_free_memory", lambda dev=None, torch_free_too=False: (free_memory, free_memory) if torch_free_too else free_memory), \
+         patch.object(comfy.samplers.CFGGuider, "micro_batches", recorded_micro_batches):
+        out = sample()
+    assert chunks == [(0, 2), (2, 4), (4, 5)]
+    assert torch.allclose(out, expected, atol=1e-5)
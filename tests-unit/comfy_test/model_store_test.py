@@ -0,0 +1,94 @@
+import os
+import time
+import pytest
+import torch
+from unittest.mock import patch
+
+import comfy.model_store
+import comfy.utils
+from comfy.cli_args import args
+
+
+@pytest.fixture
+def store_dir(tmp_path):
+    store = tmp_path / "store"
+    with patch.object(args, "model_store", True), patch.object(args, "model_store_directory", str(store)), patch.object(args, "model_store_max_size", None):
+        yield store
+
+
+def save_pt(path, sd):
+    torch.save({"state_dict": sd}, path)
+
+
+def test_disabled_by_default(tmp_path):
+    path = str(tmp_path / "model.pt")
+    save_pt(path, {"a": torch.ones(2)})
+    assert comfy.model_store.load(path) is None
+    assert not comfy.model_store.save(path, {"a": torch.ones(2)})
+
+
+def test_load_torch_file_uses_store(tmp_path, store_dir):
+    path = str(tmp_path / "model.pt")
+    weight = torch.randn(4, 4)
+    save_pt(path, {"w": weight, "tied": weight, "t": weight.t()})
+
+    sd = comfy.utils.load_torch_file(path)
+    assert os.path.isfile(comfy.model_store.store_path(path))
+
+    with patch("torch.load", side_effect=AssertionError("torch.load should not be called")):
+        stored = comfy.utils.load_torch_file(path)
+    assert set(stored.keys()) == set(sd.keys())
+    for k in sd:
+        assert torch.equal(stored[k], sd[k])
+
+
+def test_invalidated_when_source_changes(tmp_path, store_dir):
+    path = str(tmp_path / "model.pt")
+    save_pt(path, {"w": torch.zeros(2)})
+    comfy.utils.load_torch_file(path)
+
+    save_pt(path, {"w": torch.ones(3)})
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+    assert comfy.model_store.load(path) is None
+    assert not os.path.exists(comfy.model_store.store_path(path))
+    assert torch.equal(comfy.utils.load_torch_file(path)["w"], torch.ones(3))
+
+
+def test_non_tensor_values_are_not_stored(tmp_path, store_dir):
+    path = str(tmp_path / "model.pt")
+    save_pt(path, {"w": torch.zeros(2), "step": 5})
+    comfy.utils.load_torch_file(path)
+    assert not os.path.exists(comfy.model_store.store_path(path))
+
+
+def test_size_limit_removes_least_recently_used(tmp_path, store_dir):
+    paths = []
+    for i in range(3):
+        path = str(tmp_path / "model_{}.pt".format(i))
+        save_pt(path, {"w": torch.zeros(256 * 1024)})
+        paths.append(path)
+
+    with patch.object(args, "model_store_max_size", 2.5 / 1024):  # 2.5MB, each entry is 1MB
+        for path in paths[:2]:
+            comfy.utils.load_torch_file(path)
+            time.sleep(0.01)
+        # using the first entry makes the second one the least recently used
+        comfy.utils.load_torch_file(paths[0])
+        time.sleep(0.01)
+        comfy.utils.load_torch_file(paths[2])
+
+    assert os.path.exists(comfy.model_store.store_path(paths[2]))
+    assert os.path.exists(comfy.model_store.store_path(paths[0]))
+    assert not os.path.exists(comfy.model_store.store_path(paths[1]))
+
+
+def test_prune(tmp_path, store_dir):
+    path = str(tmp_path / "model.pt")
+    save_pt(path, {"w": torch.zeros(2)})
+    comfy.utils.load_torch_file(path)
+    assert comfy.model_store.prune() == 0
+
+    os.remove(path)
+    assert comfy.model_store.prune() == 1
+    assert len(comfy.model_store.entries()) == 0
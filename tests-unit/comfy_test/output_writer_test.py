@@ -0,0 +1,60 @@
+import os
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+from unittest.mock import patch
+
+import comfy.output_writer as output_writer
+from comfy.cli_args import args
+from comfy_execution.utils import CurrentNodeContext
+
+
+@pytest.mark.parametrize("threads", [0, 2])
+def test_save_image(tmp_path, threads):
+    images = output_writer.to_uint8(torch.rand(3, 16, 24, 3))
+    with patch.object(args, "output_writer_threads", threads):
+        for i, image in enumerate(images):
+            output_writer.save_image(str(tmp_path / "{}.png".format(i)), image, format="PNG", compress_level=1)
+        assert output_writer.wait(str(tmp_path)) <= len(images)
+
+    assert sorted(os.listdir(tmp_path)) == ["0.png", "1.png", "2.png"]
+    for i, image in enumerate(images):
+        with Image.open(tmp_path / "{}.png".format(i)) as img:
+            assert np.array_equal(np.array(img), image)
+    assert not output_writer.is_pending(str(tmp_path / "0.png"))
+
+
+def test_to_uint8_matches_numpy():
+    images = torch.rand(2, 8, 8, 3) * 1.2 - 0.1
+    expected = np.clip(255. * images.numpy(), 0, 255).astype(np.uint8)
+    assert np.array_equal(output_writer.to_uint8(images), expected)
+
+
+def test_failed_write(tmp_path):
+    with patch.object(args, "output_writer_threads", 1):
+        path = str(tmp_path / "missing" / "0.png")
+        with CurrentNodeContext("prompt", "9"):
+            future = output_writer.save_image(path, np.zeros((4, 4, 3), dtype=np.uint8))
+        output_writer.wait_for_file(path)
+        assert future.exception() is not None
+        # the failure is raised once, by the wait that finalizes the prompt
+        with pytest.raises(output_writer.SaveError) as e:
+            output_writer.wait()
+        assert e.value.node_id == "9" and e.value.path == output_writer.path_key(path)
+        output_writer.wait()
+    assert not os.path.exists(path)
+
+
+def test_written_files_keep_the_save_counters(tmp_path):
+    import folder_paths
+    folder_paths.save_counter_index.clear()
+    with patch.object(args, "output_writer_threads", 2):
+        for i in range(3):
+            folder, filename, counter, _, _ = folder_paths.get_save_image_path("test", str(tmp_path), count=1)
+            assert counter == i + 1
+            output_writer.save_image(os.path.join(folder, "{}_{:05}_.png".format(filename, counter)), np.zeros((4, 4, 3), dtype=np.uint8))
+            output_writer.wait(str(tmp_path))
+            with patch("os.listdir", side_effect=AssertionError("os.listdir should not be called")):
+                assert folder_paths.get_save_image_path("test", str(tmp_path), count=0)[2] == counter + 1
+    folder_paths.save_counter_index.clear()
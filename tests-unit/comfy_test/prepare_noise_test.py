@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+import torch
+
+import comfy.sample
+
+
+def per_sample_noise(latent_image, seed, noise_inds):
+    """The noise of the batch indices generated one sample at a time, like prepare_noise used to."""
+    generator = torch.manual_seed(seed)
+    unique_inds, inverse = np.unique(noise_inds, return_inverse=True)
+    noises = []
+    for i in range(unique_inds[-1] + 1):
+        noise = torch.randn([1] + list(latent_image.size())[1:], dtype=latent_image.dtype, layout=latent_image.layout, generator=generator, device="cpu")
+        if i in unique_inds:
+            noises.append(noise)
+    noises = [noises[i] for i in inverse]
+    return torch.cat(noises, axis=0)
+
+
+@pytest.mark.parametrize("dtype", [torch.float32, torch.float16, torch.bfloat16, torch.float64])
+@pytest.mark.parametrize("sample_shape", [(4, 8, 8), (16, 1, 1), (4, 5, 7), (3, 1, 3), (16, 3, 8, 8)])
+@pytest.mark.parametrize("noise_inds", [[0, 5, 2], [5, 3, 5], [7], [0, 1, 2]])
+def test_noise_inds_match_per_sample_noise(dtype, sample_shape, noise_inds):
+    # the sizes that aren't a multiple of 16 values don't take the fast path that skips the unused samples
+    latent_image = torch.zeros((len(noise_inds),) + sample_shape, dtype=dtype)
+    expected = per_sample_noise(latent_image, 42, noise_inds)
+    assert torch.equal(comfy.sample.prepare_noise(latent_image, 42, noise_inds), expected)
+
+
+def test_seeds():
+    latent_image = torch.zeros(3, 4, 8, 8)
+    noise = comfy.sample.prepare_noise(latent_image, 0, seeds=[5, 7, 5])
+    for i, seed in enumerate([5, 7, 5]):
+        assert torch.equal(noise[i:i + 1], comfy.sample.prepare_noise(latent_image[:1], seed))
+
+    with pytest.raises(ValueError):
+        comfy.sample.prepare_noise(latent_image, 0, seeds=[1, 2])
+
+
+def test_latent_noise_options():
+    latent_image = torch.zeros(2, 4, 8, 8)
+    single = lambda seed: comfy.sample.prepare_noise(latent_image[:1], seed)
+
+    assert torch.equal(comfy.sample.prepare_latent_noise({}, latent_image, 3), comfy.sample.prepare_noise(latent_image, 3))
+
+    noise = comfy.sample.prepare_latent_noise({"noise_options": {"seeds": "per_sample"}, "batch_index": [4, 6]}, latent_image, 10)
+    assert torch.equal(noise, torch.cat([single(14), single(16)]))
+
+    noise = comfy.sample.prepare_latent_noise({"noise_options": {"seeds": [100, 101, 102]}, "batch_index": [2, 0]}, latent_image, 10)
+    assert torch.equal(noise, torch.cat([single(102), single(100)]))
+
+    noise = comfy.sample.prepare_latent_noise({"noise_options": {"seeds": [100, 101]}}, latent_image, 10)
+    assert torch.equal(noise, torch.cat([single(100), single(101)]))
+
+    with pytest.raises(ValueError):
+        comfy.sample.prepare_latent_noise({"noise_options": {"seeds": [100]}, "batch_index": [0, 1]}, latent_image, 10)
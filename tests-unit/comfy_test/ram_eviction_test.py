@@ -0,0 +1,142 @@
+import os
+import pytest
+import torch
+from unittest.mock import patch
+
+import comfy.model_management
+import comfy.model_patcher
+import comfy.sd
+import comfy.supported_models
+import comfy.utils
+from comfy.cli_args import args
+
+PREFIX = "model.diffusion_model."
+
+
+@pytest.fixture
+def model(tmp_path):
+    torch.manual_seed(0)
+    unet_config = {"image_model": "flux", "guidance_embed": True, "in_channels": 16, "out_channels": 16, "vec_in_dim": 32,
+                   "context_in_dim": 32, "hidden_size": 32, "mlp_ratio": 2.0, "num_heads": 2, "depth": 1, "depth_single_blocks": 1,
+                   "axes_dim": [4, 6, 6], "theta": 10000, "patch_size": 2, "qkv_bias": True}
+    model_config = comfy.supported_models.Flux(unet_config)
+    model_config.set_inference_dtype(torch.float32, None)
+    base_model = model_config.get_model({})
+    for p in base_model.parameters():
+        torch.nn.init.normal_(p, std=0.05)
+    path = str(tmp_path / "model.safetensors")
+    comfy.utils.save_torch_file({PREFIX + k: v for k, v in base_model.diffusion_model.state_dict().items()}, path)
+    base_model.weights_prefix = PREFIX
+    m = comfy.model_patcher.ModelPatcher(base_model, torch.device("cpu"), torch.device("cpu"))
+    comfy.sd.set_weights_file(m, path)
+    with patch.object(comfy.model_management, "RAM_SPILL_DIRECTORY", str(tmp_path / "spill")):
+        yield m
+
+
+def weights(m):
+    return {k: v.clone() for k, v in m.model.diffusion_model.state_dict().items()}
+
+
+def assert_weights_equal(m, expected):
+    current = m.model.diffusion_model.state_dict()
+    assert current.keys() == expected.keys()
+    for k in expected:
+        assert torch.equal(current[k], expected[k]), k
+
+
+def test_evict_reloads_from_file(model):
+    expected = weights(model)
+    dropped = comfy.model_management.ram_evictions["dropped"]
+    assert comfy.model_management.evict_model_weights(model)
+    assert comfy.model_management.ram_evictions["dropped"] == dropped + 1
+    assert_weights_equal(model, expected)
+
+
+def test_changed_file_is_not_reloaded(model):
+    expected = weights(model)
+    path = model.model.weights_file
+    comfy.utils.save_torch_file({PREFIX + k: v + 1 for k, v in expected.items()}, path)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))  # the file system timestamps can be coarse
+
+    spilled = comfy.model_management.ram_evictions["spilled"]
+    assert comfy.model_management.evict_model_weights(model)
+    assert comfy.model_management.ram_evictions["spilled"] == spilled + 1
+    assert_weights_equal(model, expected)
+    assert model.model.weights_file is None
+
+
+def test_missing_file_spills(model):
+    expected = weights(model)
+    os.remove(model.model.weights_file)
+    spilled = comfy.model_management.ram_evictions["spilled"]
+    assert comfy.model_management.evict_model_weights(model)
+    assert comfy.model_management.ram_evictions["spilled"] == spilled + 1
+    assert_weights_equal(model, expected)
+
+
+def test_free_ram_keeps_weights_on_error(model):
+    expected = weights(model)
+    os.remove(model.model.weights_file)
+    comfy.model_management.model_offloaded(model)
+    with patch.object(comfy.model_management, "RAM_BUDGET", 0), patch.object(comfy.utils, "save_torch_file", side_effect=OSError("disk full")):
+        assert comfy.model_management.free_ram() == 0
+    assert_weights_equal(model, expected)
+    assert len(os.listdir(comfy.model_management.RAM_SPILL_DIRECTORY)) == 0
+
+
+def test_free_memory_evicts_without_device_unloads(model):
+    expected = weights(model)
+    comfy.model_management.model_offloaded(model)
+    dropped = comfy.model_management.ram_evictions["dropped"]
+    with patch.object(comfy.model_management, "RAM_BUDGET", 0):
+        assert comfy.model_management.free_memory(0, torch.device("cpu")) == []
+    assert comfy.model_management.ram_evictions["dropped"] == dropped + 1
+    assert_weights_equal(model, expected)
+
+
+def test_load_does_not_evict_the_loaded_model(model):
+    comfy.model_management.model_offloaded(model)
+    dropped = comfy.model_management.ram_evictions["dropped"]
+    spilled = comfy.model_management.ram_evictions["spilled"]
+    with patch.object(comfy.model_management, "RAM_BUDGET", 0):
+        comfy.model_management.load_models_gpu([model])
+    assert comfy.model_management.ram_evictions["dropped"] == dropped
+    assert comfy.model_management.ram_evictions["spilled"] == spilled
+    assert all(m() is not model for m in comfy.model_management.offloaded_models)
+    comfy.model_management.unload_all_models()
+
+
+def test_spill_keeps_tied_parameters(model):
+    real_model = model.model
+    real_model.tied = torch.nn.Linear(4, 4)
+    real_model.tied_too = torch.nn.Linear(4, 4)
+    real_model.tied_too.weight = real_model.tied.weight
+    storage = torch.randn(8)
+    real_model.first_half = torch.nn.Parameter(storage[:4])
+    real_model.second_half = torch.nn.Parameter(storage[4:])
+    expected = {k: v.clone() for k, v in real_model.state_dict().items()}
+
+    comfy.model_management.spill_model_weights(model)
+    assert real_model.tied_too.weight is real_model.tied.weight
+    assert real_model.first_half.untyped_storage().data_ptr() == real_model.second_half.untyped_storage().data_ptr()
+    current = real_model.state_dict()
+    for k in expected:
+        assert torch.equal(current[k], expected[k]), k
+
+
+def test_prefixed_file_reloads_with_model_store(model, tmp_path):
+    expected = weights(model)
+    path = model.model.weights_file
+    with patch.object(args, "model_store", True), patch.object(args, "model_store_directory", str(tmp_path / "store")):
+        sd, weights_file, weights_prefix = comfy.sd.diffusion_model_state_dict_from_file(path)
+    # the prefix was stripped before the model was created from sd, which found none
+    assert weights_file == path and weights_prefix == PREFIX
+    assert set(sd.keys()) == set(expected.keys())
+    model.model.weights_prefix = ""
+    comfy.sd.set_weights_file(model, weights_file, weights_prefix)
+
+    dropped = comfy.model_management.ram_evictions["dropped"]
+    assert comfy.model_management.evict_model_weights(model)
+    assert comfy.model_management.ram_evictions["dropped"] == dropped + 1
+    assert_weights_equal(model, expected)
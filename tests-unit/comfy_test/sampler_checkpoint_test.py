@@ -0,0 +1,124 @@
+import os
+import hashlib
+import torch
+
+from comfy.sampler_checkpoint import SamplerCheckpoint, digest, signature
+
+
+class Executor:
+    def __init__(self):
+        self.calls = 0
+
+    def execute(self, x, timestep, model_options, seed):
+        self.calls += 1
+        return x * timestep.reshape(-1, 1) + self.calls
+
+
+def run(checkpoint, executor, steps, stop=None):
+    x = torch.ones(2, 4)
+    callback = checkpoint.wrap_callback(None)
+    outputs = []
+    for i in range(steps):
+        if i == stop:
+            checkpoint.save()
+            return outputs
+        out = checkpoint.predict_noise(executor, x, torch.full((2,), float(steps - i)), {}, 0)
+        outputs.append(out)
+        callback(i, out, x, steps)
+    checkpoint.remove()
+    return outputs
+
+
+def test_resume(tmp_path):
+    executor = Executor()
+    checkpoint = SamplerCheckpoint(str(tmp_path), "run", 8, every_steps=3)
+    assert checkpoint.load() == 0
+    partial = run(checkpoint, executor, 8, stop=5)
+    assert sorted(os.listdir(tmp_path / "run")) == ["000000.safetensors", "000003.safetensors"]
+
+    # the saved calls are replayed, the model is only called for the following steps
+    executor = Executor()
+    checkpoint = SamplerCheckpoint(str(tmp_path), "run", 8, every_steps=3)
+    assert checkpoint.load() == 5
+    outputs = run(checkpoint, executor, 8)
+    assert executor.calls == 3
+    for a, b in zip(partial, outputs):
+        assert torch.equal(a, b)
+    assert not os.path.exists(tmp_path / "run")
+
+
+def test_mismatch(tmp_path):
+    checkpoint = SamplerCheckpoint(str(tmp_path), "run", 4, every_steps=1)
+    run(checkpoint, Executor(), 4, stop=2)
+
+    checkpoint = SamplerCheckpoint(str(tmp_path), "run", 6, every_steps=1)
+    checkpoint.load()
+    executor = Executor()
+    run(checkpoint, executor, 6)
+    assert executor.calls == 6
+
+
+def test_digest():
+    def signature(*values):
+        h = hashlib.sha256()
+        for v in values:
+            digest(h, v)
+        return h.hexdigest()
+
+    a = torch.arange(6.0)
+    assert signature(a, {"cfg": 2.0}) == signature(a.clone(), {"cfg": 2.0})
+    assert signature(a, {"cfg": 2.0}) != signature(a, {"cfg": 3.0})
+    assert signature(a) != signature(a.half())
+    assert signature([a, "euler"]) != signature([a + 1, "euler"])
+
+
+class Patcher:
+    def __init__(self, model, patches={}):
+        self.model = model
+        self.patches = patches
+        self.object_patches = {}
+
+    def model_dtype(self):
+        return torch.float32
+
+
+def test_signature_patches():
+    torch.manual_seed(0)
+    model = torch.nn.Linear(8, 8)
+    lora_a = (torch.randn(8, 2), torch.randn(2, 8), 1.0, None, None, None)
+    lora_b = (torch.randn(8, 2), torch.randn(2, 8), 1.0, None, None, None)
+
+    def patches(lora, strength=1.0):
+        return {"weight": [(strength, ("lora", lora), 1.0, None, None)]}
+
+    assert signature(Patcher(model, patches(lora_a))) == signature(Patcher(model, patches(tuple(lora_a))))
+    # a different lora on the same keys with the same strength doesn't resume the run of the other one
+    assert signature(Patcher(model, patches(lora_a))) != signature(Patcher(model, patches(lora_b)))
+    assert signature(Patcher(model, patches(lora_a))) != signature(Patcher(model, patches(lora_a, 0.5)))
+
+    patcher = Patcher(model)
+    before = signature(patcher)
+    patcher.object_patches["model_sampling"] = torch.nn.Linear(2, 2)
+    assert signature(patcher) != before
+
+
+def test_signature_controlnet():
+    class ControlNet:
+        def __init__(self, control_model, hint):
+            self.control_model = control_model
+            self.cond_hint_original = hint
+            self.strength = 1.0
+            self.previous_controlnet = None
+
+    hint = torch.rand(1, 3, 8, 8)
+    a = ControlNet(torch.nn.Conv2d(3, 4, 3), hint)
+    b = ControlNet(torch.nn.Conv2d(3, 4, 3), hint)
+    patcher = Patcher(torch.nn.Linear(8, 8))
+    assert signature(patcher, [{"control": a}]) == signature(patcher, [{"control": a}])
+    assert signature(patcher, [{"control": a}]) != signature(patcher, [{"control": b}])
+
+    # the digests of the weights are reused until they are modified
+    before = signature(patcher, [{"control": a}])
+    with torch.no_grad():
+        a.control_model.weight += 1
+    assert signature(patcher, [{"control": a}]) != before
@@ -0,0 +1,97 @@
+import pytest
+import torch
+from unittest.mock import patch
+
+import comfy.model_management
+import comfy.sd
+import comfy.utils
+
+
+def nearest_upscale(a):
+    return torch.nn.functional.interpolate(a * 2.0, scale_factor=2, mode="nearest")
+
+
+@pytest.mark.parametrize("max_batch", [1, 3, 16])
+def test_pointwise_function_matches_untiled(max_batch):
+    samples = torch.randn(2, 3, 50, 37)
+    out = comfy.utils.tiled_scale(samples, nearest_upscale, tile_x=16, tile_y=16, overlap=4, upscale_amount=2, max_batch=max_batch)
+    assert torch.allclose(out, nearest_upscale(samples), atol=1e-5)
+
+
+def test_batched_matches_unbatched():
+    conv = torch.nn.Conv2d(4, 3, 3, padding=1)
+    samples = torch.randn(3, 4, 40, 29)
+    with torch.no_grad():
+        a = comfy.utils.tiled_scale(samples, conv, tile_x=16, tile_y=8, overlap=4, upscale_amount=1)
+        b = comfy.utils.tiled_scale(samples, conv, tile_x=16, tile_y=8, overlap=4, upscale_amount=1, max_batch=7)
+    assert torch.allclose(a, b, atol=1e-5)
+
+
+def test_3d_downscale():
+    samples = torch.randn(1, 2, 6, 32, 24)
+    pool = lambda a: torch.nn.functional.avg_pool3d(a, (1, 4, 4))
+    out = comfy.utils.tiled_scale_multidim(samples, pool, tile=(3, 16, 16), overlap=(1, 8, 8), upscale_amount=(1, 4, 4), out_channels=2, downscale=True, max_batch=4)
+    # temporal dim is not scaled
+    assert out.shape == (1, 2, 6, 8, 6)
+
+
+def test_single_tile_batches_samples():
+    calls = []
+    def function(a):
+        calls.append(a.shape[0])
+        return a
+    comfy.utils.tiled_scale(torch.randn(5, 3, 8, 8), function, tile_x=16, tile_y=16, upscale_amount=1, max_batch=2)
+    assert calls == [2, 2, 1]
+
+
+def test_feather_mask():
+    mask = comfy.utils.tiled_scale_feather_mask((8, 6), (2, 2), "cpu")
+    assert mask.shape == (1, 1, 8, 6)
+    assert torch.equal(mask, mask.flip(2))
+    assert torch.equal(mask, mask.flip(3))
+    assert mask[0, 0, 0, 0] == 0.25
+    assert mask[0, 0, 3, 3] == 1.0
+
+
+def test_plan_tiled_scale():
+    memory_used = lambda shape: shape[2] * shape[3] * 100
+    tile, overlap, batch = comfy.utils.plan_tiled_scale((1, 3, 1024, 1024), (512, 512), 32, memory_used, free_memory=128 * 128 * 100 * 3, min_tile=64)
+    assert tile == [128, 128]
+    assert overlap == [8, 8]
+    assert batch == 3
+
+    tile, overlap, batch = comfy.utils.plan_tiled_scale((1, 3, 1024, 1024), (512, 512), 32, memory_used, free_memory=1, min_tile=128)
+    assert tile == [128, 128]
+    assert batch == 1
+
+
+def test_vae_tile_batch_keeps_inference_margin():
+    vae = comfy.sd.VAE.__new__(comfy.sd.VAE)
+    vae.device = torch.device("cpu")
+    vae.vae_dtype = torch.float32
+    memory_used = lambda shape, dtype: shape[2] * shape[3] * 1024
+    margin = comfy.model_management.minimum_inference_memory()
+    with patch.object(comfy.model_management, "get_free_memory", return_value=margin + 64 * 64 * 1024 * 3):
+        assert vae.tile_batch_size(memory_used, torch.zeros(1, 4, 512, 512), (64, 64)) == 3
+    with patch.object(comfy.model_management, "get_free_memory", return_value=margin):
+        assert vae.tile_batch_size(memory_used, torch.zeros(1, 4, 512, 512), (64, 64)) == 1
+
+
+def test_vae_tiles_split_on_oom():
+    calls = []
+    def function(a):
+        calls.append(a.shape[0])
+        if a.shape[0] > 2:
+            raise comfy.model_management.OOM_EXCEPTION("out of memory")
+        return a * 2
+
+    vae = comfy.sd.VAE.__new__(comfy.sd.VAE)
+    samples = torch.randn(3, 4, 40, 29)
+    out = comfy.utils.tiled_scale(samples, vae.split_on_oom(function, 8), tile_x=16, tile_y=8, overlap=4, upscale_amount=1, out_channels=4, max_batch=8)
+    assert torch.allclose(out, samples * 2, atol=1e-5)
+    # the batch is halved until it fits and the batch size that fits is kept for the following batches
+    assert calls[:3] == [8, 4, 2]
+    assert max(calls[3:]) <= 2
+
+    with pytest.raises(comfy.model_management.OOM_EXCEPTION):
+        vae.split_on_oom(lambda a: function(torch.cat([a] * 3)), 8)(samples[:1])
@@ -0,0 +1,97 @@
+import pytest
+import torch
+
+import comfy.float
+
+
+@pytest.fixture
+def weight():
+    generator = torch.Generator().manual_seed(0)
+    return torch.randn(64, 300, generator=generator) * 0.05
+
+
+def relative_error(a, b):
+    return float((a - b).norm() / b.norm())
+
+
+def test_int8_roundtrip(weight):
+    q, scale = comfy.float.quantize_int8(weight)
+    assert q.dtype == torch.int8
+    assert q.shape == weight.shape
+    assert scale.shape == (64,)
+    assert relative_error(comfy.float.dequantize_int8(q, scale, torch.float32), weight) < 0.01
+
+
+def test_int8_conv_weight():
+    weight = torch.randn(16, 8, 3, 3)
+    q, scale = comfy.float.quantize_int8(weight)
+    out = comfy.float.dequantize_int8(q, scale, torch.float32)
+    assert out.shape == weight.shape
+    assert relative_error(out, weight) < 0.01
+
+
+def test_int4_roundtrip(weight):
+    q, scale = comfy.float.quantize_int4(weight, 128)
+    assert q.dtype == torch.uint8
+    # 300 input channels get padded to 3 groups of 128, two values per byte
+    assert q.shape == (64, 3 * 64)
+    assert scale.shape == (64, 3)
+    out = comfy.float.dequantize_int4(q, scale, torch.float32, weight.shape)
+    assert out.shape == weight.shape
+    assert relative_error(out, weight) < 0.15
+
+
+def test_memory_reduction(weight):
+    q8, s8 = comfy.float.quantize_int8(weight.half())
+    q4, s4 = comfy.float.quantize_int4(weight.half(), 64)
+    fp16_size = weight.numel() * 2
+    assert fp16_size / (q8.numel() + s8.numel() * 4) > 1.9
+    assert fp16_size / (q4.numel() + s4.numel() * 4) > 3.0
+
+
+def test_requantize_with_same_scale(weight):
+    q, scale = comfy.float.quantize_int8(weight)
+    q2, scale2 = comfy.float.quantize_int8(comfy.float.dequantize_int8(q, scale, torch.float32), scale=scale)
+    assert scale2 is scale
+    assert torch.equal(q, q2)
+
+    q, scale = comfy.float.quantize_int4(weight, 64)
+    out = comfy.float.dequantize_int4(q, scale, torch.float32, weight.shape)
+    q2, _ = comfy.float.quantize_int4(out, 64, scale=scale)
+    assert torch.equal(q, q2)
+
+
+@pytest.mark.parametrize("int4", [False, True])
+def test_lora_roundtrip_on_ops(int4):
+    import comfy.model_patcher
+    import comfy.ops
+
+    class Model(torch.nn.Module):
+        def __init__(self, ops):
+            super().__init__()
+            self.linear = ops.Linear(96, 32)
+
+    generator = torch.Generator().manual_seed(0)
+    weight = torch.randn(32, 96, generator=generator) * 0.05
+    bias = torch.randn(32, generator=generator) * 0.05
+    model = Model(comfy.ops.int_weight_only_ops(int4=int4, group_size=32))
+    model.load_state_dict({"linear.weight": weight.clone(), "linear.bias": bias})
+    quantized = model.linear.weight.clone()
+    scale = model.linear.weight_scale.clone()
+
+    # a lora a lot larger than the weights must not saturate
+    diff = torch.randn(32, 96, generator=generator) * 0.5
+    patcher = comfy.model_patcher.ModelPatcher(model, torch.device("cpu"), torch.device("cpu"))
+    patcher.add_patches({"linear.weight": ("diff", (diff,))}, 1.0)
+    patcher.patch_model()
+    patched = model.linear.convert_weight(model.linear.weight)
+    assert relative_error(patched, weight + diff) < (0.1 if int4 else 0.01)
+
+    x = torch.randn(4, 96, generator=generator)
+    expected = torch.nn.functional.linear(x, weight + diff, bias)
+    with torch.no_grad():
+        assert relative_error(model.linear(x), expected) < (0.1 if int4 else 0.01)
+
+    patcher.unpatch_model()
+    assert torch.equal(model.linear.weight, quantized)
+    assert torch.equal(model.linear.weight_scale, scale)
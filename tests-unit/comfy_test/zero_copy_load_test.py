@@ -0,0 +1,80 @@
+import threading
+import torch
+import safetensors.torch
+
+import comfy.utils
+
+
+class ToyModel(torch.nn.Module):
+    def __init__(self, dtype=None, device=None):
+        super().__init__()
+        self.proj = torch.nn.Linear(8, 16, dtype=dtype, device=device)
+        self.conv = torch.nn.Conv2d(4, 4, 3, padding=1, dtype=dtype, device=device)
+        self.register_buffer("freqs", torch.arange(4, dtype=torch.float32, device=device), persistent=False)
+
+
+def test_meta_parameter_init_keeps_buffers():
+    with comfy.utils.meta_parameter_init():
+        model = ToyModel()
+
+    assert model.proj.weight.is_meta
+    assert model.conv.bias.is_meta
+    assert not model.freqs.is_meta
+    assert torch.equal(model.freqs, torch.arange(4, dtype=torch.float32))
+    assert comfy.utils.has_meta_parameters(model)
+
+
+def test_meta_parameter_init_disabled():
+    with comfy.utils.meta_parameter_init(False):
+        model = ToyModel()
+    assert not comfy.utils.has_meta_parameters(model)
+
+
+def test_meta_parameter_init_is_per_thread_and_nested():
+    models = []
+    with comfy.utils.meta_parameter_init():
+        thread = threading.Thread(target=lambda: models.append(ToyModel()))
+        thread.start()
+        thread.join()
+        with comfy.utils.meta_parameter_init():
+            inner = ToyModel()
+        outer = ToyModel()
+    after = ToyModel()
+
+    assert not comfy.utils.has_meta_parameters(models[0])
+    assert comfy.utils.has_meta_parameters(inner)
+    assert comfy.utils.has_meta_parameters(outer)
+    assert not comfy.utils.has_meta_parameters(after)
+
+
+def test_assign_state_dict_shares_mmap_storage(tmp_path):
+    ref = ToyModel()
+    path = str(tmp_path / "toy.safetensors")
+    safetensors.torch.save_file(ref.state_dict(), path)
+    sd = comfy.utils.load_torch_file(path)
+
+    with comfy.utils.meta_parameter_init():
+        model = ToyModel()
+    ptr = sd["proj.weight"].data_ptr()
+    m, u = comfy.utils.assign_state_dict(model, sd)
+
+    assert len(m) == 0 and len(u) == 0
+    assert not comfy.utils.has_meta_parameters(model)
+    assert model.proj.weight.data_ptr() == ptr
+    x = torch.randn(2, 8)
+    assert torch.allclose(model.proj(x), ref.proj(x))
+
+
+def test_assign_state_dict_converts_dtype_and_fills_missing():
+    ref = ToyModel()
+    sd = {"proj.weight": ref.proj.weight.detach(), "proj.bias": ref.proj.bias.detach()}
+
+    with comfy.utils.meta_parameter_init():
+        model = ToyModel(dtype=torch.float16)
+    m, u = comfy.utils.assign_state_dict(model, sd)
+
+    assert model.proj.weight.dtype == torch.float16
+    assert torch.equal(model.proj.weight, ref.proj.weight.detach().half())
+    assert set(m) == {"conv.weight", "conv.bias"}
+    assert model.conv.weight.device == torch.device("cpu")
+    assert model.conv.weight.dtype == torch.float16
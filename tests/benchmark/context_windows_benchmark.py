@@ -0,0 +1,89 @@
+# CPU benchmark of context window sampling with a toy 3D model, run from the repository root with:
+# python tests/benchmark/context_windows_benchmark.py [--frames N] [--steps N]
+#
+# Compares running every context window in its own model call with stacking the
+# windows into batched calls, the number of model calls per step is printed for both.
+
+import argparse
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=64, help="Number of latent frames.")
+    parser.add_argument("--context-length", type=int, default=16)
+    parser.add_argument("--context-overlap", type=int, default=4)
+    parser.add_argument("--steps", type=int, default=4)
+    bench_args = parser.parse_args()
+
+    sys.argv = [sys.argv[0], "--cpu"]
+    import comfy.options
+    comfy.options.enable_args_parsing()
+    import torch
+    import comfy.conds
+    import comfy.context_windows
+    import comfy.samplers
+
+    class Patcher:
+        def prepare_hook_patches_current_keyframe(self, *args):
+            pass
+
+        def prepare_state(self, *args):
+            pass
+
+        def apply_hooks(self, hooks):
+            return {}
+
+    class ToyVideoModel(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.current_patcher = Patcher()
+            self.conv_in = torch.nn.Conv3d(16, 64, 3, padding=1)
+            self.conv_out = torch.nn.Conv3d(64, 16, 3, padding=1)
+            self.calls = 0
+
+        def memory_required(self, input_shape, cond_shapes={}):
+            return 1024 * 1024
+
+        def apply_model(self, x, t, c_crossattn=None, transformer_options={}, **kwargs):
+            self.calls += 1
+            h = torch.nn.functional.silu(self.conv_in(x)) + c_crossattn.mean(dim=(1, 2)).view(-1, 1, 1, 1, 1)
+            return self.conv_out(h) * t.view(-1, 1, 1, 1, 1)
+
+    torch.manual_seed(0)
+    model = ToyVideoModel()
+    x = torch.randn(1, 16, bench_args.frames, 32, 32)
+    sigmas = torch.linspace(1.0, 0.1, bench_args.steps)
+
+    def cond():
+        return [{"model_conds": {"c_crossattn": comfy.conds.CONDCrossAttn(torch.randn(1, 77, 64))}, "uuid": uuid.uuid4()}]
+    conds = [cond(), cond()]
+
+    results = {}
+    for batch_windows in (False, True):
+        handler = comfy.context_windows.IndexListContextHandler(
+            comfy.context_windows.get_matching_context_schedule(comfy.context_windows.ContextSchedules.STATIC_STANDARD),
+            comfy.context_windows.get_matching_fuse_method(comfy.context_windows.ContextFuseMethods.PYRAMID),
+            context_length=bench_args.context_length, context_overlap=bench_args.context_overlap, dim=2, batch_windows=batch_windows)
+        model_options = {"context_handler": handler, "transformer_options": {"sample_sigmas": sigmas}}
+        model.calls = 0
+        outs = []
+        start = time.perf_counter()
+        with torch.no_grad():
+            for sigma in sigmas:
+                outs.append(comfy.samplers.calc_cond_batch(model, conds, x, sigma.view(1), model_options))
+        elapsed = time.perf_counter() - start
+        results[batch_windows] = outs
+        print("batch_windows={}: {:.1f} model calls per step, {:.1f} ms per step".format(batch_windows, model.calls / len(sigmas), elapsed * 1000 / len(sigmas)))  # noqa: T201
+
+    diff = max((a - b).abs().max().item() for o1, o2 in zip(results[False], results[True]) for a, b in zip(o1, o2))
+    print("max difference: {:.2e}".format(diff))  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# CPU benchmark of the per-prompt overhead of few step sampling (turbo, LCM), run from the repository root with:
+# python tests/benchmark/sampling_overhead_benchmark.py [--runs N] [--steps 1 2 4]
+#
+# Samples a tiny Flux model, small enough that the latency is dominated by the work done
+# around the model calls (sigmas, conds, model patcher, sampler setup). The latency is
+# printed with the memoized sigma schedules and with the schedule cache cleared before
+# every prompt, along with the time spent computing the sigmas alone.
+
+import argparse
+import os
+import sys
+import time
+import statistics
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20, help="Number of prompts per configuration.")
+    parser.add_argument("--steps", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--samplers", type=str, nargs="+", default=["euler", "lcm", "euler_ancestral"])
+    parser.add_argument("--schedulers", type=str, nargs="+", default=["sgm_uniform", "normal", "beta", "simple"])
+    bench_args = parser.parse_args()
+
+    sys.argv = [sys.argv[0], "--cpu"]
+    import comfy.options
+    comfy.options.enable_args_parsing()
+    import logging
+    import torch
+    import comfy.model_patcher
+    import comfy.sample
+    import comfy.samplers
+    import comfy.supported_models
+    logging.getLogger().setLevel(logging.WARNING)
+
+    torch.manual_seed(0)
+    unet_config = {"image_model": "flux", "guidance_embed": True, "in_channels": 16, "out_channels": 16, "vec_in_dim": 32,
+                   "context_in_dim": 32, "hidden_size": 32, "mlp_ratio": 2.0, "num_heads": 2, "depth": 1, "depth_single_blocks": 1,
+                   "axes_dim": [4, 6, 6], "theta": 10000, "patch_size": 2, "qkv_bias": True}
+    model_config = comfy.supported_models.Flux(unet_config)
+    model_config.set_inference_dtype(torch.float32, None)
+    model = comfy.model_patcher.ModelPatcher(model_config.get_model({}), torch.device("cpu"), torch.device("cpu"))
+    model_sampling = model.get_model_object("model_sampling")
+
+    positive = [[torch.randn(1, 8, 32), {"pooled_output": torch.randn(1, 32), "guidance": 3.5}]]
+    negative = [[torch.randn(1, 8, 32), {"pooled_output": torch.randn(1, 32), "guidance": 3.5}]]
+    latent = torch.zeros(1, 16, 16, 16)
+    noise = comfy.sample.prepare_noise(latent, 0)
+
+    def prompt(sampler, scheduler, steps, cold):
+        if cold:
+            comfy.samplers.sigmas_cache.clear()
+        start = time.perf_counter()
+        comfy.sample.sample(model, noise, steps, 1.0, sampler, scheduler, positive, negative, latent, seed=0, disable_pbar=True)
+        return time.perf_counter() - start
+
+    def schedule(scheduler, steps, cold):
+        if cold:
+            comfy.samplers.sigmas_cache.clear()
+        start = time.perf_counter()
+        comfy.samplers.calculate_sigmas(model_sampling, scheduler, steps)
+        return time.perf_counter() - start
+
+    def median_ms(fn, *args):
+        fn(*args)
+        return statistics.median(fn(*args) for _ in range(bench_args.runs)) * 1000
+
+    print("{:<16} {:<12} {:>5} {:>14} {:>14} {:>14} {:>14}".format("sampler", "scheduler", "steps", "prompt ms", "uncached ms", "sigmas ms", "uncached ms"))  # noqa: T201
+    for sampler in bench_args.samplers:
+        for scheduler in bench_args.schedulers:
+            for steps in bench_args.steps:
+                print("{:<16} {:<12} {:>5} {:>14.3f} {:>14.3f} {:>14.4f} {:>14.4f}".format(  # noqa: T201
+                    sampler, scheduler, steps,
+                    median_ms(prompt, sampler, scheduler, steps, False), median_ms(prompt, sampler, scheduler, steps, True),
+                    median_ms(schedule, scheduler, steps, False), median_ms(schedule, scheduler, steps, True)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Micro benchmark of prompt tokenization, run from the repository root with:
+# python tests/benchmark/tokenize_benchmark.py [--repeat N]
+#
+# The first pass over the corpus measures cold tokenization (prompt parsing and the
+# batched tokenizer call), the following passes hit the tokenization memo like
+# re-queued workflows do.
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+PROMPTS = [
+    "a photo of an astronaut riding a horse on mars",
+    "masterpiece, best quality, 1girl, solo, long hair, looking at viewer, smile, (blue eyes:1.2), outdoors, cherry blossoms",
+    "(worst quality, low quality:1.4), (blurry:1.2), lowres, bad anatomy, bad hands, text, error, missing fingers, extra digit, cropped, jpeg artifacts, signature, watermark",
+    "a cozy cabin in the snowy mountains at dusk, warm light spilling from the windows, smoke from the chimney, ((highly detailed)), 8k, cinematic lighting",
+    "portrait of an old fisherman, weathered skin, (deep wrinkles:1.3), grey beard, yellow raincoat, stormy sea in the background, photograph, 85mm, f/1.8",
+    "isometric pixel art of a tiny futuristic city, neon signs, flying cars, night, rain",
+    "an oil painting of a bowl of fruit on a wooden table, still life, chiaroscuro, [modern], (baroque:1.1)",
+    "a cute corgi wearing sunglasses sitting on a beach towel, (golden hour:1.2), shallow depth of field",
+    "ultra realistic photo of a red sports car drifting on a wet race track, motion blur, dramatic sky, (reflections:1.1)",
+    "concept art of a giant ancient tree with a village built into its branches, fantasy, volumetric fog, god rays, matte painting",
+    "studio photo of a ceramic coffee mug, product photography, soft box lighting, white background, minimalist",
+    "anime screenshot, a boy and a girl sitting on a rooftop watching fireworks, summer night, (yukata:1.2), bokeh",
+    "macro photograph of a dew drop on a spider web, morning sun, (extreme detail:1.3), green background",
+    "a medieval knight in ornate silver armor standing in a burning village, epic, dark fantasy, ((dramatic lighting)), artstation",
+    "watercolor illustration of a fox sleeping under a mushroom, storybook style, soft pastel colors",
+    "aerial view of a winding river through autumn forest, drone photography, vibrant orange and red leaves",
+    "cyberpunk street market at night, crowded, steam, holographic advertisements, (rain:1.2), reflections on the wet asphalt, blade runner style",
+    "a bowl of ramen with a soft boiled egg, chashu pork and green onions, food photography, top down view, (steam:0.8)",
+    "black and white street photography of a man with an umbrella crossing the street, 1950s new york, film grain",
+    "low poly 3d render of a lighthouse on a cliff, sunset, (soft shadows:1.1), blender",
+    "a majestic snow leopard on a rocky ledge, himalayas, national geographic, telephoto lens, (sharp focus:1.2)",
+    "interior design of a scandinavian living room, large windows, plants, light wood floor, cozy, architectural digest",
+    "a steampunk airship above the clouds, brass and copper, propellers, intricate details, (victorian:1.1), illustration",
+    "close up portrait of a woman with freckles and red hair, natural light, (skin texture:1.2), kodak portra 400",
+    "surreal painting of melting clocks in a desert landscape, salvador dali style",
+    "a robot gardener watering flowers in a greenhouse, warm sunlight, whimsical, pixar style 3d render",
+    "(nsfw:1.5), (text, logo, watermark:1.3), deformed, disfigured, mutated hands, poorly drawn face, extra limbs",
+    "an underwater coral reef teeming with colorful fish, sun rays through the water surface, (clear water:1.1)",
+    "the northern lights over a frozen lake, long exposure, stars, reflections, norway",
+    "a detailed pencil sketch of an old european cathedral, cross hatching, architectural drawing\nsecond line of the prompt, (paper texture:0.9)",
+]
+
+
+def run(tokenizer, repeat):
+    start = time.perf_counter()
+    for p in PROMPTS:
+        tokenizer.tokenize_with_weights(p)
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for p in PROMPTS:
+            tokenizer.tokenize_with_weights(p)
+    warm = (time.perf_counter() - start) / max(repeat, 1)
+    return cold, warm
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20, help="Number of warm passes over the corpus.")
+    bench_args = parser.parse_args()
+
+    sys.argv = [sys.argv[0], "--cpu"]
+    import comfy.options
+    comfy.options.enable_args_parsing()
+    import comfy.sd1_clip
+    import comfy.sdxl_clip
+    import comfy.text_encoders.sd3_clip
+
+    tokenizers = {
+        "sd1": comfy.sd1_clip.SD1Tokenizer,
+        "sdxl": comfy.sdxl_clip.SDXLTokenizer,
+        "sd3": comfy.text_encoders.sd3_clip.SD3Tokenizer,
+    }
+    print("{} prompts".format(len(PROMPTS)))  # noqa: T201
+    for name, tokenizer_class in tokenizers.items():
+        cold, warm = run(tokenizer_class(), bench_args.repeat)
+        print("{:6} cold: {:8.2f} ms  warm: {:8.2f} ms".format(name, cold * 1000, warm * 1000))  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()